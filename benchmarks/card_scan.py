@@ -0,0 +1,106 @@
+"""
+Description:
+    Benchmark of the per-scan latency of the card recognition: the time from
+    the moment a card is held in front of the camera until the scan returns
+    it. The scan that aruco_scan used to do (read, subscribe, start and close
+    the card stream for every scan and poll for the card every 100 ms) is
+    compared with CardScanner, which keeps the stream open for the session
+    and resolves the scan as soon as the card has been seen in enough frames.
+
+    The robot is a SimulatedRobot: every call and subscription takes a round
+    trip of --latency seconds, and while the stream runs a card in view is
+    reported --frame-rate times per second. The card is shown --show-delay
+    seconds after the scan starts.
+
+    Run from the repository root:
+        python -m benchmarks.card_scan [--scans 20] [--latency 0.03] [--show-delay 0.0]
+"""
+
+import argparse
+import time
+from typing import Callable, Dict
+import numpy as np
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks
+from autobahn.twisted.util import sleep
+from src.pronoun_game.acuro_card_recognition import ARUCO_READING_TIME, CardScanner
+from src.simulation.simulated_robot import SimulatedRobot
+
+
+class PollingScanner:
+    """
+    The scan aruco_scan did before CardScanner.
+    """
+
+    def __init__(self, session: SimulatedRobot):
+        self.session = session
+        self.card_scanned = None
+        self.previous_scanned = None
+
+    def on_card(self, frame: Dict) -> None:
+        self.card_scanned = frame['data']['body'][0][5]
+        if self.card_scanned == self.previous_scanned:
+            self.card_scanned = None
+
+    @inlineCallbacks
+    def scan(self):
+        self.card_scanned = None
+        _ = yield self.session.call("rie.vision.card.read")
+        yield self.session.subscribe(self.on_card, "rie.vision.card.stream")
+        yield self.session.call("rie.vision.card.stream")
+        start_time = time.time()
+        while time.time() - start_time <= ARUCO_READING_TIME:
+            yield sleep(0.1)
+            if time.time() - start_time >= 2:
+                self.previous_scanned = None
+            if self.card_scanned is not None:
+                break
+        yield self.session.call("rie.vision.card.close")
+        self.previous_scanned = self.card_scanned
+        return self.card_scanned
+
+
+@inlineCallbacks
+def benchmark(name: str, make_scanner: Callable, args: argparse.Namespace):
+    """
+    Runs the scans with one scanner and prints the latency statistics.
+    """
+    robot = SimulatedRobot(latency=args.latency, frame_rate=args.frame_rate)
+    scanner = make_scanner(robot)
+    latencies = []
+    for i in range(args.scans):
+        card = 100 + i % 7  # A different card every scan, like the answers of the game
+        reactor.callLater(args.show_delay, robot.show_cards, [card])
+        start_time = time.perf_counter()
+        scanned = yield scanner.scan()
+        latencies.append(time.perf_counter() - start_time - args.show_delay)
+        if scanned != card:
+            print(f"{name}: scanned {scanned} instead of {card}")
+        robot.show_cards([])
+        yield sleep(0.2)  # The child puts the card back
+    yield robot.leave()
+    print(f"{name:<16}{np.mean(latencies) * 1000:>10.0f}{np.percentile(latencies, 95) * 1000:>10.0f}"
+          f"{len(robot.calls) / args.scans:>16.1f}{len(robot.subscriptions['rie.vision.card.stream']):>12}")
+
+
+@inlineCallbacks
+def run(_, args: argparse.Namespace):
+    print(f"{args.scans} scans, {args.latency * 1000:.0f} ms one-way latency, card shown after {args.show_delay} s")
+    print(f"{'scanner':<16}{'mean (ms)':>10}{'p95 (ms)':>10}{'calls per scan':>16}{'handlers':>12}")
+    yield benchmark("polling", PollingScanner, args)
+    yield benchmark("card stream", CardScanner, args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the per-scan latency of the card recognition.")
+    parser.add_argument("--scans", type=int, default=20, help="The number of scans per scanner.")
+    parser.add_argument("--latency", type=float, default=0.03, help="One-way latency to the robot in seconds.")
+    parser.add_argument("--frame-rate", type=float, default=15, help="Detections per second of a card in view.")
+    parser.add_argument("--show-delay", type=float, default=0.0,
+                        help="Seconds after the start of a scan at which the card is shown.")
+    args = parser.parse_args()
+    task.react(run, (args,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Description:
+    Benchmark comparing the per-word POS tagging path with tagging the whole
+    utterance as one Doc and with batching utterances through nlp.pipe. It
+    uses the practice sentences in Sentences.csv and a few long replies like
+    the ones the LLM gives in the control experiment.
+
+    Run from the repository root:
+        python -m benchmarks.pos_tagging
+"""
+
+import time
+from typing import Callable, List, Tuple
+import pandas as pd
+from src.robot_movements.nlp_models import warm_up_nlp_models
+from src.robot_movements.stress_word_analyzer import StressWordAnalyzer, get_pos_tag_stress_words_batch
+
+SENTENCE_FILE = 'Sentences.csv'
+REPEATS = 5
+
+LONG_LLM_REPLIES = [
+    "wat leuk dat je iets over robots wilt weten! robots zijn machines die dingen kunnen doen die mensen ook doen, "
+    "zoals praten, lopen en zelfs dansen. sommige robots werken in fabrieken en bouwen auto's, andere robots helpen "
+    "dokters in het ziekenhuis. ik ben een kleine robot en ik vind het heel leuk om met kinderen te praten. "
+    "weet jij wat voor robot jij zou willen bouwen als je een uitvinder was?",
+    "dat is een heel goed idee! een robot die je kamer opruimt zou super handig zijn. hij zou al je speelgoed in "
+    "de juiste bakken kunnen leggen en je kleren netjes opvouwen. misschien kan hij ook je bed opmaken en de vloer "
+    "stofzuigen. wat zou jij dan doen met al die extra tijd? zou je buiten gaan spelen of een boek lezen?",
+    "wist je dat er robots zijn die op mars rijden? ze heten rovers en ze maken foto's van de rode planeet. "
+    "wetenschappers op aarde sturen ze op afstand en kijken naar stenen en zand om meer te leren over het verleden "
+    "van mars. het duurt een paar minuten voordat een bericht van de aarde bij de rover aankomt. zou jij ooit naar "
+    "de ruimte willen reizen?"
+]
+
+
+def read_practice_sentences(file_location: str) -> List[str]:
+    """
+    Reads every practice sentence (the columns Sentence_1, Sentence_2 and
+    Sentence_3) from the sentence file.
+
+    Args:
+        file_location (str): The path to the sentence file.
+
+    Returns:
+        List[str]: The practice sentences.
+    """
+    sentences = pd.read_csv(file_location)
+    return [sentence for i in (1, 3, 5) for sentence in sentences.iloc[:, i]]
+
+
+def time_per_utterance(tag: Callable[[List[str]], List[List[Tuple[int, str]]]],
+                       texts: List[str]) -> Tuple[float, List[List[Tuple[int, str]]]]:
+    """
+    Runs a tagging function REPEATS times and returns the best time.
+
+    Args:
+        tag (Callable): A function that tags a list of texts.
+        texts (List[str]): The texts to tag.
+
+    Returns:
+        Tuple[float, List[List[Tuple[int, str]]]]: The best time per
+        utterance in milliseconds and the tagging result.
+    """
+    best_time = float("inf")
+    result = []
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        result = tag(texts)
+        best_time = min(best_time, time.perf_counter() - start_time)
+    return best_time / len(texts) * 1000, result
+
+
+def run_benchmark(name: str, texts: List[str]) -> None:
+    """
+    Compares the three tagging approaches on a set of texts and prints the
+    time per utterance and how often they agree with the per-word baseline.
+
+    Args:
+        name (str): The name of the text set.
+        texts (List[str]): The texts to tag.
+    """
+    per_word_time, per_word = time_per_utterance(
+        lambda batch: [StressWordAnalyzer(text).get_pos_tag_stress_words_per_word() for text in batch], texts)
+    per_doc_time, per_doc = time_per_utterance(
+        lambda batch: [StressWordAnalyzer(text).get_pos_tag_stress_words() for text in batch], texts)
+    pipe_time, piped = time_per_utterance(get_pos_tag_stress_words_batch, texts)
+
+    words = sum(len(StressWordAnalyzer(text).words) for text in texts)
+    agreement = sum(a == b for a, b in zip(per_word, per_doc)) / len(texts)
+    print(f"{name}: {len(texts)} utterances, {words} words")
+    print(f"    per word:  {per_word_time:8.2f} ms/utterance")
+    print(f"    per doc:   {per_doc_time:8.2f} ms/utterance")
+    print(f"    nlp.pipe:  {pipe_time:8.2f} ms/utterance")
+    print(f"    same stress words as per word: {agreement:.0%}, pipe equals per doc: {piped == per_doc}")
+
+
+if __name__ == "__main__":
+    warm_up_nlp_models(["nl"])
+    run_benchmark("Sentences.csv", read_practice_sentences(SENTENCE_FILE))
+    run_benchmark("Long LLM replies", LONG_LLM_REPLIES)
@@ -0,0 +1,94 @@
+"""
+Description:
+    Benchmark of the speech-to-text backends: the time it takes to transcribe
+    one second of audio with the OpenAI endpoint and with the local Whisper
+    model, the latter both one utterance at a time and in batches. The model
+    of the local backend is loaded and warmed up before timing, as it would
+    be at the start of a session. With fixtures that have reference
+    transcripts, the word error rate is reported as well.
+
+    The fixtures are the same as those of the transcription upload benchmark:
+    a directory of WAV recordings with .txt reference transcripts. Without
+    --fixtures, the synthetic utterances of the VAD benchmark are used.
+
+    Run from the repository root:
+        python -m benchmarks.stt_backends [--fixtures DIRECTORY] [--backends openai local] [--model-size small]
+"""
+
+import argparse
+import time
+from typing import List, Optional
+import numpy as np
+from src.speech_processing.resampling import Resampler
+from src.speech_processing.speech_to_text import SpeechToText
+from src.speech_processing.stt_backends import LocalWhisperBackend, TranscriptionBackend
+from benchmarks.transcription_upload import load_fixtures, word_error_rate
+from benchmarks.vad import synthetic_fixtures
+
+SAMPLE_RATE = 16000
+PROMPT = "Het volgende gesprek is van een 7 tot 10 jaar oud Nedelands kind die een persoonlijk voornaamwoord zegt"
+
+
+def report(name: str, elapsed: float, audio_seconds: float, transcripts: List[str],
+           references: List[Optional[str]]) -> None:
+    """
+    Prints the latency per audio-second and, if there are references, the
+    mean word error rate of a run.
+    """
+    scored = [word_error_rate(reference, transcript)
+              for transcript, reference in zip(transcripts, references) if reference is not None]
+    wer = f"{np.mean(scored):.2f}" if scored else "-"
+    print(f"{name:<24}{elapsed * 1000:>12.0f}{elapsed * 1000 / audio_seconds:>20.1f}{wer:>8}")
+
+
+def benchmark_sequential(name: str, backend: TranscriptionBackend, utterances: List[np.ndarray],
+                         references: List[Optional[str]]) -> None:
+    """
+    Transcribes the utterances one by one.
+    """
+    start_time = time.perf_counter()
+    transcripts = [backend.transcribe(samples, SAMPLE_RATE, 1, PROMPT) for samples in utterances]
+    report(name, time.perf_counter() - start_time, sum(u.size for u in utterances) / SAMPLE_RATE,
+           transcripts, references)
+
+
+def benchmark_batched(name: str, backend: TranscriptionBackend, utterances: List[np.ndarray],
+                      references: List[Optional[str]]) -> None:
+    """
+    Transcribes all utterances in one batch.
+    """
+    start_time = time.perf_counter()
+    transcripts = backend.transcribe_batch(utterances, SAMPLE_RATE, 1, PROMPT)
+    report(name, time.perf_counter() - start_time, sum(u.size for u in utterances) / SAMPLE_RATE,
+           transcripts, references)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the speech-to-text backends.")
+    parser.add_argument("--fixtures", help="Directory with WAV recordings and .txt reference transcripts.")
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"], choices=["openai", "local"])
+    parser.add_argument("--model-size", default="small", help="The Whisper model of the local backend.")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        fixtures = [(name, samples, sample_rate, None) for name, samples, sample_rate, _ in synthetic_fixtures()]
+    utterances = [Resampler(sample_rate, SAMPLE_RATE).process(samples) for _, samples, sample_rate, _ in fixtures]
+    references = [reference for _, _, _, reference in fixtures]
+
+    print(f"{len(utterances)} fixtures, {sum(u.size for u in utterances) / SAMPLE_RATE:.1f} s of audio")
+    print(f"{'backend':<24}{'total (ms)':>12}{'ms per audio second':>20}{'WER':>8}")
+    if "openai" in args.backends:
+        backend = SpeechToText(sample_rate=SAMPLE_RATE).transcription_backend
+        backend.warm_up()
+        benchmark_sequential("openai", backend, utterances, references)
+    if "local" in args.backends:
+        backend = LocalWhisperBackend(model_size=args.model_size)
+        backend.warm_up()
+        benchmark_sequential(f"local {args.model_size}", backend, utterances, references)
+        benchmark_batched(f"local {args.model_size} batched", backend, utterances, references)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Description:
+    Benchmark of the audio that is uploaded for transcription. For every
+    fixture it compares the 44.1 kHz WAV upload that SpeechToText used to send
+    with 16 kHz WAV, FLAC and Opus: the number of uploaded bytes, the time
+    spent resampling and encoding, and, with --transcribe, the end-to-end
+    transcription latency and the word error rate against the reference
+    transcript.
+
+    The fixtures are a directory of mono 16-bit WAV recordings of children's
+    utterances, each with a .txt file of the same name holding the reference
+    transcript. Without --fixtures, the synthetic utterances of the VAD
+    benchmark are used, which only makes sense for the bytes and encoding
+    time (they contain no words).
+
+    Run from the repository root:
+        python -m benchmarks.transcription_upload [--fixtures DIRECTORY] [--transcribe]
+"""
+
+import argparse
+import glob
+import os
+import time
+import wave
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.speech_processing.resampling import Resampler
+from src.speech_processing.speech_to_text import SpeechToText
+from benchmarks.vad import synthetic_fixtures
+
+# Sample rate and upload format of every configuration
+CONFIGURATIONS: Dict[str, Tuple[int, str]] = {
+    "44.1 kHz wav": (44100, "wav"),
+    "16 kHz wav": (16000, "wav"),
+    "16 kHz flac": (16000, "flac"),
+    "16 kHz opus": (16000, "opus")
+}
+
+Fixture = Tuple[str, np.ndarray, int, Optional[str]]
+
+
+def load_fixtures(directory: str) -> List[Fixture]:
+    """
+    Loads the recorded fixtures from a directory.
+
+    Args:
+        directory (str): The directory with WAV files and their transcripts.
+
+    Returns:
+        List[Fixture]: The name, int16 samples, sample rate and reference
+        transcript of every fixture.
+    """
+    fixtures = []
+    for wav_path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        with wave.open(wav_path, "rb") as wf:
+            samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+            sample_rate = wf.getframerate()
+        transcript_path = os.path.splitext(wav_path)[0] + ".txt"
+        reference = None
+        if os.path.exists(transcript_path):
+            with open(transcript_path, encoding="utf-8") as file:
+                reference = file.read().strip()
+        fixtures.append((os.path.basename(wav_path), samples, sample_rate, reference))
+    return fixtures
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    Computes the word error rate: the word-level edit distance between the
+    transcripts divided by the number of reference words.
+
+    Args:
+        reference (str): The reference transcript.
+        hypothesis (str): The transcript to score.
+
+    Returns:
+        float: The word error rate.
+    """
+    normalize = lambda text: "".join(c for c in text.lower() if c.isalnum() or c.isspace()).split()
+    reference_words, hypothesis_words = normalize(reference), normalize(hypothesis)
+    distances = list(range(len(hypothesis_words) + 1))
+    for i, reference_word in enumerate(reference_words, start=1):
+        previous_diagonal, distances[0] = distances[0], i
+        for j, hypothesis_word in enumerate(hypothesis_words, start=1):
+            substitution = previous_diagonal + (reference_word != hypothesis_word)
+            previous_diagonal = distances[j]
+            distances[j] = min(distances[j] + 1, distances[j - 1] + 1, substitution)
+    return distances[-1] / max(1, len(reference_words))
+
+
+def benchmark_fixture(samples: np.ndarray, sample_rate: int, reference: Optional[str],
+                      transcribe: bool) -> Dict[str, Dict[str, float]]:
+    """
+    Prepares the upload of a fixture in every configuration and, if asked,
+    transcribes it.
+
+    Args:
+        samples (np.ndarray): The int16 samples of the fixture.
+        sample_rate (int): The sample rate of the fixture.
+        reference (Optional[str]): The reference transcript, if any.
+        transcribe (bool): Whether to send the audio for transcription.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The upload bytes, preparation time in
+        ms and, when transcribed, the latency in ms and word error rate per
+        configuration.
+    """
+    results = {}
+    for name, (target_rate, upload_format) in CONFIGURATIONS.items():
+        speech_to_text = SpeechToText(sample_rate=target_rate, upload_format=upload_format)
+
+        start_time = time.perf_counter()
+        resampled = Resampler(sample_rate, target_rate).process(samples)
+        upload = speech_to_text.encode_audio(resampled)
+        result = {"bytes": upload.getbuffer().nbytes, "prepare_ms": (time.perf_counter() - start_time) * 1000}
+
+        if transcribe:
+            start_time = time.perf_counter()
+            transcript = speech_to_text.process_audio(resampled, "control")
+            result["latency_ms"] = (time.perf_counter() - start_time) * 1000
+            if reference is not None:
+                result["wer"] = word_error_rate(reference, transcript or "")
+        results[name] = result
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the transcription upload.")
+    parser.add_argument("--fixtures", help="Directory with WAV recordings and .txt reference transcripts.")
+    parser.add_argument("--transcribe", action="store_true",
+                        help="Also transcribe every fixture with gpt-4o-transcribe (needs OPENAI_API_KEY).")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        fixtures = [(name, samples, sample_rate, None) for name, samples, sample_rate, _ in synthetic_fixtures()]
+
+    totals: Dict[str, Dict[str, List[float]]] = {name: {} for name in CONFIGURATIONS}
+    for fixture_name, samples, sample_rate, reference in fixtures:
+        for name, result in benchmark_fixture(samples, sample_rate, reference, args.transcribe).items():
+            for metric, value in result.items():
+                totals[name].setdefault(metric, []).append(value)
+
+    print(f"{len(fixtures)} fixtures")
+    print(f"{'configuration':<16}{'mean bytes':>12}{'prepare (ms)':>14}{'latency (ms)':>14}{'WER':>8}")
+    for name, metrics in totals.items():
+        mean = {metric: float(np.mean(values)) for metric, values in metrics.items()}
+        latency = f"{mean['latency_ms']:.0f}" if "latency_ms" in mean else "-"
+        wer = f"{mean['wer']:.2f}" if "wer" in mean else "-"
+        print(f"{name:<16}{mean['bytes']:>12.0f}{mean['prepare_ms']:>14.1f}{latency:>14}{wer:>8}")
+
+
+if __name__ == "__main__":
+    main()
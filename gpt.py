@@ -1,10 +1,6 @@
-from openai import OpenAI
-import os
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set. Please set it in your environment variables.")
+from src.openai_client import get_openai_client
 
-client = OpenAI(api_key=API_KEY)
+client = get_openai_client("responses")
 
 response = client.responses.create(
     model="gpt-4o-mini",
@@ -1,3 +1,4 @@
+from functools import partial
 from autobahn.twisted.component import Component, run
 from src.speech_processing.speech_to_text import SpeechToText
 from twisted.internet.defer import inlineCallbacks
@@ -7,7 +8,10 @@ from src.pronoun_game.pronoun_game import PronounGame
 from src.robot_movements.gesture_library import arms_up
 from alpha_mini_rug import perform_movement
 from src.control.control import ControlExperiment
-SENTENCE_FILE = 'sentences.csv'
+from src.pronoun_game.acuro_card_recognition import stop_card_scanner
+from src.robot_movements.nlp_models import warm_up_nlp_models
+from src.robot_movements.gesture_cache import get_gesture_cache
+SENTENCE_FILE = 'Sentences.csv'
 VERSION = 'control'
 PARTICIPANT = 1
 def read_sentences(file_location):
@@ -15,7 +19,8 @@ def read_sentences(file_location):
     return sentences
 
 @inlineCallbacks
-def main(session, details): #session, details as args
+def main(session, details, version=VERSION, skip_intro=False, speech_recognition_session=None): #session, details as args
+    # The speech recognition session can be passed in, e.g. one with a simulated microphone; otherwise the game makes one
     yield session.call("rom.optional.behavior.play", name="BlocklyStand")
     yield session.call("rom.actuator.motor.write",
                      frames=[{"time": 400, "data": {"body.head.pitch": 0.1}},
@@ -26,13 +31,6 @@ def main(session, details): #session, details as args
     yield session.call("rom.actuator.motor.write",
                      frames=[{"time": 800,"data": {"body.arms.right.upper.pitch": -1.5, "body.arms.left.upper.pitch": -1.5}}],
                      force=True)
-    print("Want to skip intro?: y/n")
-    input_intro = input()
-    if input_intro == 'n':
-        skip_intro = False
-    else:
-        skip_intro = True
-
     #yield perform_movement(session, frames=arms_up)
     #yield session.call("rom.optional.behavior.play", name="BlocklyRobotDance")
     yield session.call("rie.dialogue.config.language", lang="nl")
@@ -41,24 +39,26 @@ def main(session, details): #session, details as args
     sentences = read_sentences(SENTENCE_FILE)
 
     # #Practice stuff
-    if VERSION == "experiment":
+    if version == "experiment":
         if not skip_intro: yield session.call("rie.dialogue.say", "Hallo! Wat leuk dat je meedoet aan dit experiment. "
                                                                   "We gaan zometeen"
                                                "een aantal oefeningen doen. Laten we eerst proberen of alles werkt. "
                                                "Als het niet lukt zal de onderzoeker je helpen.")
-        game = PronounGame(session, VERSION, sentences, skip_intro)
+        game = PronounGame(session, version, sentences, skip_intro, speech_recognition_session)
         pronoun_performance, mistakes = yield game.pronoun_practice()
         print(pronoun_performance)
         print(mistakes)
     # #Pronoun Game
 
-    if VERSION == "control":
-        control = ControlExperiment(session, VERSION, skip_intro)
+    if version == "control":
+        control = ControlExperiment(session, version, skip_intro,
+                                    speech_recognition_session=speech_recognition_session)
         conversation = yield control.control_experiment()
         dataframe = pd.DataFrame(conversation, columns=['Child', 'Robot'])
         dataframe.to_csv("Participant " + str(PARTICIPANT) + ".csv", index=False)
     yield print("Practice done")
     #yield session.call("rom.optional.behavior.play", name="BlocklyCrouch")
+    yield stop_card_scanner(session)
     yield session.leave()
 # Create wamp connection
 wamp = Component(
@@ -69,8 +69,10 @@ wamp = Component(
     realm="rie.6932b673a7cba444073b7174",
 )
 
-wamp.on_join(main)
-
 if __name__ == "__main__":
     #main()
+    print("Want to skip intro?: y/n")
+    wamp.on_join(partial(main, version=VERSION, skip_intro=input() != 'n'))
+    warm_up_nlp_models(["nl"])  # Load spaCy once before the session starts, so the first utterance is not delayed
+    get_gesture_cache()  # Loads the gesture plans written by src/robot_movements/precompile_gestures.py
     run([wamp])
\ No newline at end of file
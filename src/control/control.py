@@ -3,7 +3,7 @@ from typing import Generator, Optional, Dict
 from twisted.internet.defer import inlineCallbacks, returnValue
 from autobahn.twisted.util import sleep
 # from src.robot_movements.say_animated import say_animated
-from src.utils import generate_message_using_llm, generate_conversation_using_llm
+from src.utils import generate_conversation_using_llm_deferred, stream_conversation_using_llm, create_conversation_deferred
 from alpha_mini_rug import perform_movement
 from src.speech_processing.speech_session import SpeechRecognitionSession
 from src.pronoun_game.llm_interface import LLMGameHelper
@@ -11,27 +11,41 @@ from src.pronoun_game.acuro_card_recognition import aruco_scan,aruco_scan_specif
 from src.robot_responses.responses import say_practice_sentence, respond_to_correct_answer,\
     respond_to_wrong_answer, respond_to_wrong_answer_and_give_correct, say_normally
 from src.robot_movements.gesture_library import arms_up, arms_down
-from src.robot_movements.say_animated import say_animated
-import openai
-import os
+from src.robot_movements.say_animated import say_animated, say_animated_stream
 import random
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set. Please set it in your environment variables.")
-
-client = openai.Client(api_key=API_KEY)
-
 
 class ControlExperiment:
-    def __init__(self, session, version, skip_intro):
+    def __init__(self, session, version, skip_intro, streaming=True, speech_recognition_session=None):
         self.session = session
         self.version = version
         self.game_helper = LLMGameHelper()
-        self.speech_recognition_session = SpeechRecognitionSession(self.session, self.version)
-        self.conversation = openai.conversations.create()
+        if speech_recognition_session is None:
+            speech_recognition_session = SpeechRecognitionSession(self.session, self.version)
+        self.speech_recognition_session = speech_recognition_session
+        self.conversation = None  # Created at the start of control_experiment, off the reactor thread
         self.skip_intro = skip_intro
+        self.streaming = streaming  # Speak the reply of the LLM sentence by sentence while it is generated
+
+    @inlineCallbacks
+    def respond(self, prompt: str):
+        """
+        Lets the LLM reply to a prompt in the conversation and says the reply.
+        In streaming mode the robot starts with the first sentence while the
+        rest of the reply is still being generated.
+
+        Args:
+            prompt (str): The prompt for the LLM.
 
+        Returns:
+            str: The reply of the robot.
+        """
+        if self.streaming:
+            reply = yield say_animated_stream(self.session, stream_conversation_using_llm(prompt, self.conversation.id))
+        else:
+            reply = yield generate_conversation_using_llm_deferred(prompt, self.conversation.id)
+            yield say_animated(self.session, reply, use_cache=False)
+        return reply
 
     @inlineCallbacks
     def control_experiment(self):
@@ -41,14 +55,14 @@ class ControlExperiment:
             "Het kind heeft niet gereageerd op de vraag. Zeg dat je het niet goed hebt gehoord. Herhaal daarna de vraag "
             "of stel een nieuwe vraag."
         ]
+        conversation_created = create_conversation_deferred()
         yield say_animated(self.session, "Hallo, ik ben de Alpha Mini robot. We gaan nu een gesprek houden. Als ik"
                                          " klaar ben met praten moet je even wachten en dan kan je reageren.")
-        starting_prompt = yield generate_conversation_using_llm(f"Zeg het volgende om het gesprek te beginnen: "
-                                                          f"Ik ben een robot. Wat weet jij over robots?",
-                                                          self.conversation.id)
+        self.conversation = yield conversation_created
+        starting_prompt = yield self.respond(f"Zeg het volgende om het gesprek te beginnen: "
+                                             f"Ik ben een robot. Wat weet jij over robots?")
         #yield say_animated(self.session, "Hallo. Ik ben de Alpha mini Robot")
         conversation.append(['', starting_prompt]) #[child_contribution, robot_contribution]
-        yield say_animated(self.session, starting_prompt)
         time_limit_responses = 1
         start_time = time.time()
         while time.time() - start_time <= time_limit_seconds:
@@ -61,16 +75,14 @@ class ControlExperiment:
                     print(2)
                     yield say_animated(self.session, "Bedankt voor jouw antwoord")
                     print(3)
-                    prompt = yield generate_conversation_using_llm(user_input,self.conversation.id)
+                    prompt = yield self.respond(user_input)
                     conversation.append([user_input, prompt])
-                    yield say_animated(self.session, prompt)
                     wait_for_response_time = time.time()
             if time.time() - start_time <= time_limit_seconds:
                 print("too long response")
                 conversation_continuation = random.choice(prompts)
-                new_message = yield generate_conversation_using_llm(conversation_continuation, self.conversation.id)
+                new_message = yield self.respond(conversation_continuation)
                 conversation.append(['', new_message])
                 print(conversation)
-                yield say_animated(self.session, new_message)
                 print("Blub")
         return conversation
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Description:
+    This module defines the ModerationClient class, which checks texts for
+    profanity. The local blocklist filter is the fast path. Sightengine is
+    asked for a second opinion in the background over a pooled keep-alive
+    HTTP session, so only the first request pays the TCP and TLS handshake.
+    The latency of every remote request is recorded in a histogram.
+"""
+
+import bisect
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from src.moderation.profanity_filter import ProfanityFilter, get_profanity_filter
+
+SIGHTENGINE_URL = 'https://api.sightengine.com/1.0/text/check.json'
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    This class counts request latencies in fixed buckets. It is safe to use
+    from several threads.
+    """
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)  # The last bucket counts everything above the highest bound
+        self.total_ms = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms: float) -> None:
+        """
+        Adds a latency to the histogram.
+
+        Args:
+            latency_ms (float): The latency in milliseconds.
+        """
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+            self.total_ms += latency_ms
+
+    def summary(self) -> Dict[str, float | Dict[str, int]]:
+        """
+        Returns the number of requests, the mean latency and the count per
+        bucket.
+
+        Returns:
+            Dict[str, float | Dict[str, int]]: The summary of the histogram.
+        """
+        with self.lock:
+            count = sum(self.counts)
+            labels = [f"<={bound}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+            return {"count": count,
+                    "mean_ms": self.total_ms / count if count else 0.0,
+                    "buckets": dict(zip(labels, self.counts))}
+
+
+class ModerationClient:
+    """
+    This class checks texts for profanity with the local filter and, if
+    enabled, asks Sightengine for a second opinion over a pooled session.
+    """
+
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 pool_size: int = 4,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 5.0,
+                 remote_second_opinion: bool = True,
+                 profanity_filter: Optional[ProfanityFilter] = None):
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        self.timeout = (connect_timeout, read_timeout)
+        self.remote_second_opinion = remote_second_opinion
+        self.profanity_filter = profanity_filter if profanity_filter is not None else get_profanity_filter()
+        self.latency = LatencyHistogram()
+        self.failed_requests = 0
+        self.failed_requests_lock = threading.Lock()  # Pool threads fail at the same time when the network is down
+
+        self.http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http_session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="moderation")
+
+    def check(self, text: str) -> Dict:
+        """
+        Checks the given text for profanity with the local blocklist filter.
+        This takes microseconds and does not depend on the network. If the
+        text is clean and the second opinion is enabled, the text is also
+        sent to Sightengine in the background.
+
+        Args:
+            text (str): The text to check for profanity.
+
+        Returns:
+            Dict: The result in the same shape as the Sightengine response,
+            containing information on detected profanity.
+        """
+        profanity = self.profanity_filter.check(text)
+        if self.remote_second_opinion and not profanity["profanity"]["matches"]:
+            self.request_second_opinion(text)
+        return profanity
+
+    def request_second_opinion(self, text: str) -> Future:
+        """
+        Asks Sightengine for a second opinion on a text without waiting for
+        the answer. Words that Sightengine flags are added to the local
+        blocklist, so the local filter catches them from then on.
+
+        Args:
+            text (str): The text that the local filter considered clean.
+
+        Returns:
+            Future: The pending remote check.
+        """
+        def add_remote_matches(future: Future) -> None:
+            matches = future.result().get("profanity", {}).get("matches", [])
+            if matches:
+                words = [match["match"] for match in matches]
+                print(f"Sightengine found profanity the local filter missed: {', '.join(words)}")
+                self.profanity_filter.add_words(words)
+
+        future = self.executor.submit(self.check_remote, text)
+        future.add_done_callback(add_remote_matches)
+        return future
+
+    def check_remote(self, text: str) -> Dict:
+        """
+        Checks the given text for profanity using the Sightengine API.
+        This approach is based on the Sightengine Profanity Detection API, which
+        can identify offensive language, including hate speech, offensive words,
+        and inappropriate content.
+
+        For more details on the API and its rules, visit:
+        https://sightengine.com/docs/profanity-detection-hate-offensive-text-moderation
+
+        Args:
+            text (str): The text to check for profanity.
+
+        Returns:
+            Dict: The API response in JSON format, containing information on
+            detected profanity, or an empty dict if the request failed.
+        """
+        data = {'text': text, 'mode': 'rules', 'lang': 'nl'}
+        headers = {'Authorization': self.api_key}
+        start_time = time.perf_counter()
+
+        try:
+            r = self.http_session.post(SIGHTENGINE_URL, data=data, headers=headers, timeout=self.timeout)
+            return r.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Request failed: {e}")
+            with self.failed_requests_lock:
+                self.failed_requests += 1
+            return {}
+        finally:
+            self.latency.record((time.perf_counter() - start_time) * 1000)
+
+    def close(self) -> None:
+        """
+        Waits for pending second opinions and closes the pooled connections.
+        """
+        self.executor.shutdown(wait=True)
+        self.http_session.close()
+
+
+_moderation_client = None
+
+
+def get_moderation_client() -> ModerationClient:
+    """
+    Returns the moderation client shared by all LLM helpers, creating it the
+    first time it is needed.
+
+    Returns:
+        ModerationClient: The shared moderation client.
+    """
+    global _moderation_client
+    if _moderation_client is None:
+        _moderation_client = ModerationClient()
+    return _moderation_client
+
+
+def set_moderation_client(moderation_client: ModerationClient) -> None:
+    """
+    Replaces the moderation client shared by all LLM helpers, e.g. with one
+    without the Sightengine second opinion when running without network.
+
+    Args:
+        moderation_client (ModerationClient): The client to share.
+    """
+    global _moderation_client
+    _moderation_client = moderation_client
@@ -0,0 +1,206 @@
+"""
+Description:
+    This module provides a local profanity filter for the texts generated by
+    the LLM. All words of a Dutch and English blocklist are matched in one
+    pass over the text with an Aho-Corasick automaton. Before matching, the
+    text is normalized: diacritics are removed, leetspeak characters are
+    replaced by the letters they stand for and repeated letters are
+    collapsed, so "fùüück" and "5h1t" are caught as well. A letter that is
+    doubled in a blocked word must be repeated in the text too, so the
+    collapsed English "piss" does not match the Dutch "pis". The result has the
+    same shape as the response of the Sightengine API, so it can be used in
+    place of the remote check.
+"""
+
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+# A trailing * means the word is also blocked as the start of a longer word (Dutch compounds, e.g. "kutzooi").
+# Words that are also ordinary Dutch words ("kanker" is cancer, "eikel" acorn, "mongool" Mongolian, "pik" peck)
+# are left out, or only blocked in their abusive compounds.
+DEFAULT_BLOCKLIST: Tuple[str, ...] = (
+    # Dutch
+    "kankerlijer", "kankerhoer", "kankerzooi", "kankerjoch", "kankerwijf", "kut*", "klote*", "kolere*", "tering*",
+    "tyfus*", "godverdomme", "verdomme", "klootzak", "lul", "hoer", "hoeren*", "slet", "trut", "teef", "neuken",
+    "neuk", "debiel", "flikker", "stront", "wijf", "sukkel", "kakker", "pleuris*", "rotzak", "smeerlap",
+    # English
+    "fuck*", "shit*", "bitch*", "bastard", "asshole", "dick", "cunt", "whore", "slut", "damn", "crap", "piss",
+    "wanker", "twat", "motherfucker", "bullshit", "retard", "dumbass"
+)
+
+LEETSPEAK: Dict[str, str] = {
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "@": "a", "$": "s", "€": "e"
+}
+
+
+def normalize(text: str) -> Tuple[str, List[int], List[int]]:
+    """
+    Normalizes a text for matching and keeps track of where every normalized
+    character came from in the original text.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        Tuple[str, List[int], List[int]]: The normalized text and, for every
+        character of it, the index of the corresponding character in the
+        original text and how many times it was repeated there.
+    """
+    normalized = []
+    positions = []
+    runs = []
+
+    for index, char in enumerate(text):
+        for base_char in unicodedata.normalize("NFKD", char.lower()):
+            if unicodedata.combining(base_char):
+                continue
+            base_char = LEETSPEAK.get(base_char, base_char)
+            if normalized and normalized[-1] == base_char and base_char.isalpha():
+                runs[-1] += 1
+                continue  # "fuuuck" -> "fuck", the blocklist is collapsed the same way
+            normalized.append(base_char)
+            positions.append(index)
+            runs.append(1)
+
+    return "".join(normalized), positions, runs
+
+
+class ProfanityFilter:
+    """
+    This class matches a blocklist against a text with an Aho-Corasick
+    automaton, so the cost of a check does not grow with the number of
+    blocked words.
+    """
+
+    def __init__(self, words: Iterable[str] = DEFAULT_BLOCKLIST):
+        self.words = set()
+        self.lock = threading.Lock()
+        self.automaton = ([{}], [0], [[]])  # (goto transitions, failure links, outputs) per state
+        self.add_words(words)
+
+    def add_words(self, words: Iterable[str]) -> None:
+        """
+        Adds words to the blocklist and rebuilds the automaton.
+
+        Args:
+            words (Iterable[str]): The words to block. A trailing * also
+                blocks longer words starting with the word.
+        """
+        with self.lock:
+            self.words.update(word.strip().lower() for word in words if word.strip())
+            self.automaton = self.build_automaton(self.words)
+
+    @staticmethod
+    def build_automaton(words: Iterable[str]) -> Tuple[List[Dict[str, int]], List[int],
+                                                       List[List[Tuple[int, bool, Tuple[int, ...]]]]]:
+        """
+        Builds the Aho-Corasick automaton of the given words.
+
+        Args:
+            words (Iterable[str]): The blocked words.
+
+        Returns:
+            Tuple: The goto transitions, failure links and outputs of every
+            state. An output is the length of the matched (normalized) word,
+            whether it may be the start of a longer word and how many times
+            each of its letters is repeated in the word.
+        """
+        goto = [{}]
+        outputs = [[]]
+
+        for word in words:
+            is_prefix = word.endswith("*")
+            pattern, _, pattern_runs = normalize(word.rstrip("*"))
+            state = 0
+            for char in pattern:
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state].append((len(pattern), is_prefix, tuple(pattern_runs)))
+
+        failure = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = failure[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = failure[fallback]
+                failure[next_state] = goto[fallback].get(char, 0)
+                outputs[next_state] = outputs[next_state] + outputs[failure[next_state]]
+
+        return goto, failure, outputs
+
+    def find_matches(self, text: str) -> List[Dict]:
+        """
+        Finds all blocked words in a text. A match only counts when it starts
+        at the beginning of a word and ends at the end of a word, unless the
+        blocked word may be the start of a longer word, and only when every
+        letter is repeated at least as often as in the blocked word.
+
+        Args:
+            text (str): The text to check.
+
+        Returns:
+            List[Dict]: The matches, each with the type, intensity, matched
+            text and its start and end index in the original text.
+        """
+        goto, failure, outputs = self.automaton
+        normalized, positions, runs = normalize(text)
+        matches = []
+        state = 0
+
+        for end, char in enumerate(normalized):
+            while state and char not in goto[state]:
+                state = failure[state]
+            state = goto[state].get(char, 0)
+
+            for length, is_prefix, pattern_runs in outputs[state]:
+                start = end - length + 1
+                starts_word = start == 0 or not normalized[start - 1].isalnum()
+                ends_word = end + 1 == len(normalized) or not normalized[end + 1].isalnum()
+                repeated_enough = all(run >= pattern_run for run, pattern_run in zip(runs[start:end + 1], pattern_runs))
+                if starts_word and (ends_word or is_prefix) and repeated_enough:
+                    original_start = positions[start]
+                    # Up to the next normalized character, so a collapsed run of letters is matched as a whole
+                    original_end = positions[end + 1] if end + 1 < len(positions) else len(text)
+                    matches.append({"type": "inappropriate", "intensity": "high",
+                                    "match": text[original_start:original_end],
+                                    "start": original_start, "end": original_end})
+
+        return matches
+
+    def check(self, text: str) -> Dict:
+        """
+        Checks a text for profanity.
+
+        Args:
+            text (str): The text to check.
+
+        Returns:
+            Dict: The result in the shape of the Sightengine API response,
+            {"profanity": {"matches": [...]}}.
+        """
+        return {"profanity": {"matches": self.find_matches(text)}}
+
+
+_profanity_filter = None
+
+
+def get_profanity_filter() -> ProfanityFilter:
+    """
+    Returns the profanity filter shared by the whole process, building it the
+    first time it is needed.
+
+    Returns:
+        ProfanityFilter: The shared profanity filter.
+    """
+    global _profanity_filter
+    if _profanity_filter is None:
+        _profanity_filter = ProfanityFilter()
+    return _profanity_filter
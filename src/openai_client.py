@@ -0,0 +1,97 @@
+"""
+Description:
+    This module provides the OpenAI client shared by the whole process. The
+    client is created the first time it is needed, so importing a module does
+    no network-related work. All uses (chat completions, responses and audio
+    transcription) share one HTTP connection pool with keep-alive, and HTTP/2
+    when the h2 package is installed. Every use gets its own timeout.
+"""
+
+import importlib.util
+import os
+import threading
+from typing import Dict
+import httpx
+import openai
+
+OPENAI_TIMEOUTS: Dict[str, float] = {  # Seconds per request
+    "chat": 20.0,
+    "responses": 30.0,
+    "audio": 30.0
+}
+CONNECT_TIMEOUT = 5.0
+MAX_CONNECTIONS = 10  # The maximum number of concurrent requests to OpenAI
+MAX_KEEPALIVE_CONNECTIONS = 5
+KEEPALIVE_EXPIRY = 60.0  # Seconds an idle connection is kept open
+
+_clients: Dict[str, openai.OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_api_key() -> str:
+    """
+    Returns the OpenAI API key from the environment variables.
+
+    Raises:
+        ValueError: If OPENAI_API_KEY is not set.
+
+    Returns:
+        str: The API key.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY is not set. Please set it in your environment variables.")
+    return api_key
+
+
+def create_http_client() -> httpx.Client:
+    """
+    Creates the HTTP client that holds the connection pool of all OpenAI
+    requests.
+
+    Returns:
+        httpx.Client: The pooled HTTP client.
+    """
+    use_http2 = importlib.util.find_spec("h2") is not None  # HTTP/2 is optional in httpx
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS,
+                          max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                          keepalive_expiry=KEEPALIVE_EXPIRY)
+    return openai.DefaultHttpxClient(http2=use_http2, limits=limits)
+
+
+def get_openai_client(purpose: str = "chat") -> openai.OpenAI:
+    """
+    Returns the shared OpenAI client, configured with the timeout of the
+    given purpose. The clients of all purposes share one connection pool.
+
+    Args:
+        purpose (str): What the client is used for: "chat", "responses" or
+            "audio".
+
+    Returns:
+        openai.OpenAI: The OpenAI client.
+    """
+    with _clients_lock:
+        if "base" not in _clients:
+            _clients["base"] = openai.OpenAI(api_key=get_api_key(), http_client=create_http_client())
+        if purpose not in _clients:
+            timeout = httpx.Timeout(OPENAI_TIMEOUTS[purpose], connect=CONNECT_TIMEOUT)
+            _clients[purpose] = _clients["base"].with_options(timeout=timeout)
+        return _clients[purpose]
+
+
+def set_openai_client(client) -> None:
+    """
+    Replaces the shared client of every purpose, e.g. with the scripted LLM
+    of the simulation, so a session can run without OpenAI.
+
+    Args:
+        client: An object with the parts of the openai.OpenAI interface that
+            are used: chat.completions, responses, conversations and
+            audio.transcriptions.
+    """
+    with _clients_lock:
+        _clients.clear()
+        _clients["base"] = client
+        for purpose in OPENAI_TIMEOUTS:
+            _clients[purpose] = client
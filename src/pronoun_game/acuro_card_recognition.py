@@ -1,71 +1,221 @@
-import time
-from autobahn.twisted.component import Component, run
-from twisted.internet.defer import inlineCallbacks
-from autobahn.twisted.util import sleep
+import weakref
+from collections import deque
+from typing import Container, Deque, Dict, List, Optional, Tuple
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks, succeed
 from src.robot_responses.responses import say_normally
-from src.pronoun_game.llm_interface import LLMGameHelper
-from alpha_mini_rug import show_camera_stream
+from src.speech_processing.pronoun_recognizer import PRONOUNS
 ARUCO_READING_TIME = 15 #amount of seconds to scan card
+SAME_CARD_DELAY = 2 #seconds before the previously scanned card is accepted again
+CARD_MIN_FRAMES = 2 #frames a card must be seen in before it counts as scanned
+CARD_HISTORY_SECONDS = 1.0 #seconds of detections the frames are counted in
 MAX_FAILED_ATTEMPS = 2
-card_scanned = None
-previous_scanned = None
-def on_card(frame):
-# This function is called every time the robot sees a card
-    global card_scanned
-    global previous_scanned
-    card_scanned = frame['data']['body'][0][5]
-    print(str(card_scanned))
-    if card_scanned == previous_scanned:
-        card_scanned = None
-        print("Mistake prevented")
-    else:
-        print("Kaart gescand: ", frame['data']['body'][0][5])
+PICTURE_CARDS = range(0, 100)
+PRONOUN_CARDS = range(100, 100 + len(PRONOUNS)) #one card per pronoun, in the order of PRONOUNS
 
 
-@inlineCallbacks
-def aruco_scan(session):
-    global card_scanned
-    global previous_scanned
-    card_scanned = None
-    #yield sleep(0.5)
-    # Wait until we see a card
-    print("Scanning for cards")
-    aruco_found = False
-    _ = yield session.call("rie.vision.card.read")
-    yield session.subscribe(on_card, "rie.vision.card.stream")
-    yield session.call("rie.vision.card.stream")
-    start_time = time.time()
-    while time.time() - start_time <= ARUCO_READING_TIME:
-        yield sleep(0.1)
-        if time.time() - start_time >= 2: #Make it possible to pick same card twice
-            previous_scanned = None
-        if card_scanned is not None:
-            print("scanned")
-            break
-    print("done")
-    #yield sleep(0.5)
-    yield session.call("rie.vision.card.close")
-    previous_scanned = card_scanned
-    return card_scanned
-    # Here we subscribe to the card data and start a stream
+class CardScanner:
+    """
+    This class scans cards with the card stream of the robot, for one WAMP
+    session. The stream is subscribed to and started once, at the first scan,
+    and kept open for the session. The markers of every frame of the last
+    second are kept, and every waiting scan votes over the frames seen since
+    it started: a card is reported once it has been seen in enough frames
+    and in more frames than any other card the scan expects. Cards lying on
+    the table or a single misread frame are then not taken for an answer.
+    """
+
+    def __init__(self, session, clock=reactor, min_frames: int = CARD_MIN_FRAMES,
+                 history_seconds: float = CARD_HISTORY_SECONDS):
+        self.session = session
+        self.clock = clock
+        self.min_frames = min_frames
+        self.history_seconds = history_seconds
+        self.history: Deque[Tuple[float, Tuple[int, ...]]] = deque()  # The time and cards of every frame
+        self.waiters: List[Tuple[Deferred, float, Optional[Container[int]]]] = []  # Scan, start and expected cards
+        self.previous_scanned = None
+        self.subscription = None
+        self.started: Optional[Deferred] = None
+
+    def start(self) -> Deferred:
+        """
+        Subscribes to the card stream and starts it, if that has not been done
+        yet.
+
+        Returns:
+            Deferred: Fires when the stream is running.
+        """
+        if self.started is None:
+            self.started = self.open_stream()
+            self.started.addErrback(self.on_start_failed)
+        return self.started
+
+    @inlineCallbacks
+    def open_stream(self):
+        _ = yield self.session.call("rie.vision.card.read")
+        self.subscription = yield self.session.subscribe(self.on_card, "rie.vision.card.stream")
+        yield self.session.call("rie.vision.card.stream")
+
+    def on_start_failed(self, failure):
+        self.started = None  # The next scan tries again
+        return failure
+
+    def on_card(self, frame) -> None:
+        """
+        Handles a frame of the card stream. This function is called every time
+        the robot sees a card.
+
+        Args:
+            frame (dict): The event of rie.vision.card.stream.
+        """
+        now = self.clock.seconds()
+        self.history.append((now, tuple(marker[5] for marker in frame['data']['body'])))
+        while self.history[0][0] < now - self.history_seconds:
+            self.history.popleft()
+
+        for waiter in list(self.waiters):
+            card = self.vote(*waiter[1:])
+            if card is not None:
+                print("Kaart gescand: ", card)
+                self.waiters.remove(waiter)
+                waiter[0].callback(card)
+
+    def vote(self, scan_start: float, expected: Optional[Container[int]]) -> Optional[int]:
+        """
+        Picks the card of a scan from the frames in the history.
+
+        Args:
+            scan_start (float): When the scan started.
+            expected (Optional[Container[int]]): The cards the scan accepts,
+                or None for any card.
+
+        Returns:
+            Optional[int]: The card, or None if no card has won the vote yet.
+        """
+        votes: Dict[int, int] = {}
+        for seen_at, cards in self.history:
+            if seen_at < scan_start:  # Cards seen before the scan may already have been put back
+                continue
+            for card in set(cards):
+                if expected is None or card in expected:
+                    votes[card] = votes.get(card, 0) + 1
+        # Make it possible to pick the same card twice, but not by leaving it in front of the camera
+        if self.previous_scanned in votes and self.clock.seconds() - scan_start < SAME_CARD_DELAY:
+            del votes[self.previous_scanned]
+
+        ranked = sorted(votes.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.min_frames or (len(ranked) > 1 and ranked[1][1] == ranked[0][1]):
+            return None
+        return ranked[0][0]
+
+    def wait_for_card(self, timeout: float = ARUCO_READING_TIME,
+                      expected: Optional[Container[int]] = None) -> Deferred:
+        """
+        Waits for the next card the robot sees. Several scans can wait at the
+        same time, each for its own cards.
+
+        Args:
+            timeout (float): The number of seconds to wait.
+            expected (Optional[Container[int]]): The cards to wait for, e.g.
+                PRONOUN_CARDS, or None for any card.
+
+        Returns:
+            Deferred: Fires with the number of the card, or None if no card was
+            seen in time.
+        """
+        waiter = Deferred(canceller=self.forget)
+        self.waiters.append((waiter, self.clock.seconds(), expected))
+        waiter.addTimeout(timeout, self.clock, onTimeoutCancel=lambda result, timeout: None)
+        waiter.addCallback(self.remember)
+        return waiter
+
+    def forget(self, waiter: Deferred) -> None:
+        self.waiters = [other for other in self.waiters if other[0] is not waiter]
+
+    def remember(self, card: Optional[int]) -> Optional[int]:
+        self.previous_scanned = card
+        return card
+
+    @inlineCallbacks
+    def scan(self, timeout: float = ARUCO_READING_TIME, expected: Optional[Container[int]] = None):
+        """
+        Starts the card stream if needed and waits for the next card.
+
+        Args:
+            timeout (float): The number of seconds to wait.
+            expected (Optional[Container[int]]): The cards to wait for, or None
+                for any card.
 
+        Returns:
+            Optional[int]: The number of the card, or None if no card was seen
+            in time.
+        """
+        print("Scanning for cards")
+        yield self.start()
+        card_scanned = yield self.wait_for_card(timeout, expected)
+        return card_scanned
+
+    @inlineCallbacks
+    def stop(self):
+        """
+        Stops the card stream and unsubscribes from it.
+        """
+        if self.started is None:
+            return
+        self.started = None
+        if self.subscription is not None:
+            yield self.subscription.unsubscribe()
+            self.subscription = None
+        yield self.session.call("rie.vision.card.close")
+
+
+card_scanners: "weakref.WeakKeyDictionary[object, CardScanner]" = weakref.WeakKeyDictionary()
+
+
+def get_card_scanner(session) -> CardScanner:
+    """
+    Returns the card scanner of a session, creating it the first time.
+    """
+    if session not in card_scanners:
+        card_scanners[session] = CardScanner(session)
+    return card_scanners[session]
+
+
+def set_card_scanner(session, card_scanner: CardScanner) -> None:
+    """
+    Makes a session use the given card scanner, e.g. one with a task.Clock.
+    """
+    card_scanners[session] = card_scanner
+
+
+def stop_card_scanner(session) -> Deferred:
+    """
+    Stops the card stream of a session, before the session leaves.
+    """
+    card_scanner = card_scanners.pop(session, None)
+    return card_scanner.stop() if card_scanner is not None else succeed(None)
+
+
+def aruco_scan(session, expected: Optional[Container[int]] = None) -> Deferred:
+    return get_card_scanner(session).scan(expected=expected)
+
+
+@inlineCallbacks
 def aruco_scan_specific_card(session, card_to_scan):
     """'
 
     returns -1 if no card was found
     """
-    global card_scanned
-    card_scanned = None
     if card_to_scan < 100:
         yield say_normally(session, "Ik scan nu naar kaart" + str(card_to_scan))
-    attempts = 0
-    print(card_scanned)
-    card_scanned = yield aruco_scan(session)
-    while card_scanned == None:
-
-        if card_scanned == None:
-            yield say_normally(session, "Ik heb de kaart nog niet gescand. Ik ben op zoek naar kaart" + str(card_to_scan))
-        attempts += 1
+    # Only cards of the same kind count, so other cards in view do not make the scan fail
+    expected = PICTURE_CARDS if card_to_scan in PICTURE_CARDS else PRONOUN_CARDS
+    card_scanned = yield aruco_scan(session, expected)
+    attempts = 1
+    while card_scanned is None:
         if attempts == MAX_FAILED_ATTEMPS:
             return -1
+        yield say_normally(session, "Ik heb de kaart nog niet gescand. Ik ben op zoek naar kaart" + str(card_to_scan))
+        card_scanned = yield aruco_scan(session, expected)
+        attempts += 1
     return card_scanned
@@ -1,5 +1,7 @@
-from src.utils import generate_message_using_llm
+from twisted.internet.defer import inlineCallbacks
+from src.utils import generate_message_using_llm_deferred
 from nltk.tokenize import RegexpTokenizer
+from src.speech_processing.pronoun_recognizer import PRONOUNS
 class LLMGameHelper:
     def __init__(self):
         self.standard_prompt_addition = ("Gebruik simpele en duidelijke taal die een"
@@ -11,17 +13,23 @@ class LLMGameHelper:
         else:
             return False
 
+    @inlineCallbacks
     def check_answer(self, user_input, answer: str):
         #Cut the part after the pronoun describing its function
         correct_pronoun = answer.split('_')[0]
         print(correct_pronoun)
         print("The correct answer was " + str(correct_pronoun) + "The given answer was" + str(user_input))
+        # Fast path: if exactly one pronoun was said, no LLM is needed to judge it
+        spoken_pronouns = set(RegexpTokenizer(r"\b\w+(?:'\w+)?\b").tokenize(user_input.lower())) & set(PRONOUNS)
+        if len(spoken_pronouns) == 1:
+            return self.check_with_tokenize(spoken_pronouns.pop(), correct_pronoun)
+
         prompt = (
             f"De gebruiker heeft bij het raden van een persoonlijk voornaamwoord het volgende "
             f"antwoord gegeven: '{user_input}'. De volgende persoonlijke voornaamwoorden zijn correct:'{correct_pronoun}'. "
             "Geef als antwoord alleen 'juist', 'onjuist' of 'onzeker'."
         )
-        correctness =  generate_message_using_llm(prompt)
+        correctness = yield generate_message_using_llm_deferred(prompt)
         # print("Correctness is: " + correctness)
         # print(RegexpTokenizer(r"\b\w+(?:'\w+)?\b").tokenize(correctness.lower())[0])
         # if 'juist'in RegexpTokenizer(r"\b\w+(?:'\w+)?\b").tokenize(correctness.lower()):
@@ -32,9 +40,11 @@ class LLMGameHelper:
         #Check sentence?
         return correct
 
-    def recognize_yes_or_no(self, user_input: str) -> str:
+    @inlineCallbacks
+    def recognize_yes_or_no(self, user_input: str):
         """
-        Determines if the user's response is 'yes' or 'no'.
+        Determines if the user's response is 'yes' or 'no'. The LLM call runs
+        on the reactor thread pool, so this returns a Deferred.
 
         Args:
             user_input (str): User's input.
@@ -47,7 +57,7 @@ class LLMGameHelper:
             f"'ja' of 'nee' heeft gezegd. Reageer alleen met 'ja' of 'nee' gebaseerd op de input. Als het"
             f"onduidelijk is, reageer dan de meest waarschijnlijke optie. "
         )
-        response = generate_message_using_llm(prompt)
+        response = yield generate_message_using_llm_deferred(prompt)
         if self.check_with_tokenize(word='ja', input=response):
             return 'yes'
         elif self.check_with_tokenize(word='nee', input=response):
@@ -57,7 +67,13 @@ class LLMGameHelper:
 
 
 if __name__ == "__main__":
-    GameHelper = LLMGameHelper()
-    prompt = "ik denk van wel"
-    yes_or_no = GameHelper.recognize_yes_or_no(prompt)
-    print(yes_or_no)
\ No newline at end of file
+    from twisted.internet import task
+
+    @inlineCallbacks
+    def main(reactor):
+        GameHelper = LLMGameHelper()
+        prompt = "ik denk van wel"
+        yes_or_no = yield GameHelper.recognize_yes_or_no(prompt)
+        print(yes_or_no)
+
+    task.react(main)
\ No newline at end of file
@@ -1,13 +1,13 @@
-import time
 from typing import Generator, Optional, Dict
+from twisted.internet import reactor, task
 from twisted.internet.defer import inlineCallbacks, returnValue
-from autobahn.twisted.util import sleep
 from src.robot_movements.say_animated import say_animated
 from src.utils import generate_message_using_llm
 from alpha_mini_rug import perform_movement
 from src.speech_processing.speech_session import SpeechRecognitionSession
+from src.speech_processing.pronoun_recognizer import PRONOUNS
 from src.pronoun_game.llm_interface import LLMGameHelper
-from src.pronoun_game.acuro_card_recognition import aruco_scan,aruco_scan_specific_card
+from src.pronoun_game.acuro_card_recognition import aruco_scan,aruco_scan_specific_card, PICTURE_CARDS, PRONOUN_CARDS
 from src.robot_responses.responses import say_practice_sentence, respond_to_correct_answer,\
     respond_to_wrong_answer, respond_to_wrong_answer_and_give_correct, say_normally
 from src.robot_movements.gesture_library import arms_up, arms_down
@@ -17,13 +17,19 @@ MAX_ATTEMPTS_ARUCO = 2
 MAX_ATTEMPTS_SPEECH = 2
 MAX_TIME_EXPERIMENT = 1 * 60
 class PronounGame:
-    def __init__(self, session, version, sentences, skip_intro):
+    def __init__(self, session, version, sentences, skip_intro, speech_recognition_session=None,
+                 ask_operator=input, max_time=MAX_TIME_EXPERIMENT, clock=reactor):
         self.session = session
         self.version = version
         self.game_helper = LLMGameHelper()
-        self.speech_recognition_session = SpeechRecognitionSession(self.session, self.version)
+        if speech_recognition_session is None:
+            speech_recognition_session = SpeechRecognitionSession(self.session, self.version)
+        self.speech_recognition_session = speech_recognition_session
+        self.ask_operator = ask_operator  # Asks the researcher what to do, input() unless the operator is simulated
+        self.max_time = max_time
+        self.clock = clock  # Times the rounds and pauses, a task.Clock when the game is checked offline
         self.sentences = sentences
-        self.pronouns = ['hij', 'hem', 'zijn', 'zij', 'haar', 'hen', 'hun']
+        self.pronouns = list(PRONOUNS)
         self.pronoun_performance = [{"type": "3_sing_masc", "cards_tested": 0, "mistakes": 0, "correct": 0},
                                     {"type": "3_sing_fem", "cards_tested": 0, "mistakes": 0, "correct": 0},
                                     {"type": "3_plur", "cards_tested": 0, "mistakes": 0, "correct": 0}]
@@ -48,8 +54,8 @@ class PronounGame:
                 yield say_animated(self.session, "Goed gedaan! Dat was inderdaad de kaart die ik zocht.")
                 return
             elif card_scanned == -1:
-                input = input("Did the child get it correct?: y/n")
-                if input == "y":
+                operator_input = self.ask_operator("Did the child get it correct?: y/n")
+                if operator_input == "y":
                     yield say_animated(self.session, "Goed gedaan! Dat was inderdaad de kaart die ik zocht.")
                     return
                 else:
@@ -83,21 +89,34 @@ class PronounGame:
                 # Check sentence
                 if not skip_sentence:
                     yield say_practice_sentence(self.session, selected_sentence)
-                card_scanned = yield aruco_scan(self.session)
-                while card_scanned < 100:
-                    yield say_normally(self.session, "Ik heb per ongeluk een plaatje gescand. Zorg dat alle plaatjes"
+                card_scanned = yield aruco_scan(self.session, PRONOUN_CARDS)
+                spoken_answer = None
+                speech_attempts = 0
+                while card_scanned is None and not spoken_answer:
+                    if speech_attempts < MAX_ATTEMPTS_SPEECH:
+                        # The child can also say the word, e.g. when the cards cannot be scanned
+                        yield say_normally(self.session, "Ik heb geen woordkaart gezien. Zeg het woord dat op de"
+                                                         " lege plek hoort maar hardop")
+                        spoken_answer = yield self.speech_recognition_session.recognize_pronoun()
+                        speech_attempts += 1
+                        continue
+                    yield say_normally(self.session, "Ik heb geen woordkaart gezien. Zorg dat alle plaatjes"
                                                      " omhoog liggen en probeer dan opnieuw")
-                    yield sleep(1)
+                    yield task.deferLater(self.clock, 1, lambda: None)
                     yield say_practice_sentence(self.session, selected_sentence)
-                    card_scanned = yield aruco_scan(self.session)
-                pronoun_guessed = self.pronouns[card_scanned-100]
-                correct = self.game_helper.check_with_tokenize(pronoun_guessed, correct_answer)
+                    card_scanned = yield aruco_scan(self.session, PRONOUN_CARDS)
+                if card_scanned is not None:
+                    pronoun_guessed = self.pronouns[card_scanned-100]
+                    correct = self.game_helper.check_with_tokenize(pronoun_guessed, correct_answer)
+                else:
+                    pronoun_guessed = spoken_answer
+                    correct = yield self.game_helper.check_answer(spoken_answer, correct_answer)
                 if correct:
                     yield respond_to_correct_answer(self.session, selected_sentence, correct_answer)
                     round_data["correct_guesses"] += 1
                 else:
-                    print("Gegeven antwoord is: " + str(pronoun_guessed) + "\nWat moet ik doen?: o(opnieuw)/g(goed)/f(fout)")
-                    given_input = input()
+                    given_input = self.ask_operator("Gegeven antwoord is: " + str(pronoun_guessed)
+                                                    + "\nWat moet ik doen?: o(opnieuw)/g(goed)/f(fout)")
                     if given_input == 'opnieuw':
                         skip_sentence=True
                     elif given_input == 'goed':
@@ -119,16 +138,14 @@ class PronounGame:
     def child_picks_aruco(self):
         yield say_normally(self.session, "Kies maar een kaart om te oefenen en"
                                          " scan hem voor mijn hoofd.")
-        card = yield aruco_scan(self.session)
-        while card is None or card in self.cards_already_done or card >= 100:
+        card = yield aruco_scan(self.session, PICTURE_CARDS)
+        while card is None or card in self.cards_already_done:
             if card is None:
                 yield self.session.call("rie.dialogue.say", text="Ik heb niks gevonden "
                                                                  "Probeer opnieuw", lang="nl")
             elif card in self.cards_already_done:
                 yield say_normally(self.session, "Die kaart hebben we al geoefend. Probeer opnieuw")
-            elif card >= 100:
-                yield say_normally(self.session, "Ik heb per ongeluk een woordkaart gescand. Probeer opnieuw")
-            card = yield aruco_scan(self.session)
+            card = yield aruco_scan(self.session, PICTURE_CARDS)
         return card
     def update_pronoun_performance(self, card,round_data):
         self.pronoun_performance[card % 3]["cards_tested"] += 1
@@ -160,14 +177,14 @@ class PronounGame:
         # Regular loop
         #round_data = yield self.practice_sentences(1)
         yield say_normally(self.session, "We gaan nu oefenen met de andere kaarten")
-        start_time = time.time()
-        while time.time() - start_time <= MAX_TIME_EXPERIMENT:
+        start_time = self.clock.seconds()
+        while self.clock.seconds() - start_time <= self.max_time:
             if self.aruco_choice:
                 card = yield self.child_picks_aruco()
             # Practice sentences
             print("Picked card: " + str(card))
             yield say_normally(self.session, "Ik heb kaart" + str(card) + "gescand. Laten we daarmee gaan oefenen!")
-            yield sleep(1)
+            yield task.deferLater(self.clock, 1, lambda: None)
             self.cards_already_done.append(card)
             round_data = yield self.practice_sentences(card)
             self.update_pronoun_performance(card,round_data)
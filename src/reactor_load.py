@@ -0,0 +1,71 @@
+"""
+Description:
+    This module defines the ReactorLoadMonitor class, which measures how busy
+    the Twisted reactor is. A timer is scheduled at a fixed interval; the
+    more the reactor is busy with other work, the later the timer fires. The
+    smoothed delay (the lag) can be used to back off work that competes with
+    the reactor for the CPU.
+"""
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+
+class ReactorLoadMonitor:
+    """
+    This class keeps a smoothed estimate of the reactor lag: how much later
+    than scheduled a timer fires.
+    """
+
+    def __init__(self, interval: float = 0.1, smoothing: float = 0.2):
+        self.interval = interval
+        self.smoothing = smoothing  # Weight of the newest measurement
+        self.lag = 0.0  # Seconds
+        self.max_lag = 0.0
+        self.expected_time = None
+        self.loop = LoopingCall.withCount(self.tick)
+
+    def start(self) -> None:
+        """
+        Starts measuring. Does nothing if the monitor is already running.
+        """
+        if not self.loop.running:
+            self.expected_time = reactor.seconds()
+            self.loop.start(self.interval, now=False)
+
+    def tick(self, intervals: int) -> None:
+        """
+        Called by the LoopingCall with the number of intervals since the
+        previous call; more than one if the reactor was too busy to call it
+        in time.
+        """
+        self.expected_time += intervals * self.interval
+        lag = max(0.0, reactor.seconds() - self.expected_time)
+        self.lag = self.smoothing * lag + (1 - self.smoothing) * self.lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def stop(self) -> None:
+        """
+        Stops measuring.
+        """
+        if self.loop.running:
+            self.loop.stop()
+
+
+_reactor_load_monitor = None
+
+
+def get_reactor_load_monitor() -> ReactorLoadMonitor:
+    """
+    Returns the monitor shared by all speech sessions, creating and starting
+    it the first time it is needed. There is one reactor, so one monitor is
+    enough, and no session has to stop it.
+
+    Returns:
+        ReactorLoadMonitor: The shared, running monitor.
+    """
+    global _reactor_load_monitor
+    if _reactor_load_monitor is None:
+        _reactor_load_monitor = ReactorLoadMonitor()
+        _reactor_load_monitor.start()
+    return _reactor_load_monitor
@@ -0,0 +1,232 @@
+"""
+Description:
+    This module defines a GestureCache class which stores the completed
+    gesture frames of utterances the robot has already said. Most texts of
+    the robot are fixed strings, so planning their gestures again (an LLM
+    call and POS tagging) is wasted work. Plans are kept in memory and in a
+    local SQLite file, both with least recently used eviction. The cache key
+    contains the text, the language, the version of the gesture library and
+    DELTA_T, so changing any of them never returns an outdated plan. Plans
+    precompiled by precompile_gestures.py are loaded when the cache is
+    opened and are never evicted.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from src.robot_movements.gesture_library import DELTA_T, BEAT_GESTURES, DEFAULT_JOINT_VALUES, hello_iconic, i_iconic, you_iconic
+
+GESTURE_CACHE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gesture_cache.sqlite3")
+PRECOMPILED_GESTURES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "precompiled_gestures.json.gz")
+MAX_MEMORY_ENTRIES = 256
+MAX_DISK_ENTRIES = 4096
+
+
+def compute_gesture_library_version() -> str:
+    """
+    Computes a short fingerprint of all gestures and default joint values, so
+    any change to the gesture library invalidates the cached plans.
+
+    Returns:
+        str: The version of the gesture library.
+    """
+    library = [BEAT_GESTURES, hello_iconic, i_iconic, you_iconic, DEFAULT_JOINT_VALUES]
+    return hashlib.sha256(json.dumps(library, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+GESTURE_LIBRARY_VERSION = compute_gesture_library_version()
+
+
+def make_cache_key(text: str, language: str) -> str:
+    """
+    Creates the content-addressed key of a gesture plan.
+
+    Args:
+        text (str): The text the robot says.
+        language (str): The language of the text.
+
+    Returns:
+        str: The key of the gesture plan.
+    """
+    content = json.dumps([text, language, GESTURE_LIBRARY_VERSION, DELTA_T])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class GestureCache:
+    """
+    This class caches completed gesture frames per utterance, in memory and
+    on disk, and counts the hits and misses.
+    """
+
+    def __init__(self, path: Optional[str] = GESTURE_CACHE_PATH,
+                 max_memory_entries: int = MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()  # key -> frames as JSON, so every lookup returns a fresh copy
+        self.precompiled = {}  # key -> frames as JSON, loaded from the precompiled artifact
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.connection = None
+
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS gesture_plans "
+                                    "(key TEXT PRIMARY KEY, frames TEXT NOT NULL, last_used REAL NOT NULL)")
+            self.connection.commit()
+
+    def get(self, text: str, language: str = "nl") -> Optional[List[Dict]]:
+        """
+        Looks up the completed gesture frames of an utterance.
+
+        Args:
+            text (str): The text the robot says.
+            language (str): The language of the text.
+
+        Returns:
+            Optional[List[Dict]]: A copy of the cached frames (an empty list
+            if the text has no gestures), or None if the text is not cached.
+
+        Notes:
+            A copy is returned because perform_movement changes the time of
+            the first frame in place.
+        """
+        key = make_cache_key(text, language)
+
+        if key in self.precompiled:
+            self.hits += 1
+            return json.loads(self.precompiled[key])
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return json.loads(self.memory[key])
+
+        if self.connection is not None:
+            row = self.connection.execute("SELECT frames FROM gesture_plans WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.connection.execute("UPDATE gesture_plans SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.connection.commit()
+                self.remember(key, row[0])
+                self.hits += 1
+                self.disk_hits += 1
+                return json.loads(row[0])
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, language: str, frames: List[Dict]) -> None:
+        """
+        Stores the completed gesture frames of an utterance.
+
+        Args:
+            text (str): The text the robot says.
+            language (str): The language of the text.
+            frames (List[Dict]): The completed gesture frames.
+        """
+        key = make_cache_key(text, language)
+        serialized_frames = json.dumps(frames)
+        self.remember(key, serialized_frames)
+
+        if self.connection is not None:
+            self.connection.execute("INSERT OR REPLACE INTO gesture_plans (key, frames, last_used) VALUES (?, ?, ?)",
+                                    (key, serialized_frames, time.time()))
+            self.connection.execute("DELETE FROM gesture_plans WHERE key NOT IN "
+                                    "(SELECT key FROM gesture_plans ORDER BY last_used DESC LIMIT ?)",
+                                    (self.max_disk_entries,))
+            self.connection.commit()
+
+    def load_precompiled(self, path: str = PRECOMPILED_GESTURES_PATH) -> int:
+        """
+        Loads the gesture plans written by precompile_gestures.py. Plans made
+        with another gesture library or DELTA_T have different keys, so they
+        are simply never found.
+
+        Args:
+            path (str): The path to the precompiled artifact.
+
+        Returns:
+            int: The number of loaded plans.
+        """
+        if not os.path.exists(path):
+            return 0
+
+        with gzip.open(path, "rt", encoding="utf-8") as artifact:
+            plans = json.load(artifact)["plans"]
+
+        for key, frames in plans.items():
+            self.precompiled[key] = json.dumps(frames)
+
+        print(f"Loaded {len(plans)} precompiled gesture plans from {path}")
+        return len(plans)
+
+    def remember(self, key: str, serialized_frames: str) -> None:
+        """
+        Stores serialized frames in memory and evicts the least recently used
+        entries when the memory cache is full.
+
+        Args:
+            key (str): The key of the gesture plan.
+            serialized_frames (str): The frames as JSON.
+        """
+        self.memory[key] = serialized_frames
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            Dict[str, int]: The number of hits (of which disk hits), misses,
+            entries in memory and precompiled entries.
+        """
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "memory_entries": len(self.memory), "precompiled_entries": len(self.precompiled)}
+
+    def close(self) -> None:
+        """
+        Closes the on-disk store.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+_gesture_cache = None
+
+
+def get_gesture_cache() -> GestureCache:
+    """
+    Returns the gesture cache shared by all say_animated calls, opening it
+    and loading the precompiled gesture plans the first time it is needed.
+
+    Returns:
+        GestureCache: The shared gesture cache.
+    """
+    global _gesture_cache
+    if _gesture_cache is None:
+        _gesture_cache = GestureCache()
+        _gesture_cache.load_precompiled()
+    return _gesture_cache
+
+
+def set_gesture_cache(gesture_cache: GestureCache) -> None:
+    """
+    Replaces the gesture cache shared by all say_animated calls, e.g. with
+    one that is only kept in memory, so a simulated session does not write
+    its plans to disk.
+
+    Args:
+        gesture_cache (GestureCache): The cache to share.
+    """
+    global _gesture_cache
+    _gesture_cache = gesture_cache
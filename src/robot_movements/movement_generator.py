@@ -9,10 +9,11 @@ Description:
 """
 
 import random
-from typing import Dict, List
+from typing import Dict, Generator, List, Optional, Tuple
 from nltk.tokenize import RegexpTokenizer
+from twisted.internet.defer import Deferred, inlineCallbacks
 from src.robot_movements.gesture_library import DELTA_T, BEAT_GESTURES, DEFAULT_JOINT_VALUES, hello_iconic, i_iconic, you_iconic
-from src.robot_movements.stress_word_analyzer import StressWordAnalyzer
+from src.robot_movements.stress_word_analyzer import StressWordAnalyzer, LLM_STRESS_WORDS_DEADLINE
 
 SPEECH_RATE_ENGLISH = 0.340211161387632  # Estimated seconds per word
 SPEECH_RATE_DUTCH = 0.31088476361070403  # Estimated seconds per word - 0.4, as it aligns better
@@ -25,26 +26,32 @@ class MovementGenerator:
     spaced and formatted into frames.
     """
 
-    def __init__(self, text: str, language: str = "nl"):
+    def __init__(self, text: str, language: str = "nl", llm_deadline: float = LLM_STRESS_WORDS_DEADLINE):
         self.text = text
         self.language = language
         self.delta_t = DELTA_T
         self.speech_rate = SPEECH_RATE_ENGLISH if language == "en" else SPEECH_RATE_DUTCH
-        self.stress_word_analyzer = StressWordAnalyzer(text, language=self.language)
+        self.stress_word_analyzer = StressWordAnalyzer(text, language=self.language, llm_deadline=llm_deadline)
         self.words = RegexpTokenizer(r"\b\w+(?:'\w+)?\b").tokenize(text.lower())
         self.beat_gestures = []
         self.iconic_gestures = []
         self.frames = []
 
-    def get_beat_gestures(self) -> List[Dict]:
+    def get_beat_gestures(self, stress_words: Optional[List[Tuple[int, str]]] = None) -> List[Dict]:
         """
         Determines appropriate beat gestures for emphasized words in the text.
 
+        Args:
+            stress_words (Optional[List[Tuple[int, str]]]): The stress words
+                of the text. If None, they are determined by the stress word
+                analyzer.
+
         Returns:
             List[Dict]: A list of dictionaries, each containing the index of
             the word in the text and the associated gesture for that word.
         """
-        stress_words = self.stress_word_analyzer.get_stress_words()
+        if stress_words is None:
+            stress_words = self.stress_word_analyzer.get_stress_words()
 
         gesture_options = list(BEAT_GESTURES.values())
         random.shuffle(gesture_options)
@@ -88,12 +95,17 @@ class MovementGenerator:
 
         return self.iconic_gestures
 
-    def get_gesture_frames(self) -> List[Dict]:
+    def get_gesture_frames(self, stress_words: Optional[List[Tuple[int, str]]] = None) -> List[Dict]:
         """
         Generates the sequence of frames representing gestures for the provided
         text. This combines both beat and iconic gestures and arranges them in
         time order.
 
+        Args:
+            stress_words (Optional[List[Tuple[int, str]]]): The stress words
+                of the text. If None, they are determined by the stress word
+                analyzer.
+
         Returns:
             List[Dict]: A list of dictionaries, each containing time and
             gesture data for the robot's movements.
@@ -102,7 +114,7 @@ class MovementGenerator:
             The gestures are filtered to ensure they do not overlap too
             closely.
         """
-        beat_gestures = self.get_beat_gestures()
+        beat_gestures = self.get_beat_gestures(stress_words)
         iconic_gestures = self.get_iconic_gestures()
         speech_duration = len(self.words) * self.speech_rate * 1000  # In ms
         gap = 6  # To fine-tune movement
@@ -132,6 +144,21 @@ class MovementGenerator:
 
         return self.frames
 
+    @inlineCallbacks
+    def get_gesture_frames_concurrently(self) -> Generator[Deferred, List[Tuple[int, str]], List[Dict]]:
+        """
+        Generates the gesture frames like get_gesture_frames, but determines
+        the stress words with the LLM and POS tagging running concurrently,
+        falling back to POS tagging only when the LLM misses its deadline.
+
+        Returns:
+            Generator[Deferred, List[Tuple[int, str]], List[Dict]]: A
+            coroutine generator which, when yielded, returns the list of
+            gesture frames.
+        """
+        stress_words = yield self.stress_word_analyzer.get_stress_words_concurrently()
+        return self.get_gesture_frames(stress_words)
+
     def complete_frames(self) -> List[Dict]:
         """
         Completes the frames by ensuring that each frame has the default joint
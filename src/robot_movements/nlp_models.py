@@ -0,0 +1,78 @@
+"""
+Description:
+    This module provides a process-wide registry of spaCy models. Loading a
+    pipeline from disk takes hundreds of milliseconds, so every model is
+    loaded once per language (and set of excluded components) and reused by
+    all StressWordAnalyzer instances. The models can be warmed up at startup
+    so the first utterance of the robot does not pay the loading cost.
+"""
+
+import threading
+from typing import Dict, Iterable, Tuple
+import spacy
+from spacy.language import Language
+
+SPACY_MODEL_NAMES: Dict[str, str] = {
+    "nl": "nl_core_news_sm",
+    "en": "en_core_web_sm"
+}
+
+# Only the POS tags are used for gesture planning, so the heavier components are skipped by default
+DEFAULT_EXCLUDED_COMPONENTS: Tuple[str, ...] = ("parser", "ner", "lemmatizer")
+
+_models: Dict[Tuple[str, Tuple[str, ...]], Language] = {}
+_models_lock = threading.Lock()
+
+
+def get_model_name(language: str) -> str:
+    """
+    Returns the name of the spaCy model used for the given language. Any
+    language other than Dutch falls back to the English model.
+
+    Args:
+        language (str): The language code, e.g. "nl" or "en".
+
+    Returns:
+        str: The name of the spaCy model.
+    """
+    return SPACY_MODEL_NAMES.get(language, SPACY_MODEL_NAMES["en"])
+
+
+def get_nlp_model(language: str = "nl", exclude: Iterable[str] = DEFAULT_EXCLUDED_COMPONENTS) -> Language:
+    """
+    Returns the spaCy model for the given language, loading it the first time
+    it is requested.
+
+    Args:
+        language (str): The language code, e.g. "nl" or "en".
+        exclude (Iterable[str]): Pipeline components that are not needed by
+            the caller. Excluded components are not loaded at all, which
+            saves memory and time per call. Defaults to the parser, NER and
+            lemmatizer.
+
+    Returns:
+        Language: The loaded spaCy pipeline.
+    """
+    model_name = get_model_name(language)
+    key = (model_name, tuple(sorted(exclude)))
+
+    with _models_lock:
+        if key not in _models:
+            print(f"Loading spaCy model {model_name} (excluded: {', '.join(key[1]) or 'none'})")
+            _models[key] = spacy.load(model_name, exclude=list(key[1]))
+        return _models[key]
+
+
+def warm_up_nlp_models(languages: Iterable[str] = ("nl",),
+                       exclude: Iterable[str] = DEFAULT_EXCLUDED_COMPONENTS) -> None:
+    """
+    Loads the spaCy models for the given languages and runs them once, so
+    the first call during a session is as fast as the following ones.
+
+    Args:
+        languages (Iterable[str]): The language codes to load models for.
+        exclude (Iterable[str]): Pipeline components that are not needed.
+    """
+    for language in languages:
+        nlp_model = get_nlp_model(language, exclude)
+        nlp_model("Hallo")
@@ -0,0 +1,146 @@
+"""
+Description:
+    This module is a command-line entry point that plans the gestures of every
+    static robot line ahead of a session. It collects the texts passed
+    literally to say_animated in pronoun_game.py and control.py, the fixed
+    responses in responses.py that are spoken with say_animated (combined
+    with every sentence and pronoun in Sentences.csv). The practice sentences
+    themselves are left out: say_practice_sentence speaks them without
+    say_animated, so their plans would never be read. The completed
+    frames are written to a gzipped JSON artifact, which the gesture cache
+    loads at session start, so say_animated skips the analysis for these
+    texts.
+
+    Run from the repository root:
+        python -m src.robot_movements.precompile_gestures
+"""
+
+import argparse
+import ast
+import gzip
+import json
+import os
+from typing import Dict, List
+import pandas as pd
+from src.robot_movements.gesture_cache import GESTURE_LIBRARY_VERSION, PRECOMPILED_GESTURES_PATH, make_cache_key
+from src.robot_movements.gesture_library import DELTA_T
+from src.robot_movements.movement_generator import MovementGenerator
+from src.robot_movements.stress_word_analyzer import get_pos_tag_stress_words_batch
+from src.robot_responses.responses import SAD_SENTENCES, get_correct_answer_responses,\
+    get_wrong_answer_and_give_correct_responses
+
+SRC_DIRECTORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SOURCE_FILES = [
+    os.path.join(SRC_DIRECTORY, "pronoun_game", "pronoun_game.py"),
+    os.path.join(SRC_DIRECTORY, "control", "control.py")
+]
+SENTENCE_FILE = 'Sentences.csv'
+
+
+def collect_say_animated_literals(source_file: str) -> List[str]:
+    """
+    Finds every string literal that is passed as text to say_animated in a
+    source file.
+
+    Args:
+        source_file (str): The path to the Python source file.
+
+    Returns:
+        List[str]: The literal texts.
+    """
+    with open(source_file, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=source_file)
+
+    texts = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or getattr(node.func, "id", None) != "say_animated":
+            continue
+        text_arguments = node.args[1:2] + [keyword.value for keyword in node.keywords if keyword.arg == "text"]
+        for argument in text_arguments:
+            if isinstance(argument, ast.Constant) and isinstance(argument.value, str):
+                texts.append(argument.value)
+    return texts
+
+
+def collect_static_utterances(sentence_file: str = SENTENCE_FILE) -> List[str]:
+    """
+    Collects every text the robot says with gestures that is known before the
+    session starts.
+
+    Args:
+        sentence_file (str): The path to the sentence file.
+
+    Returns:
+        List[str]: The unique static texts, in the order they were found.
+    """
+    texts = []
+    for source_file in SOURCE_FILES:
+        texts.extend(collect_say_animated_literals(source_file))
+    texts.extend(SAD_SENTENCES)
+
+    sentences = pd.read_csv(sentence_file)
+    for card in range(len(sentences)):
+        for i in (1, 3, 5):
+            sentence = sentences.iloc[card, i]
+            pronoun = sentences.iloc[card, i + 1]
+            texts.extend(get_correct_answer_responses(sentence, pronoun))
+            texts.extend(get_wrong_answer_and_give_correct_responses(sentence, pronoun))
+
+    return list(dict.fromkeys(texts))
+
+
+def precompile_gestures(texts: List[str], language: str = "nl") -> Dict[str, List[Dict]]:
+    """
+    Plans the gestures of all texts. The POS tagging of all texts is done in
+    one batch, the LLM is asked for the stress words of every text.
+
+    Args:
+        texts (List[str]): The texts to plan gestures for.
+        language (str): The language of the texts.
+
+    Returns:
+        Dict[str, List[Dict]]: The completed frames per gesture cache key.
+    """
+    plans = {}
+    stress_words_pos_per_text = get_pos_tag_stress_words_batch(texts, language)
+
+    for i, (text, stress_words_pos) in enumerate(zip(texts, stress_words_pos_per_text)):
+        print(f"[{i + 1}/{len(texts)}] {text}")
+        gesture_generator = MovementGenerator(text, language)
+        stress_word_analyzer = gesture_generator.stress_word_analyzer
+        stress_words = stress_word_analyzer.merge_stress_words(stress_word_analyzer.get_llm_stress_words(),
+                                                               stress_words_pos)
+        gesture_generator.get_gesture_frames(stress_words)
+        plans[make_cache_key(text, language)] = gesture_generator.complete_frames()
+
+    return plans
+
+
+def write_artifact(plans: Dict[str, List[Dict]], output_path: str) -> None:
+    """
+    Writes the gesture plans to a gzipped JSON artifact.
+
+    Args:
+        plans (Dict[str, List[Dict]]): The completed frames per key.
+        output_path (str): The path of the artifact.
+    """
+    artifact = {"gesture_library_version": GESTURE_LIBRARY_VERSION, "delta_t": DELTA_T, "plans": plans}
+    with gzip.open(output_path, "wt", encoding="utf-8") as file:
+        json.dump(artifact, file, separators=(",", ":"))
+    print(f"Wrote {len(plans)} gesture plans to {output_path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompile the gestures of all static robot lines.")
+    parser.add_argument("--sentences", default=SENTENCE_FILE, help="Path to the sentence file.")
+    parser.add_argument("--output", default=PRECOMPILED_GESTURES_PATH, help="Path of the artifact to write.")
+    parser.add_argument("--language", default="nl", help="Language of the robot lines.")
+    args = parser.parse_args()
+
+    texts = collect_static_utterances(args.sentences)
+    plans = precompile_gestures(texts, args.language)
+    write_artifact(plans, args.output)
+
+
+if __name__ == "__main__":
+    main()
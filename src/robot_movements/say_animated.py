@@ -5,18 +5,83 @@ Description:
     text and perform gestures based on the content of the text. It utilizes
     predefined gesture generators and performs movement synchronously with the
     speech output. The sequence ensures that the gestures are appropriately
-    timed with the spoken text, providing a more natural animation.
+    timed with the spoken text, providing a more natural animation. Gesture
+    plans of texts that were said before are taken from the gesture cache.
+    The say_animated_stream function speaks a text that is still being
+    generated, sentence by sentence, and plans the gestures of the next
+    sentence while the current one is spoken.
 """
 
-from typing import Generator
-from twisted.internet.defer import DeferredList, inlineCallbacks
+from typing import Dict, Generator, Iterator, List
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, DeferredQueue, inlineCallbacks
+from twisted.internet.threads import deferToThread
 from autobahn.twisted.util import sleep
 from alpha_mini_rug import perform_movement
 from src.robot_movements.movement_generator import MovementGenerator
+from src.robot_movements.gesture_cache import get_gesture_cache
+from src.robot_movements.stress_word_analyzer import LLM_STRESS_WORDS_DEADLINE
+from src.utils import llm_semaphore
 
 
 @inlineCallbacks
-def say_animated(session, text: str, language: str = "nl") -> Generator[None, None, None]:
+def plan_gestures(text: str, language: str = "nl", llm_deadline: float = LLM_STRESS_WORDS_DEADLINE,
+                  use_cache: bool = True) -> Generator[Deferred, List[Dict], List[Dict]]:
+    """
+    Plans the gestures of a text, or takes them from the gesture cache.
+
+    Args:
+        text (str): The text to plan gestures for.
+        language (str): The language of the text.
+        llm_deadline (float): Seconds to wait for the LLM stress words before
+            the gestures are planned with POS tagging only.
+        use_cache (bool): Whether to look the plan up in the gesture cache
+            and keep it there. Texts that are generated on the fly, like the
+            replies of the LLM, are never said twice, so they skip the cache.
+
+    Returns:
+        Generator[Deferred, List[Dict], List[Dict]]: A coroutine generator
+        which, when yielded, returns the completed frames (empty if the text
+        has no gestures).
+    """
+    gesture_cache = get_gesture_cache()
+    frames = gesture_cache.get(text, language) if use_cache else None
+    if frames is None:
+        gesture_generator = MovementGenerator(text, language, llm_deadline=llm_deadline)
+        frames = yield gesture_generator.get_gesture_frames_concurrently()
+        if frames:
+            frames = gesture_generator.complete_frames()
+        if use_cache and not gesture_generator.stress_word_analyzer.llm_fallback:  # Do not keep plans made without the LLM
+            gesture_cache.put(text, language, frames)
+    return frames
+
+
+@inlineCallbacks
+def perform_speech(session, text: str, frames: List[Dict], pause: float = 1) -> Generator[Deferred, None, None]:
+    """
+    Speaks a text and performs its planned gestures at the same time.
+
+    Args:
+        session: The session object for interacting with the robot.
+        text (str): The text to speak.
+        frames (List[Dict]): The completed frames of the gestures.
+        pause (float): Seconds to wait after speaking.
+    """
+    if not frames:
+        yield session.call("rie.dialogue.say", text=text)
+        yield sleep(pause)
+        return
+    speech = session.call("rie.dialogue.say", text=text)
+    movements = perform_movement(session, frames, mode="linear", sync=False, force=False)
+    yield DeferredList([speech, movements])
+    #
+    yield sleep(pause)
+
+
+@inlineCallbacks
+def say_animated(session, text: str, language: str = "nl",
+                 llm_deadline: float = LLM_STRESS_WORDS_DEADLINE, pause: float = 1,
+                 use_cache: bool = True) -> Generator[None, None, None]:
     """
     Simulates an animated speech and gesture sequence for the robot. The robot
     will speak the text and perform gestures simultaneously.
@@ -25,6 +90,11 @@ def say_animated(session, text: str, language: str = "nl") -> Generator[None, No
         session: The session object for interacting with the robot.
         text (str): The text to be spoken and acted out by the robot.
         language (str): The language of the speech (default is English).
+        llm_deadline (float): Seconds to wait for the LLM stress words before
+            the gestures are planned with POS tagging only.
+        pause (float): Seconds to wait after speaking.
+        use_cache (bool): Whether to use the gesture cache. Pass False for
+            text that is generated on the fly.
 
     Returns:
         Generator[None, None, None]: A coroutine generator which, when
@@ -33,15 +103,57 @@ def say_animated(session, text: str, language: str = "nl") -> Generator[None, No
     #yield session.call("rom.optional.behavior.play", name="BlocklyStand")
     #language = "nl"
     #yield session.call("rie.dialogue.config.language", lang=language)
-    gesture_generator = MovementGenerator(text, language)
-    frames = gesture_generator.get_gesture_frames()
-    if not frames:
-        yield session.call("rie.dialogue.say", text=text)
-        yield sleep(1)
-        return
-    frames = gesture_generator.complete_frames()
-    speech = session.call("rie.dialogue.say", text=text)
-    movements = perform_movement(session, frames, mode="linear", sync=False, force=False)
-    yield DeferredList([speech, movements])
-    #
+    frames = yield plan_gestures(text, language, llm_deadline, use_cache)
+    yield perform_speech(session, text, frames, pause)
+
+
+@inlineCallbacks
+def say_animated_stream(session, sentences: Iterator[str], language: str = "nl",
+                        llm_deadline: float = LLM_STRESS_WORDS_DEADLINE) -> Generator[Deferred, str, str]:
+    """
+    Speaks a text sentence by sentence while it is still being generated, so
+    the robot starts talking as soon as the first sentence is complete. The
+    (blocking) sentence iterator is consumed on the reactor thread pool,
+    holding a slot of llm_semaphore like the other OpenAI calls. The gestures
+    of a sentence are planned as soon as it arrives, so they are planned
+    while the sentences before it are spoken. The replies are not kept in the
+    gesture cache.
+
+    Args:
+        session: The session object for interacting with the robot.
+        sentences (Iterator[str]): The sentences to speak, e.g. from
+            stream_conversation_using_llm.
+        language (str): The language of the speech.
+        llm_deadline (float): Seconds to wait for the LLM stress words of a
+            sentence before its gestures are planned with POS tagging only.
+
+    Returns:
+        Generator[Deferred, str, str]: A coroutine generator which, when
+        yielded, speaks all sentences and returns the spoken text.
+    """
+    queue = DeferredQueue()
+    end_of_stream = object()
+
+    def plan_sentence(sentence: str) -> None:
+        queue.put((sentence, plan_gestures(sentence, language, llm_deadline, use_cache=False)))
+
+    def produce_sentences():
+        for sentence in sentences:
+            reactor.callFromThread(plan_sentence, sentence)
+
+    producer = llm_semaphore.run(deferToThread, produce_sentences)
+    producer.addErrback(lambda failure: print("Generating the reply failed:", failure.getErrorMessage()))
+    producer.addBoth(lambda _: queue.put(end_of_stream))  # Runs after all sentences were put on the queue
+
+    spoken_sentences = []
+    while True:
+        item = yield queue.get()
+        if item is end_of_stream:
+            break
+        sentence, planning = item
+        frames = yield planning
+        yield perform_speech(session, sentence, frames, pause=0)
+        spoken_sentences.append(sentence)
+
     yield sleep(1)
+    return " ".join(spoken_sentences)
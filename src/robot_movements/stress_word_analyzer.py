@@ -6,14 +6,85 @@ Description:
     (beat) gestures.
 """
 
-from typing import List, Tuple
+from functools import lru_cache
+from typing import Generator, Iterable, List, Set, Tuple
 import nltk
 #nltk.download('stopwords')
 from nltk.corpus import stopwords
 from nltk.tokenize import RegexpTokenizer
-import spacy
-#spacy.load('nl_core_news_sm')
-from src.utils import generate_message_using_llm
+from spacy.tokens import Doc
+from twisted.internet.defer import Deferred, inlineCallbacks
+from src.robot_movements.nlp_models import get_nlp_model
+from src.utils import generate_message_using_llm, generate_message_using_llm_deferred, with_deadline
+
+WORD_TOKENIZER = RegexpTokenizer(r"\b\w+(?:'\w+)?\b")  # Same tokenization as MovementGenerator, so indices line up
+STRESS_POS_TAGS = ('NOUN', 'VERB', 'ADJ', 'ADV')
+LLM_STRESS_WORDS_DEADLINE = 2.0  # Seconds to wait for the LLM before gesture planning continues with POS tagging only
+
+
+@lru_cache(maxsize=1)
+def get_stop_words() -> Set[str]:
+    """
+    Returns the union of the English and Dutch NLTK stop words. The lists are
+    read from disk only once per process.
+
+    Returns:
+        Set[str]: The English and Dutch stop words.
+    """
+    return set(stopwords.words('english')).union(stopwords.words('dutch'))
+
+
+def select_pos_stress_words(doc: Doc, stop_words: Set[str]) -> List[Tuple[int, str]]:
+    """
+    Maps the tokens of a tagged spaCy Doc back onto the RegexpTokenizer word
+    indices and selects the nouns, verbs, adjectives and adverbs that are not
+    stop words.
+
+    Args:
+        doc (Doc): The tagged (lowercase) text.
+        stop_words (Set[str]): Words that are never selected.
+
+    Returns:
+        List[Tuple[int, str]]: A list of tuples containing the index and
+        the corresponding stress word.
+    """
+    stress_words = []
+    token_index = 0
+
+    for index, (start, end) in enumerate(WORD_TOKENIZER.span_tokenize(doc.text)):
+        # spaCy may split a word in several tokens (e.g. "zo'n"), the first token covering the word is used
+        while token_index < len(doc) and doc[token_index].idx + len(doc[token_index]) <= start:
+            token_index += 1
+        if token_index == len(doc):
+            break
+
+        word = doc.text[start:end]
+        if doc[token_index].pos_ in STRESS_POS_TAGS and word not in stop_words:
+            stress_words.append((index, word))
+
+    return stress_words
+
+
+def get_pos_tag_stress_words_batch(texts: Iterable[str], language: str = "nl",
+                                   batch_size: int = 32) -> List[List[Tuple[int, str]]]:
+    """
+    Identifies the POS stress words of many utterances at once by streaming
+    them through nlp.pipe, which is faster than tagging them one by one.
+
+    Args:
+        texts (Iterable[str]): The utterances to analyze.
+        language (str): The language of the utterances.
+        batch_size (int): The number of utterances spaCy tags per batch.
+
+    Returns:
+        List[List[Tuple[int, str]]]: For every utterance, a list of tuples
+        containing the index and the corresponding stress word.
+    """
+    nlp_model = get_nlp_model(language)
+    stop_words = get_stop_words()
+    docs = nlp_model.pipe((text.lower() for text in texts), batch_size=batch_size)
+    return [select_pos_stress_words(doc, stop_words) for doc in docs]
+
 
 class StressWordAnalyzer:
     """
@@ -22,13 +93,13 @@ class StressWordAnalyzer:
     It ensures spacing rules are followed and prioritizes iconic gestures.
     """
 
-    def __init__(self, text: str, language: str = "nl"):
+    def __init__(self, text: str, language: str = "nl", llm_deadline: float = LLM_STRESS_WORDS_DEADLINE):
         self.text = text
         self.language = language
-        self.words = RegexpTokenizer(r"\b\w+(?:'\w+)?\b").tokenize(text.lower())
-        self.stop_words_en = set(stopwords.words('english'))
-        self.stop_words_nl = set(stopwords.words('dutch'))
-        self.stop_words = self.stop_words_en.union(self.stop_words_nl)
+        self.llm_deadline = llm_deadline
+        self.llm_fallback = False  # Set when the LLM did not answer in time and only POS tagging was used
+        self.words = WORD_TOKENIZER.tokenize(text.lower())
+        self.stop_words = get_stop_words()
 
     def get_llm_stress_words(self) -> List[Tuple[int, str]]:
         """
@@ -39,13 +110,45 @@ class StressWordAnalyzer:
             List[Tuple[int, str]]: A list of tuples, each containing the index
             of the word in the text and the corresponding word.
         """
-        prompt = (
+        response = generate_message_using_llm(self.get_llm_prompt())
+        return self.parse_llm_stress_words(response)
+
+    def get_llm_stress_words_deferred(self) -> Deferred:
+        """
+        Identifies important words like get_llm_stress_words, but the LLM call
+        runs on the reactor thread pool.
+
+        Returns:
+            Deferred: Fires with a list of tuples, each containing the index
+            of the word in the text and the corresponding word.
+        """
+        return generate_message_using_llm_deferred(self.get_llm_prompt()).addCallback(self.parse_llm_stress_words)
+
+    def get_llm_prompt(self) -> str:
+        """
+        Returns the prompt asking the LLM for the stress words of the text.
+
+        Returns:
+            str: The prompt.
+        """
+        return (
             f"Identify the MOST IMPORTANT words that should be emphasized with a small arm or head movement in this text: {self.text}. "
             f"Select at most 1 word per 9 words. Focus on words that carry key meaning or emotion. "
             f"Do NOT emphasize common nouns, generic verbs, or function words. "
             f"Return only a comma-separated list of their positions in the text starting from 0."
         )
-        response = generate_message_using_llm(prompt)
+
+    def parse_llm_stress_words(self, response: str) -> List[Tuple[int, str]]:
+        """
+        Turns the answer of the LLM into stress words.
+
+        Args:
+            response (str): The answer of the LLM.
+
+        Returns:
+            List[Tuple[int, str]]: A list of tuples, each containing the index
+            of the word in the text and the corresponding word.
+        """
         response = RegexpTokenizer(r"\b\w+(?:'\w+)?\b").tokenize(response.lower().split('\n')[0])
         # Cleaning up the response: removing unwanted characters like punctuation and filtering out emojis
         # And if LLM's response includes additional lines (e.g., "1, 2\n hi, i'm"), it is handled here
@@ -69,18 +172,30 @@ class StressWordAnalyzer:
     def get_pos_tag_stress_words(self) -> List[Tuple[int, str]]:
         """
         Identifies important stress words in the text based on part-of-speech
-        (POS) tagging. It processes each word in the text, tags it with its
-        POS tag, and checks if it is a noun, verb, adjective, or adverb.
-        If the word is not a stop word, it is considered a stress word.
+        (POS) tagging. The whole text is tagged as one Doc, so every word is
+        tagged in context, and each word is checked for being a noun, verb,
+        adjective, or adverb. If the word is not a stop word, it is
+        considered a stress word.
+
+        Returns:
+            List[Tuple[int, str]]: A list of tuples containing the index and
+            the corresponding stress word.
+        """
+        nlp_model = get_nlp_model(self.language)
+        doc = nlp_model(self.text.lower())
+        return select_pos_stress_words(doc, self.stop_words)
+
+    def get_pos_tag_stress_words_per_word(self) -> List[Tuple[int, str]]:
+        """
+        Identifies stress words by tagging every word as a separate Doc. This
+        is the previous approach, which tags words without their context. It
+        is only kept as a baseline for benchmarks/pos_tagging.py.
 
         Returns:
             List[Tuple[int, str]]: A list of tuples containing the index and
             the corresponding stress word.
         """
-        if self.language == "nl":
-            nlp_model = spacy.load("nl_core_news_sm")
-        else:
-            nlp_model = spacy.load("en_core_web_sm")
+        nlp_model = get_nlp_model(self.language)
 
         stress_words = []
 
@@ -96,10 +211,59 @@ class StressWordAnalyzer:
     def get_stress_words(self) -> List[Tuple[int, str]]:
         """
         Identifies important words in a text using both LLM-based analysis and
-        part-of-speech (POS) tagging. The function alternates between selecting
-        a stress word chosen by the LLM or by POS tagging. It also ensures that
-        iconic gestures get priority, so if an iconic word is detected too
-        close to a selected stress word, the stress word will be deselected.
+        part-of-speech (POS) tagging, one after the other. See
+        merge_stress_words for how both results are combined.
+
+        Returns:
+            List[Tuple[int, str]]: A list of tuples, each containing the index
+            of the word in the text and the corresponding word.
+        """
+        stress_words_llm = self.get_llm_stress_words()
+        stress_words_pos = self.get_pos_tag_stress_words()
+        return self.merge_stress_words(stress_words_llm, stress_words_pos)
+
+    @inlineCallbacks
+    def get_stress_words_concurrently(self) -> Generator[Deferred, List[Tuple[int, str]], List[Tuple[int, str]]]:
+        """
+        Identifies important words like get_stress_words, but runs the LLM
+        request on the reactor thread pool while the POS tagging is done
+        locally. If the LLM has not answered within llm_deadline seconds (or
+        the request fails), only the POS stress words are used, so gesture
+        planning never delays the speech of the robot.
+
+        Returns:
+            Generator[Deferred, List[Tuple[int, str]], List[Tuple[int, str]]]:
+            A coroutine generator which, when yielded, returns a list of
+            tuples, each containing the index of the word in the text and
+            the corresponding word.
+        """
+        # At the deadline a queued LLM call gives up its place; a running one keeps its slot until its thread is done
+        llm_request = with_deadline(self.get_llm_stress_words_deferred(), self.llm_deadline)
+        stress_words_pos = self.get_pos_tag_stress_words()
+
+        try:
+            stress_words_llm = yield llm_request
+        except Exception as e:
+            print(f"No LLM stress words within {self.llm_deadline} s, using POS tagging only: {e!r}")
+            self.llm_fallback = True
+            stress_words_llm = []
+
+        return self.merge_stress_words(stress_words_llm, stress_words_pos)
+
+    def merge_stress_words(self, stress_words_llm: List[Tuple[int, str]],
+                           stress_words_pos: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """
+        Combines the stress words found by the LLM and by POS tagging. The
+        function alternates between selecting a stress word chosen by the LLM
+        or by POS tagging. It also ensures that iconic gestures get priority,
+        so if an iconic word is detected too close to a selected stress word,
+        the stress word will be deselected.
+
+        Args:
+            stress_words_llm (List[Tuple[int, str]]): The stress words chosen
+                by the LLM.
+            stress_words_pos (List[Tuple[int, str]]): The stress words found
+                by POS tagging.
 
         Returns:
             List[Tuple[int, str]]: A list of tuples, each containing the index
@@ -113,9 +277,6 @@ class StressWordAnalyzer:
             movements, we decided to introduce some randomness by incorporating
             the LLM in addition to POS tagging.
         """
-        stress_words_llm = self.get_llm_stress_words()
-        stress_words_pos = self.get_pos_tag_stress_words()
-
         stress_words = []
         gap = 7  # To fine-tune movement
         llm_index = 0
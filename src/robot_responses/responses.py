@@ -1,11 +1,38 @@
 from nltk.tokenize import RegexpTokenizer
-from typing import Generator
+from typing import Generator, List
 from twisted.internet.defer import DeferredList, inlineCallbacks
 from autobahn.twisted.util import sleep
 from src.robot_movements.gesture_library import head_nod_with_arms, arms_up_and_out, arms_up, arms_down
 from alpha_mini_rug import perform_movement
 from src.robot_movements.say_animated import say_animated
 import random
+
+CONGRATULARY_SENTENCES = [
+    "Goed gedaan! De juiste zin was inderdaad "
+]
+SAD_SENTENCES = [
+    "Helaas! Dat was het verkeerde antwoord. Maar we kunnen het nog een keer proberen!"
+]
+SAD_SENTENCES_WITH_CORRECT_ANSWER = [
+    "Helaas! Dat was het verkeerde antwoord. Het juiste antwoord was:"
+]
+
+
+def get_answered_sentence(correct_sentence: str, correct_pronoun: str) -> str:
+    full_sentence = correct_sentence.replace("_", correct_pronoun)
+    return full_sentence.split(".")[1]
+
+
+def get_correct_answer_responses(correct_sentence: str, correct_pronoun: str) -> List[str]:
+    sentence = get_answered_sentence(correct_sentence, correct_pronoun)
+    return [congratulary_sentence + sentence for congratulary_sentence in CONGRATULARY_SENTENCES]
+
+
+def get_wrong_answer_and_give_correct_responses(correct_sentence: str, correct_pronoun: str) -> List[str]:
+    sentence = get_answered_sentence(correct_sentence, correct_pronoun)
+    return [sad_sentence + correct_pronoun + sentence for sad_sentence in SAD_SENTENCES_WITH_CORRECT_ANSWER]
+
+
 @inlineCallbacks
 def say_practice_sentence(session, sentence: str):
     yield session.call("rie.dialogue.config.language", lang="nl")
@@ -18,33 +45,22 @@ def say_practice_sentence(session, sentence: str):
 
 @inlineCallbacks
 def respond_to_correct_answer(session, correct_sentence, correct_pronoun):
-    full_sentence = correct_sentence.replace("_", correct_pronoun)
-    sentence = full_sentence.split(".")[1]
-    congratulary_sentences = [
-        "Goed gedaan! De juiste zin was inderdaad "
-    ]
-    response = random.choice(congratulary_sentences) + sentence
+    response = random.choice(get_correct_answer_responses(correct_sentence, correct_pronoun))
     yield say_animated(session, response)
     return
 
+@inlineCallbacks
 def respond_to_wrong_answer(session):
-    sad_sentences = [
-        "Helaas! Dat was het verkeerde antwoord. Maar we kunnen het nog een keer proberen!"
-    ]
-    yield say_animated(session, random.choice(sad_sentences))
+    yield say_animated(session, random.choice(SAD_SENTENCES))
     return
 
+@inlineCallbacks
 def respond_to_wrong_answer_and_give_correct(session, correct_sentence, correct_pronoun):
-    sad_sentences = [
-        "Helaas! Dat was het verkeerde antwoord. Het juiste antwoord was:"
-    ]
-
-    full_sentence = correct_sentence.replace("_", correct_pronoun)
-    sentence = full_sentence.split(".")[1]
-    response = random.choice(sad_sentences) + correct_pronoun + sentence
+    response = random.choice(get_wrong_answer_and_give_correct_responses(correct_sentence, correct_pronoun))
     yield say_animated(session, response)
     return
 
+@inlineCallbacks
 def say_normally(session, text: str):
     yield session.call("rie.dialogue.say", text)
     return
@@ -0,0 +1,92 @@
+"""
+Description:
+    Checks that a round of the pronoun game can be played from start to end
+    without a robot, a microphone, OpenAI or a child: PronounGame runs
+    against a SimulatedRobot with the stand-ins of scripted_child. The
+    ScriptedChild picks a picture card, answers the first practice sentence
+    out loud (after the card scan has timed out) and the others with pronoun
+    cards. The check fails, with exit status 1, unless the game finishes with
+    all three answers counted as correct and without asking the operator.
+    play_round takes the clock the robot, the child, the card scanner and the
+    game run on, so test_pronoun_game.py can play the round on a task.Clock
+    instead of waiting for the card scan to time out.
+
+    Run from the repository root:
+        python -m src.simulation.check_pronoun_game
+"""
+
+import time
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks
+from main import SENTENCE_FILE, read_sentences
+from src.pronoun_game.acuro_card_recognition import CardScanner, set_card_scanner, stop_card_scanner
+from src.pronoun_game.pronoun_game import PronounGame
+from src.simulation.scripted_child import (ScriptedChild, ScriptedTranscriptionBackend, SimulatedMicrophone,
+                                           use_offline_services)
+from src.simulation.simulated_robot import SimulatedRobot
+from src.speech_processing.speech_session import SpeechRecognitionSession
+
+
+@inlineCallbacks
+def play_round(clock=reactor):
+    """
+    Plays one round of the pronoun game with a scripted child.
+
+    Args:
+        clock: The reactor the robot, the child, the card scanner and the
+            game are timed with.
+
+    Raises:
+        RuntimeError: If the round did not go as scripted.
+    """
+    llm = use_offline_services()
+    robot = SimulatedRobot(latency=0.005, speech_rate=100, behavior_seconds=0.1, verbose=True, clock=clock)
+    set_card_scanner(robot, CardScanner(robot, clock))
+    microphone = SimulatedMicrophone(seed=0)
+    transcription_backend = ScriptedTranscriptionBackend()
+    speech_session = SpeechRecognitionSession(robot, "experiment", transcription_backend=transcription_backend,
+                                              capture_service=microphone)
+    sentences = read_sentences(SENTENCE_FILE)
+    child = ScriptedChild(robot, sentences, microphone, transcription_backend, answers=("speech", "card", "card"),
+                          clock=clock)
+    operator_questions = []
+
+    def ask_operator(question: str) -> str:
+        operator_questions.append(question)
+        return "fout"
+
+    # A round is only started within max_time, so this plays exactly one picture card
+    game = PronounGame(robot, "experiment", sentences, skip_intro=True, speech_recognition_session=speech_session,
+                       ask_operator=ask_operator, max_time=1.0, clock=clock)
+    start_time = time.perf_counter()
+    try:
+        pronoun_performance, mistakes = yield game.pronoun_practice()
+    finally:
+        speech_session.processor.stop_capture()
+        yield stop_card_scanner(robot)
+        yield robot.leave()
+    print(f"Finished after {time.perf_counter() - start_time:.1f} s, {len(robot.calls)} calls, "
+          f"{len(llm.prompts)} prompts, transcripts: {transcription_backend.transcripts}")
+    print(pronoun_performance)
+
+    problems = []
+    if sum(performance["cards_tested"] for performance in pronoun_performance) != 1:
+        problems.append("not exactly one picture card was played")
+    if sum(performance["correct"] for performance in pronoun_performance) != 3:
+        problems.append("not all three answers were counted as correct")
+    if child.spoken_answers != 1 or child.card_answers != 2:
+        problems.append(f"the child answered {child.spoken_answers} times out loud and {child.card_answers} times "
+                        f"with a card instead of once and twice")
+    if operator_questions:
+        problems.append(f"the operator was asked: {operator_questions}")
+    if problems:
+        raise RuntimeError("The pronoun game did not finish as scripted: " + "; ".join(problems))
+    print("The pronoun game finished as scripted.")
+
+
+def main() -> None:
+    task.react(lambda _: play_round())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Description:
+    This module defines the stand-ins that let a whole session run against a
+    SimulatedRobot without a microphone, OpenAI or a child in front of the
+    robot. SimulatedMicrophone captures background noise with the utterances
+    of the child mixed in, ScriptedTranscriptionBackend returns what the child
+    said instead of transcribing the audio, and ScriptedLLM answers the
+    prompts of the games. ScriptedChild listens to the robot and plays the
+    pronoun game: it picks picture cards and answers every practice sentence
+    with the right pronoun card or, as its script says, out loud.
+    use_offline_services makes the whole process use the scripted LLM, a
+    moderation client without the Sightengine second opinion and a gesture
+    cache that is only kept in memory.
+"""
+
+import itertools
+import queue
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from twisted.internet import reactor
+from src.moderation.moderation_client import ModerationClient, set_moderation_client
+from src.openai_client import set_openai_client
+from src.robot_movements.gesture_cache import GestureCache, set_gesture_cache
+from src.simulation.simulated_robot import SimulatedRobot
+from src.speech_processing.capture_service import AudioCaptureService
+from src.speech_processing.pronoun_recognizer import PRONOUNS
+from src.speech_processing.resampling import Resampler
+from src.speech_processing.stt_backends import TranscriptionBackend
+
+PICK_CARD_PROMPTS = ("Kies maar een kaart", "Probeer opnieuw")  # The robot asks for a picture card
+SPECIFIC_CARD_PROMPT = "Ik scan nu naar kaart"  # Followed by the number of the card
+PRONOUN_CARD_PROMPT = "De kaart die ik zoek is: "  # Followed by the pronoun
+SAY_PRONOUN_PROMPT = "Zeg het woord"  # The robot asks for the pronoun out loud
+
+
+class SimulatedStream:
+    """
+    This class stands in for a PyAudio stream in callback mode: a thread
+    passes the next chunk of the simulated microphone to the callback every
+    chunk period.
+    """
+
+    def __init__(self, microphone: "SimulatedMicrophone", chunk_size: int):
+        self.microphone = microphone
+        self.chunk_size = chunk_size
+        self.active = False
+        self.thread = threading.Thread(target=self.run, name="simulated-microphone", daemon=True)
+
+    def start_stream(self) -> None:
+        self.active = True
+        self.thread.start()
+
+    def run(self) -> None:
+        period = self.chunk_size / self.microphone.sample_rate
+        next_time = time.monotonic()
+        while self.active:
+            next_time += period
+            time.sleep(max(0.0, next_time - time.monotonic()))  # A chunk is delivered once it has been "captured"
+            if self.active:
+                chunk = self.microphone.next_chunk(self.chunk_size)
+                self.microphone.on_audio(chunk.tobytes(), self.chunk_size, {}, 0)
+
+    def stop_stream(self) -> None:
+        self.active = False
+
+    def close(self) -> None:
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+
+
+class SimulatedMicrophone(AudioCaptureService):
+    """
+    This class captures from a simulated microphone instead of PyAudio: in
+    real time, background noise with the utterances of the child mixed in.
+    """
+
+    def __init__(self, sample_rate: int = 16000, chunk_size: int = 1024, noise_level: float = 30.0,
+                 speech_level: float = 6000.0, seed: Optional[int] = None):
+        super().__init__(sample_rate, channels=1, chunk_size=chunk_size, capture_sample_rate=sample_rate)
+        self.noise_level = noise_level  # The standard deviation of the background noise
+        self.speech_level = speech_level  # The peak amplitude of an utterance
+        self.random = np.random.default_rng(seed)
+        self.speech = np.zeros(0)  # The part of the utterances that has not been captured yet
+        self.speech_lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts capturing. Does nothing if the microphone is already running.
+        """
+        if self.stream is not None:
+            return
+        self.resampler = Resampler(self.sample_rate, self.sample_rate, self.channels)
+        self.open_stream()
+
+    def open_stream(self) -> None:
+        self.stream = SimulatedStream(self, self.chunk_size)
+        self.stream.start_stream()
+
+    def speak(self, seconds: float = 0.5, frequency: float = 220.0) -> None:
+        """
+        Lets the child say something: a voiced sound that rises and falls
+        like a syllable is mixed into the next chunks.
+
+        Args:
+            seconds (float): The length of the utterance.
+            frequency (float): The pitch of the voice in Hz.
+        """
+        t = np.arange(int(seconds * self.sample_rate)) / self.sample_rate
+        voice = np.sin(2 * np.pi * frequency * t) + 0.5 * np.sin(4 * np.pi * frequency * t)
+        utterance = self.speech_level / 1.5 * np.sin(np.pi * t / seconds) * voice
+        with self.speech_lock:
+            self.speech = np.concatenate((self.speech, utterance))
+
+    def next_chunk(self, frames: int) -> np.ndarray:
+        """
+        Returns the next captured chunk.
+
+        Args:
+            frames (int): The number of frames of the chunk.
+
+        Returns:
+            np.ndarray: The int16 samples.
+        """
+        chunk = self.random.normal(0.0, self.noise_level, frames)
+        with self.speech_lock:
+            speech, self.speech = self.speech[:frames], self.speech[frames:]
+        chunk[:speech.size] += speech
+        return np.clip(chunk, -32768, 32767).astype(np.int16)
+
+
+class ScriptedTranscriptionBackend(TranscriptionBackend):
+    """
+    This class returns what the child said, in order, instead of
+    transcribing the audio.
+    """
+
+    name = "scripted"
+
+    def __init__(self):
+        self.utterances: "queue.Queue[str]" = queue.Queue()  # What the child said and was not transcribed yet
+        self.transcripts: List[str] = []
+
+    def expect(self, text: str) -> None:
+        """
+        Tells the backend what the child is saying, so the next transcription
+        returns it.
+        """
+        self.utterances.put(text)
+
+    def transcribe(self, samples: np.ndarray, sample_rate: int, channels: int, prompt: str = "") -> str:
+        try:
+            transcript = self.utterances.get_nowait()
+        except queue.Empty:
+            transcript = ""  # Noise, or a later segment of the same utterance
+        self.transcripts.append(transcript)
+        return transcript
+
+
+def scripted_reply(prompt: str) -> str:
+    """
+    Answers the prompts of the games the way the LLM is asked to.
+
+    Args:
+        prompt (str): The prompt of the user message.
+
+    Returns:
+        str: The answer.
+    """
+    if "emphasized with a small arm or head movement" in prompt:
+        return "0"
+    if "'juist', 'onjuist' of 'onzeker'" in prompt:
+        return "juist"
+    if "'ja' of 'nee'" in prompt:
+        return "ja"
+    return "Wat leuk! Vertel me er meer over."
+
+
+class ScriptedLLM:
+    """
+    This class stands in for the OpenAI client: it answers every chat
+    completion and response with reply(prompt), without network.
+    """
+
+    def __init__(self, reply: Callable[[str], str] = scripted_reply):
+        self.reply = reply
+        self.prompts: List[str] = []
+        self.conversation_count = itertools.count(1)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+        self.responses = SimpleNamespace(create=self.create_response)
+        self.conversations = SimpleNamespace(create=self.create_conversation)
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=lambda **kwargs: ""))
+
+    def answer(self, messages: Sequence[Dict[str, str]]) -> str:
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        return self.reply(prompt)
+
+    def create_chat_completion(self, messages: Sequence[Dict[str, str]], **kwargs) -> SimpleNamespace:
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer(messages)))])
+
+    def create_response(self, input: Sequence[Dict[str, str]], stream: bool = False, **kwargs):
+        text = self.answer(input)
+        if not stream:
+            return SimpleNamespace(output_text=text)
+        return iter([SimpleNamespace(type="response.output_text.delta", delta=word)
+                     for word in re.findall(r"\S+\s*", text)])
+
+    def create_conversation(self, **kwargs) -> SimpleNamespace:
+        return SimpleNamespace(id=f"conversation-{next(self.conversation_count)}")
+
+
+def use_offline_services(llm: Optional[ScriptedLLM] = None) -> ScriptedLLM:
+    """
+    Makes the whole process run without network: the LLM helpers use the
+    scripted LLM, texts are only checked with the local profanity filter and
+    gesture plans are not written to the gesture cache on disk.
+
+    Args:
+        llm (Optional[ScriptedLLM]): The scripted LLM, or None for one with
+            scripted_reply.
+
+    Returns:
+        ScriptedLLM: The scripted LLM in use.
+    """
+    llm = llm if llm is not None else ScriptedLLM()
+    set_openai_client(llm)
+    set_moderation_client(ModerationClient(remote_second_opinion=False))
+    gesture_cache = GestureCache(path=None)
+    gesture_cache.load_precompiled()
+    set_gesture_cache(gesture_cache)
+    return llm
+
+
+class ScriptedChild:
+    """
+    This class plays the child in the pronoun game on a SimulatedRobot. It
+    listens to what the robot says: it shows the card the robot asks for,
+    picks the next picture card when asked to choose one, and answers every
+    practice sentence in the way the script says: "card" shows the right
+    pronoun card, "speech" shows no card and says the pronoun once the robot
+    asks for it.
+    """
+
+    def __init__(self,
+                 robot: SimulatedRobot,
+                 sentences,
+                 microphone: SimulatedMicrophone,
+                 transcription_backend: ScriptedTranscriptionBackend,
+                 picture_cards: Iterable[int] = (1, 2, 3, 4, 5),
+                 answers: Sequence[str] = ("card",),
+                 reaction_seconds: float = 0.3,
+                 card_seconds: float = 3.0,
+                 clock=reactor):
+        self.robot = robot
+        self.microphone = microphone
+        self.transcription_backend = transcription_backend
+        self.picture_cards = iter(picture_cards)
+        self.answers = itertools.cycle(answers)
+        self.reaction_seconds = reaction_seconds  # The time the child takes to react to the robot
+        self.card_seconds = card_seconds  # How long a card is held in front of the camera
+        self.clock = clock
+        self.practice_answers = self.read_practice_answers(sentences)
+        self.previous_text: Optional[str] = None
+        self.pronoun_to_say: Optional[str] = None
+        self.card_answers = 0
+        self.spoken_answers = 0
+        robot.speech_listeners.append(self.on_robot_speech)
+
+    @staticmethod
+    def read_practice_answers(sentences) -> Dict[Tuple[str, str], str]:
+        """
+        Returns the pronoun of every practice sentence, by the two parts the
+        robot says around the blank (see say_practice_sentence).
+        """
+        practice_answers = {}
+        for row in range(len(sentences)):
+            for column in (1, 3, 5):
+                before_blank, after_blank = sentences.iloc[row, column].split("_")[:2]
+                practice_answers[(before_blank, after_blank)] = sentences.iloc[row, column + 1].lower()
+        return practice_answers
+
+    def on_robot_speech(self, text: str) -> None:
+        """
+        Called when the robot has finished saying a text.
+        """
+        pronoun = self.practice_answers.get((self.previous_text, text))
+        self.previous_text = text
+        if pronoun is not None:
+            self.pronoun_to_say = pronoun if next(self.answers) == "speech" else None
+            if self.pronoun_to_say is None:
+                self.card_answers += 1
+                self.react(self.show_card, PRONOUNS.index(pronoun) + 100)
+        elif text.startswith(PICK_CARD_PROMPTS) or text.endswith(PICK_CARD_PROMPTS):
+            self.react(self.show_card, next(self.picture_cards))
+        elif text.startswith(SPECIFIC_CARD_PROMPT):
+            self.react(self.show_card, int(text[len(SPECIFIC_CARD_PROMPT):]))
+        elif text.startswith(PRONOUN_CARD_PROMPT):
+            self.react(self.show_card, PRONOUNS.index(text[len(PRONOUN_CARD_PROMPT):].lower()) + 100)
+        elif SAY_PRONOUN_PROMPT in text and self.pronoun_to_say is not None:
+            self.react(self.say, self.pronoun_to_say)
+
+    def react(self, action: Callable, *args) -> None:
+        self.clock.callLater(self.reaction_seconds, action, *args)
+
+    def show_card(self, card: int) -> None:
+        self.robot.show_cards([card], self.card_seconds)
+
+    def say(self, text: str, seconds: float = 0.5) -> None:
+        """
+        Says a text to the microphone, and tells the transcription backend
+        what was said.
+        """
+        self.spoken_answers += 1
+        self.transcription_backend.expect(text)
+        self.microphone.speak(seconds)
@@ -0,0 +1,315 @@
+"""
+Description:
+    This module defines SimulatedRobot, a stand-in for the WAMP session of the
+    Alpha Mini, so the games and the benchmarks can run without a robot or a
+    router. It answers the procedures the games call (speech, motors, the
+    joint sensors, behaviors, the dialogue configuration and the card
+    reader) after a configurable network latency. The card stream replays a
+    script of cards shown to the camera. Calls can be made to fail, at random
+    or per procedure, with the ApplicationError a real router would raise.
+
+    The experiment can be run against it from the repository root:
+        python -m src.simulation.simulated_robot [--latency 0.03] [--failure-rate 0.0] [--cards 0:5 101:20]
+            [--version experiment] [--skip-intro] [--offline]
+    With --offline, the microphone, the transcription and the LLM are
+    replaced by the stand-ins of scripted_child, and a ScriptedChild plays
+    the pronoun game, so the session needs no network or audio device.
+    src/simulation/check_pronoun_game.py checks that a round is played to
+    the end this way.
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from autobahn.wamp.exception import ApplicationError
+from twisted.internet import reactor, task
+from twisted.internet.defer import Deferred, inlineCallbacks, succeed
+from alpha_mini_rug.movements import joints_dic
+
+CardEvent = Tuple[float, Sequence[int], float]  # Seconds from the start, the cards shown and for how long
+
+
+class SimulatedSubscription:
+    """
+    This class is the subscription returned by SimulatedRobot.subscribe.
+    """
+
+    def __init__(self, robot: "SimulatedRobot", topic: str, handler: Callable):
+        self.robot = robot
+        self.topic = topic
+        self.handler = handler
+        self.active = True
+
+    def unsubscribe(self) -> Deferred:
+        if self.active:
+            self.active = False
+            self.robot.subscriptions[self.topic].remove(self)
+        return self.robot.respond(None)
+
+
+class SimulatedRobot:
+    """
+    This class behaves like the WAMP session of the robot for the procedures
+    and topics the games use.
+    """
+
+    def __init__(self,
+                 latency: float = 0.03,
+                 jitter: float = 0.0,
+                 failure_rate: float = 0.0,
+                 failure_rates: Optional[Dict[str, float]] = None,
+                 speech_rate: float = 15.0,
+                 behavior_seconds: float = 1.0,
+                 frame_rate: float = 15.0,
+                 card_script: Sequence[CardEvent] = (),
+                 seed: Optional[int] = None,
+                 verbose: bool = False,
+                 clock=reactor):
+        self.latency = latency  # One way, in seconds
+        self.jitter = jitter  # Up to this many seconds are added to every round trip
+        self.failure_rate = failure_rate  # Chance that any call fails
+        self.failure_rates = failure_rates or {}  # Chance that a call fails, per procedure
+        self.speech_rate = speech_rate  # Characters per second rie.dialogue.say takes to speak
+        self.behavior_seconds = behavior_seconds
+        self.verbose = verbose
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.start_time = clock.seconds()
+
+        self.procedures: Dict[str, Callable] = {
+            "rie.dialogue.say": self.say,
+            "rie.dialogue.config.language": self.set_language,
+            "rie.dialogue.config.native_voice": self.set_native_voice,
+            "rom.actuator.motor.write": self.write_motors,
+            "rom.sensor.proprio.read": self.read_joints,
+            "rom.optional.behavior.play": self.play_behavior,
+            "rie.vision.card.read": self.read_cards,
+            "rie.vision.card.stream": self.start_card_stream,
+            "rie.vision.card.close": self.close_card_stream,
+        }
+        self.calls: List[Tuple[float, str]] = []  # The time and procedure of every call
+        self.subscriptions: Dict[str, List[SimulatedSubscription]] = {}
+        self.joints = {joint: min(max(0.0, low), high) for joint, (low, high, _) in joints_dic.items()}
+        self.language = "en"
+        self.native_voice = False
+        self.said: List[str] = []
+        self.speech_listeners: List[Callable[[str], None]] = []  # Called with every text once it has been said
+        self.cards: Tuple[int, ...] = ()  # The cards in front of the camera
+        self.card_streaming = False
+
+        self.frames = task.LoopingCall(self.send_card_frame)
+        self.frames.clock = clock
+        self.frames.start(1 / frame_rate, now=False)
+        for start, cards, duration in card_script:
+            self.clock.callLater(start, self.show_cards, cards, duration)
+
+    def log(self, message: str) -> None:
+        if self.verbose:
+            print(f"[robot {self.clock.seconds() - self.start_time:7.2f}] {message}")
+
+    def round_trip(self) -> float:
+        return 2 * self.latency + self.random.uniform(0, self.jitter)
+
+    def respond(self, result, duration: float = 0.0) -> Deferred:
+        """
+        Returns a Deferred that fires with the result after a round trip and
+        the time the robot takes to carry out the call.
+        """
+        return task.deferLater(self.clock, self.round_trip() + duration, lambda: result)
+
+    def fail(self, error: ApplicationError) -> Deferred:
+        response = Deferred()
+        self.clock.callLater(self.round_trip(), response.errback, error)
+        return response
+
+    def call(self, procedure: str, *args, **kwargs) -> Deferred:
+        """
+        Calls a procedure of the robot.
+
+        Args:
+            procedure (str): The URI of the procedure.
+            *args: The positional arguments of the procedure.
+            **kwargs: The keyword arguments of the procedure.
+
+        Returns:
+            Deferred: Fires with the result of the procedure, or fails with an
+            ApplicationError if the procedure does not exist or the call was
+            made to fail.
+        """
+        self.calls.append((self.clock.seconds(), procedure))
+        if procedure not in self.procedures:
+            return self.fail(ApplicationError(ApplicationError.NO_SUCH_PROCEDURE,
+                                              f"no callee registered for procedure <{procedure}>"))
+        if self.random.random() < self.failure_rates.get(procedure, self.failure_rate):
+            self.log(f"{procedure} failed")
+            return self.fail(ApplicationError("wamp.error.runtime_error", f"simulated failure of {procedure}"))
+        try:
+            result, duration = self.procedures[procedure](*args, **kwargs)
+        except ApplicationError as e:
+            return self.fail(e)
+        return self.respond(result, duration)
+
+    def subscribe(self, handler: Callable, topic: str) -> Deferred:
+        """
+        Subscribes a handler to a topic of the robot.
+
+        Returns:
+            Deferred: Fires with the SimulatedSubscription.
+        """
+        subscription = SimulatedSubscription(self, topic, handler)
+        self.subscriptions.setdefault(topic, []).append(subscription)
+        return self.respond(subscription)
+
+    def publish_event(self, topic: str, event) -> None:
+        """
+        Delivers an event to the handlers of a topic, after the one-way latency.
+        """
+        for subscription in list(self.subscriptions.get(topic, [])):
+            self.clock.callLater(self.latency, self.deliver, subscription, event)
+
+    @staticmethod
+    def deliver(subscription: SimulatedSubscription, event) -> None:
+        if subscription.active:
+            subscription.handler(event)
+
+    def show_cards(self, cards: Sequence[int], duration: Optional[float] = None) -> None:
+        """
+        Holds cards in front of the camera.
+
+        Args:
+            cards (Sequence[int]): The numbers of the cards, empty for none.
+            duration (Optional[float]): Seconds after which the cards are taken
+                away, or None to leave them.
+        """
+        self.cards = tuple(cards)
+        self.log(f"cards shown: {list(self.cards)}")
+        if duration is not None:
+            self.clock.callLater(duration, self.hide_cards, self.cards)
+
+    def hide_cards(self, cards: Tuple[int, ...]) -> None:
+        if self.cards == cards:
+            self.cards = ()
+
+    def card_frame(self) -> Dict:
+        # Only the marker id (index 5) of every marker is filled in
+        return {"time": int(self.clock.seconds() * 1000),
+                "data": {"body": [[0, 0, 0, 0, 0, card] for card in self.cards]}}
+
+    def send_card_frame(self) -> None:
+        if self.card_streaming and self.cards:
+            self.publish_event("rie.vision.card.stream", self.card_frame())
+
+    def say(self, text: str = "", lang: Optional[str] = None, **kwargs):
+        self.said.append(text)
+        self.log(f"says: {text}")
+        duration = len(text) / self.speech_rate
+        for listener in self.speech_listeners:
+            self.clock.callLater(duration, listener, text)
+        return None, duration
+
+    def set_language(self, lang: str, **kwargs):
+        self.language = lang
+        return None, 0.0
+
+    def set_native_voice(self, use_native_voice: bool = True, **kwargs):
+        self.native_voice = use_native_voice
+        return None, 0.0
+
+    def write_motors(self, frames: List[Dict], mode: str = "linear", sync: bool = True, force: bool = False,
+                     **kwargs):
+        for frame in frames:
+            for joint, angle in frame["data"].items():
+                if joint not in joints_dic:
+                    raise ApplicationError("wamp.error.invalid_argument", f"{joint} is not a valid joint name")
+                self.joints[joint] = angle
+        duration = max((frame["time"] or 0 for frame in frames), default=0) / 1000
+        return None, duration if sync else 0.0
+
+    def read_joints(self, **kwargs):
+        return [{"time": int(self.clock.seconds() * 1000), "data": dict(self.joints)}], 0.0
+
+    def play_behavior(self, name: str, **kwargs):
+        self.log(f"plays behavior {name}")
+        return None, self.behavior_seconds
+
+    def read_cards(self, **kwargs):
+        return [self.card_frame()], 0.0
+
+    def start_card_stream(self, **kwargs):
+        self.card_streaming = True
+        return None, 0.0
+
+    def close_card_stream(self, **kwargs):
+        self.card_streaming = False
+        return None, 0.0
+
+    def leave(self) -> Deferred:
+        """
+        Stops the simulation, like leaving the session of a real robot.
+        """
+        if self.frames.running:
+            self.frames.stop()
+        return succeed(None)
+
+
+def parse_card_event(text: str) -> CardEvent:
+    """
+    Parses a card event of the command line, "cards:start[:duration]" with
+    the cards separated by "+", e.g. "101:20" or "3+101:20:2".
+    """
+    parts = text.split(":")
+    duration = float(parts[2]) if len(parts) > 2 else 3.0
+    return float(parts[1]), [int(card) for card in parts[0].split("+")], duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the experiment against a simulated robot.")
+    parser.add_argument("--latency", type=float, default=0.03, help="One-way latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra round-trip time in seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Chance that a call fails.")
+    parser.add_argument("--cards", nargs="*", default=[], type=parse_card_event,
+                        help="Cards shown to the camera, as cards:start[:duration], e.g. 0:5 101:20:2.")
+    parser.add_argument("--seed", type=int, help="Seed of the simulated failures.")
+    parser.add_argument("--version", choices=["experiment", "control"],
+                        help="The version of the experiment, VERSION of main.py by default.")
+    parser.add_argument("--skip-intro", action="store_true", help="Skip the introduction.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Use a scripted child, a simulated microphone and a scripted LLM.")
+    args = parser.parse_args()
+
+    import main as experiment
+    from src.simulation.scripted_child import (ScriptedChild, ScriptedTranscriptionBackend, SimulatedMicrophone,
+                                               use_offline_services)
+    from src.speech_processing.speech_session import SpeechRecognitionSession
+    version = args.version or experiment.VERSION
+
+    @inlineCallbacks
+    def run(_):
+        robot = SimulatedRobot(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                               card_script=args.cards, seed=args.seed, verbose=True)
+        speech_recognition_session = None
+        microphone = None
+        if args.offline:
+            use_offline_services()
+            microphone = SimulatedMicrophone(seed=args.seed)
+            transcription_backend = ScriptedTranscriptionBackend()
+            speech_recognition_session = SpeechRecognitionSession(robot, version,
+                                                                  transcription_backend=transcription_backend,
+                                                                  capture_service=microphone)
+            ScriptedChild(robot, experiment.read_sentences(experiment.SENTENCE_FILE), microphone,
+                          transcription_backend, answers=("card", "card", "speech"))
+        start_time = time.perf_counter()
+        try:
+            yield experiment.main(robot, None, version=version, skip_intro=args.skip_intro,
+                                  speech_recognition_session=speech_recognition_session)
+        finally:
+            if microphone is not None:
+                microphone.stop()
+            print(f"Finished after {time.perf_counter() - start_time:.1f} s, {len(robot.calls)} calls")
+
+    task.react(run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Description:
+    This module defines the AudioCaptureService class, which opens the
+    microphone once per session and keeps filling a ring buffer with the
+    captured audio. Recording an utterance then only means marking a start
+    and an end position in the buffer: there is no device-open latency, and
+    audio from just before the recording started is still available.
+    PyAudio delivers the audio on its own thread, which also hands every
+    chunk to thread-safe queues, so consumers never block the reactor.
+    Microphones that cannot capture at the requested sample rate are captured
+    at their default rate and resampled before the audio enters the buffer.
+    get_capture_service returns the capture shared by all speech sessions of
+    the process, so games that follow each other use the same open stream.
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from twisted.internet import reactor
+from src.speech_processing.mic_util import MicUtil
+from src.speech_processing.resampling import Resampler
+
+PA_CONTINUE = 0  # pyaudio.paContinue; PyAudio is only imported by MicUtil, when a microphone is opened
+
+
+class AudioCaptureService:
+    """
+    This class captures audio from a microphone in PyAudio callback mode into
+    a ring buffer of int16 samples. Positions are absolute: they count all
+    samples captured since the service started, so they stay valid while the
+    buffer wraps around.
+    """
+
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 channels: int = 1,
+                 chunk_size: int = 1024,
+                 device_index: int | None = None,
+                 buffer_seconds: int = 90,
+                 capture_sample_rate: int | None = None):
+        self.sample_rate = sample_rate  # The sample rate of the audio in the buffer
+        self.capture_sample_rate = capture_sample_rate  # The sample rate of the microphone, None to choose one
+        self.channels = channels
+        self.chunk_size = chunk_size
+        self.device_index = device_index
+        self.buffer_seconds = buffer_seconds
+        self.buffer = np.zeros(buffer_seconds * sample_rate * channels, dtype=np.int16)
+        self.position = 0
+        self.lock = threading.Lock()
+        self.subscribers: List[queue.Queue] = []
+        self.mic_util = None
+        self.mic_info = None
+        self.stream = None
+        self.resampler = None
+
+    def start(self) -> None:
+        """
+        Opens the microphone and starts capturing. Does nothing if the service
+        is already running.
+        """
+        if self.stream is not None:
+            return
+
+        self.mic_util = MicUtil()
+        mic_info = self.mic_util.choose_mic_device(self.device_index)
+        if self.channels > mic_info['input_channels']:
+            print(
+                f"Requested {self.channels} channels, but the mic supports only {mic_info['input_channels']} channels. "
+                f"Using {mic_info['input_channels']} channels instead."
+            )
+            self.channels = mic_info['input_channels']
+            self.buffer = np.zeros(self.buffer_seconds * self.sample_rate * self.channels, dtype=np.int16)
+
+        capture_sample_rate = self.capture_sample_rate or self.choose_capture_sample_rate(mic_info)
+        if capture_sample_rate != self.sample_rate:
+            print(f"Capturing at {capture_sample_rate} Hz and resampling to {self.sample_rate} Hz.")
+        self.resampler = Resampler(capture_sample_rate, self.sample_rate, self.channels)
+        self.mic_info = mic_info
+        self.open_stream()
+
+    def open_stream(self) -> None:
+        """
+        Opens the stream of the chosen microphone in callback mode with the
+        current chunk size.
+        """
+        import pyaudio
+        self.stream = self.mic_util.p.open(format=pyaudio.paInt16, channels=self.channels,
+                                           rate=self.resampler.input_rate, input=True,
+                                           input_device_index=self.mic_info['index'],
+                                           frames_per_buffer=self.chunk_size, stream_callback=self.on_audio)
+        self.stream.start_stream()
+
+    def set_chunk_size(self, chunk_size: int) -> None:
+        """
+        Changes the number of frames PyAudio delivers per callback. Smaller
+        chunks mean faster reactions, larger chunks less work per second. A
+        running stream is reopened, which loses a few milliseconds of audio,
+        so this should be called between recordings.
+
+        Args:
+            chunk_size (int): The number of frames per chunk.
+        """
+        if chunk_size == self.chunk_size:
+            return
+        self.chunk_size = chunk_size
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.open_stream()
+
+    def choose_capture_sample_rate(self, mic_info: Dict[str, int | str]) -> int:
+        """
+        Chooses the sample rate to open the microphone at: the sample rate of
+        the buffer if the microphone supports it, otherwise its default rate.
+
+        Args:
+            mic_info (Dict[str, int | str]): Information about the selected
+            microphone.
+
+        Returns:
+            int: The sample rate to capture at.
+        """
+        import pyaudio
+        try:
+            self.mic_util.p.is_format_supported(self.sample_rate, input_device=mic_info['index'],
+                                                input_channels=self.channels, input_format=pyaudio.paInt16)
+            return self.sample_rate
+        except ValueError:
+            return mic_info['default_sample_rate']
+
+    def on_audio(self, in_data: bytes, frame_count: int, time_info: dict, status: int):
+        """
+        Called by PyAudio (on its own thread) for every captured chunk.
+        Resamples the chunk if needed, copies it into the ring buffer and
+        passes it on to the subscribers.
+
+        Args:
+            in_data (bytes): The captured int16 samples.
+            frame_count (int): The number of captured frames.
+            time_info (dict): Timing information from PortAudio.
+            status (int): PortAudio status flags.
+
+        Returns:
+            tuple: No output data and the flag to continue capturing.
+        """
+        capture_time = time.monotonic()
+        samples = self.resampler.process(np.frombuffer(in_data, dtype=np.int16))
+        with self.lock:
+            start = self.position % self.buffer.size
+            first_part = min(samples.size, self.buffer.size - start)
+            self.buffer[start:start + first_part] = samples[:first_part]
+            self.buffer[:samples.size - first_part] = samples[first_part:]
+            self.position += samples.size
+            for chunks in self.subscribers:
+                chunks.put((self.position, samples, capture_time))
+        return None, PA_CONTINUE
+
+    def seconds_to_samples(self, seconds: float) -> int:
+        """
+        Converts a duration to a number of (interleaved) samples.
+
+        Args:
+            seconds (float): The duration in seconds.
+
+        Returns:
+            int: The number of samples, a multiple of the channel count.
+        """
+        return int(seconds * self.sample_rate) * self.channels
+
+    def subscribe(self) -> Tuple[queue.Queue, int]:
+        """
+        Starts passing captured chunks to a new queue. Every item is the
+        absolute position after the chunk, the chunk's samples and the
+        time.monotonic() at which it was captured. When the capture stops,
+        None is put on the queue.
+
+        Returns:
+            Tuple[queue.Queue, int]: The queue and the position at which it
+            starts receiving chunks.
+        """
+        chunks = queue.Queue()
+        with self.lock:
+            self.subscribers.append(chunks)
+            return chunks, self.position
+
+    def unsubscribe(self, chunks: queue.Queue) -> None:
+        """
+        Stops passing captured chunks to a queue.
+
+        Args:
+            chunks (queue.Queue): The queue returned by subscribe.
+        """
+        with self.lock:
+            if chunks in self.subscribers:
+                self.subscribers.remove(chunks)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """
+        Copies the samples between two absolute positions out of the ring
+        buffer. Samples that were already overwritten are skipped.
+
+        Args:
+            start (int): The absolute start position.
+            end (int): The absolute end position.
+
+        Returns:
+            np.ndarray: The int16 samples.
+        """
+        with self.lock:
+            start = max(start, self.position - self.buffer.size, 0)
+            end = min(end, self.position)
+            if end <= start:
+                return np.zeros(0, dtype=np.int16)
+            offset = start % self.buffer.size
+            length = end - start
+            if offset + length <= self.buffer.size:
+                return self.buffer[offset:offset + length].copy()
+            return np.concatenate((self.buffer[offset:], self.buffer[:offset + length - self.buffer.size]))
+
+    def stop(self) -> None:
+        """
+        Stops capturing and releases the microphone.
+        """
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.mic_util is not None:
+            self.mic_util.p.terminate()
+            self.mic_util = None
+        with self.lock:
+            for chunks in self.subscribers:
+                chunks.put(None)
+            self.subscribers = []
+
+
+_capture_service = None
+
+
+def get_capture_service() -> AudioCaptureService:
+    """
+    Returns the capture shared by all speech sessions, creating it the first
+    time it is needed. The microphone is opened once per process and
+    released when the reactor shuts down, so no session has to stop it.
+
+    Returns:
+        AudioCaptureService: The shared capture service.
+    """
+    global _capture_service
+    if _capture_service is None:
+        _capture_service = AudioCaptureService()
+        reactor.addSystemEventTrigger("before", "shutdown", _capture_service.stop)
+    return _capture_service
@@ -2,11 +2,11 @@
 Description:
     This module provides utility functions for working with microphones using
     the PyAudio library. It allows the listing of available microphones and
-    selecting a specific one.
+    selecting a specific one. PyAudio is only imported when a microphone is
+    opened, so the rest of the speech processing also works without it.
 """
 
 from typing import Dict, List
-import pyaudio
 
 
 class MicUtil:
@@ -17,6 +17,10 @@ class MicUtil:
     """
 
     def __init__(self):
+        try:
+            import pyaudio
+        except ImportError as e:
+            raise ImportError("Capturing from a microphone needs PyAudio: pip install pyaudio") from e
         self.p = pyaudio.PyAudio()
 
     def list_available_mics(self) -> List[Dict[str, int | str]]:
@@ -44,7 +48,8 @@ class MicUtil:
                 available_mics.append({
                     'index': i,
                     'name': device_info['name'],
-                    'input_channels': device_info['maxInputChannels']
+                    'input_channels': device_info['maxInputChannels'],
+                    'default_sample_rate': int(device_info['defaultSampleRate'])
                 })
 
         if not available_mics:
@@ -0,0 +1,240 @@
+"""
+Description:
+    This module defines the PronounRecognizer class, a closed-vocabulary
+    recognizer for the answers in the pronoun game. A short clip is
+    classified as one of the seven pronouns or as "other" by comparing its
+    log-mel features with recorded templates of every pronoun using dynamic
+    time warping. This takes a few milliseconds, so open-vocabulary
+    transcription is only needed when the recognizer is not confident.
+
+    The templates are recorded once per setup (ideally by a few children):
+        python -m src.speech_processing.pronoun_recognizer --repeats 3
+    No templates ship with the repository. Until they are recorded, the
+    recognizer has nothing to compare with and every spoken answer is
+    transcribed.
+"""
+
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from src.speech_processing.vad import find_speech_bounds
+
+PRONOUNS = ('hij', 'hem', 'zijn', 'zij', 'haar', 'hen', 'hun')
+OTHER = "other"
+PRONOUN_TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "pronoun_templates.npz")
+
+
+def mel_filterbank(sample_rate: int, n_fft: int, n_mels: int, low_hz: float = 80.0,
+                   high_hz: float = 7600.0) -> np.ndarray:
+    """
+    Builds triangular filters that are spaced evenly on the mel scale.
+
+    Args:
+        sample_rate (int): The sample rate of the audio.
+        n_fft (int): The FFT size.
+        n_mels (int): The number of filters.
+        low_hz (float): The lowest frequency covered.
+        high_hz (float): The highest frequency covered.
+
+    Returns:
+        np.ndarray: The filters, shape (n_mels, n_fft // 2 + 1).
+    """
+    to_mel = lambda hz: 2595 * np.log10(1 + hz / 700)
+    to_hz = lambda mel: 700 * (10 ** (mel / 2595) - 1)
+    edges = to_hz(np.linspace(to_mel(low_hz), to_mel(min(high_hz, sample_rate / 2)), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    return np.maximum(0, np.minimum((bins - lower) / (center - lower), (upper - bins) / (upper - center)))
+
+
+def dtw_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Computes the dynamic time warping distance between two feature
+    sequences. The path may only take steps of (1, 1), (1, 2) and (2, 1), so
+    one sequence is stretched by at most a factor two, and every row of the
+    cost matrix only depends on the rows before it, which lets each row be
+    computed in one vectorized step.
+
+    Args:
+        a (np.ndarray): The first sequence, shape (frames, features).
+        b (np.ndarray): The second sequence, shape (frames, features).
+
+    Returns:
+        float: The cost of the best path divided by the total length of the
+        sequences, or infinity if their lengths differ more than a factor
+        two.
+    """
+    n, m = len(a), len(b)
+    if n == 0 or m == 0 or n > 2 * m or m > 2 * n:
+        return np.inf
+
+    cost = np.sqrt(np.maximum(0, (a * a).sum(1)[:, None] + (b * b).sum(1)[None, :] - 2 * a @ b.T))
+    # The cell (i, j) is stored at [i + 2, j + 2], so the steps back stay inside the padding
+    total = np.full((n + 2, m + 2), np.inf)
+    total[2, 2] = cost[0, 0]
+    for i in range(1, n):
+        total[i + 2, 2:] = cost[i] + np.minimum(np.minimum(total[i + 1, 1:m + 1], total[i + 1, 0:m]),
+                                                total[i, 1:m + 1])
+    return float(total[n + 1, m + 1] / (n + m))
+
+
+class PronounRecognizer:
+    """
+    This class classifies short clips as one of the pronouns or "other" by
+    comparing them with recorded templates.
+    """
+
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 labels: Sequence[str] = PRONOUNS,
+                 templates_path: str = PRONOUN_TEMPLATES_PATH,
+                 min_confidence: float = 0.2,
+                 n_mels: int = 26):
+        self.sample_rate = sample_rate
+        self.labels = tuple(labels)
+        self.templates_path = templates_path
+        self.min_confidence = min_confidence  # Below this, the answer should be transcribed instead
+        self.window = sample_rate * 25 // 1000
+        self.hop = sample_rate * 10 // 1000
+        self.n_fft = 1 << (self.window - 1).bit_length()
+        self.filterbank = mel_filterbank(sample_rate, self.n_fft, n_mels)
+        self.hamming = np.hamming(self.window)
+        self.templates: List[Tuple[str, np.ndarray]] = []
+        self.max_distance: Optional[float] = None  # Clips further from every template are "other"
+
+        if os.path.exists(templates_path):
+            self.load(templates_path)
+        else:
+            print(f"No pronoun templates at {templates_path}, every spoken answer will be transcribed. "
+                  f"Record them with: python -m src.speech_processing.pronoun_recognizer")
+
+    def features(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Computes the log-mel features of the spoken part of a clip, with the
+        mean of every band removed so the microphone and the room matter
+        less.
+
+        Args:
+            samples (np.ndarray): The int16 mono samples.
+
+        Returns:
+            np.ndarray: The features, shape (frames, bands).
+        """
+        bounds = find_speech_bounds(samples, self.sample_rate, silence_thresh=-45, min_silence_len=100)
+        if bounds is not None:
+            samples = samples[bounds[0]:bounds[1]]
+        if samples.size < self.window:
+            return np.zeros((0, self.filterbank.shape[0]))
+
+        frames = sliding_window_view(samples.astype(np.float32) / 32768.0, self.window)[::self.hop] * self.hamming
+        power = np.abs(np.fft.rfft(frames, self.n_fft)) ** 2
+        log_mel = np.log(power @ self.filterbank.T + 1e-10)
+        return log_mel - log_mel.mean(axis=0)
+
+    def enroll(self, label: str, samples: np.ndarray) -> None:
+        """
+        Adds a recording of a label as a template.
+
+        Args:
+            label (str): The pronoun, or "other" for words that are not.
+            samples (np.ndarray): The int16 mono samples of the recording.
+        """
+        if label not in self.labels and label != OTHER:
+            raise ValueError(f"Invalid label: {label}. Must be one of {', '.join(self.labels + (OTHER,))}.")
+        self.templates.append((label, self.features(samples)))
+
+    def calibrate(self) -> None:
+        """
+        Sets the rejection distance from the distances between templates of
+        the same label: a clip that is much further from every template than
+        recordings of the same pronoun are from each other, is "other".
+        """
+        distances = [dtw_distance(a, b)
+                     for i, (label_a, a) in enumerate(self.templates)
+                     for label_b, b in self.templates[i + 1:] if label_a == label_b and label_a != OTHER]
+        distances = [distance for distance in distances if np.isfinite(distance)]
+        self.max_distance = 1.5 * float(np.percentile(distances, 90)) if distances else None
+
+    def classify(self, samples: np.ndarray) -> Tuple[str, float]:
+        """
+        Classifies a clip.
+
+        Args:
+            samples (np.ndarray): The int16 mono samples of the clip.
+
+        Returns:
+            Tuple[str, float]: The pronoun or "other", and the confidence
+            between 0 and 1: how much closer the best label is than the
+            second best.
+        """
+        features = self.features(samples)
+        best_distances: Dict[str, float] = {}
+        for label, template in self.templates:
+            best_distances[label] = min(best_distances.get(label, np.inf), dtw_distance(features, template))
+
+        ranked = sorted(best_distances.items(), key=lambda item: item[1])
+        if not ranked or not np.isfinite(ranked[0][1]):
+            return OTHER, 0.0
+
+        label, distance = ranked[0]
+        second_distance = ranked[1][1] if len(ranked) > 1 else np.inf
+        confidence = 1.0 - distance / second_distance if np.isfinite(second_distance) else 1.0
+        if self.max_distance is not None and distance > self.max_distance:
+            return OTHER, min(1.0, distance / self.max_distance - 1.0)
+        return label, confidence
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Writes the templates and the rejection distance to a file.
+
+        Args:
+            path (Optional[str]): The file, by default the templates path.
+        """
+        arrays = {f"template_{i}": features for i, (_, features) in enumerate(self.templates)}
+        np.savez_compressed(path or self.templates_path, labels=np.array([label for label, _ in self.templates]),
+                            max_distance=np.array(np.nan if self.max_distance is None else self.max_distance),
+                            **arrays)
+
+    def load(self, path: str) -> None:
+        """
+        Reads templates and the rejection distance from a file.
+
+        Args:
+            path (str): The file written by save.
+        """
+        with np.load(path) as data:
+            self.templates = [(str(label), data[f"template_{i}"]) for i, label in enumerate(data["labels"])]
+            max_distance = float(data["max_distance"])
+            self.max_distance = None if np.isnan(max_distance) else max_distance
+
+
+def main() -> None:
+    from src.speech_processing.speech_to_text import SpeechToText
+
+    parser = argparse.ArgumentParser(description="Record the templates of the pronoun recognizer.")
+    parser.add_argument("--repeats", type=int, default=3, help="Recordings per pronoun.")
+    parser.add_argument("--other", type=int, default=3, help="Recordings of words that are not pronouns.")
+    parser.add_argument("--output", default=PRONOUN_TEMPLATES_PATH, help="Path of the templates file.")
+    args = parser.parse_args()
+
+    speech_to_text = SpeechToText()
+    speech_to_text.start_capture()
+    recognizer = PronounRecognizer(speech_to_text.sample_rate, templates_path=args.output)
+    recordings = [label for label in PRONOUNS for _ in range(args.repeats)] + [OTHER] * args.other
+    for label in recordings:
+        prompt = "any word that is not a pronoun" if label == OTHER else f"'{label}'"
+        input(f"Press enter and say {prompt}.")
+        samples = speech_to_text.record_audio(phase="pronoun")
+        if samples is not None:
+            recognizer.enroll(label, samples)
+    speech_to_text.stop_capture()
+
+    recognizer.calibrate()
+    recognizer.save(args.output)
+    print(f"Saved {len(recognizer.templates)} templates to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Description:
+    This module defines the Resampler class, which converts a stream of int16
+    samples from the sample rate of the microphone to the sample rate the
+    recordings are kept at (16 kHz by default, which is all speech
+    recognition needs). The stream is low-pass filtered with a windowed-sinc
+    filter to prevent aliasing and then linearly interpolated. The filter
+    history and the fractional position are kept between chunks, so chunks of
+    any size can be resampled without clicks at the chunk borders.
+"""
+
+import numpy as np
+
+
+class Resampler:
+    """
+    This class resamples a stream of interleaved int16 samples chunk by
+    chunk.
+    """
+
+    def __init__(self, input_rate: int, output_rate: int, channels: int = 1, taps: int = 63):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        self.step = input_rate / output_rate  # Input samples per output sample
+
+        # Windowed-sinc low-pass filter, cutting off just below the Nyquist frequency of the output rate
+        cutoff = 0.45 * min(input_rate, output_rate) / input_rate
+        n = np.arange(taps) - (taps - 1) / 2
+        self.filter = (2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)).astype(np.float32)
+        self.filter /= self.filter.sum()
+
+        self.history = np.zeros((taps - 1, channels), dtype=np.float32)  # The last input samples of the previous chunk
+        self.previous = np.zeros((1, channels), dtype=np.float32)  # The last filtered sample of the previous chunk
+        self.position = 0.0  # Where the next output sample lies, counted from the previous filtered sample
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resamples the next chunk of the stream.
+
+        Args:
+            samples (np.ndarray): The next int16 samples at the input rate,
+                interleaved if there are several channels.
+
+        Returns:
+            np.ndarray: The int16 samples at the output rate, interleaved if
+            there are several channels.
+        """
+        if self.input_rate == self.output_rate or samples.size == 0:
+            return samples
+
+        chunk = samples.reshape(-1, self.channels).astype(np.float32)
+        extended = np.concatenate((self.history, chunk))
+        filtered = np.stack([np.convolve(extended[:, channel], self.filter, mode="valid")
+                             for channel in range(self.channels)], axis=1)
+        self.history = extended[extended.shape[0] - self.history.shape[0]:]
+
+        # Interpolate between the filtered samples, including the last one of the previous chunk
+        signal = np.concatenate((self.previous, filtered))
+        last = signal.shape[0] - 1
+        count = int((last - self.position) // self.step) + 1 if self.position <= last else 0
+        positions = self.position + np.arange(count) * self.step
+        index = np.minimum(positions.astype(int), last - 1)
+        fraction = (positions - index)[:, None]
+        output = signal[index] * (1 - fraction) + signal[index + 1] * fraction
+
+        self.position += count * self.step - last
+        self.previous = signal[-1:]
+        return np.clip(np.round(output), -32768, 32767).astype(np.int16).reshape(-1)
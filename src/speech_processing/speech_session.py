@@ -4,12 +4,16 @@ Description:
     handling speech recognition, user interaction, and providing feedback.
 """
 
-import os
+import threading
 from typing import Generator, Optional
+from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
+from src.reactor_load import get_reactor_load_monitor
+from src.speech_processing.capture_service import get_capture_service
 from src.speech_processing.speech_to_text import SpeechToText
+from src.speech_processing.pronoun_recognizer import OTHER, PronounRecognizer
 from src.robot_responses.responses import say_normally
-from src.utils import generate_message_using_llm
 #from src.language_feedback.language_assistant import LanguageAssistant
 
 
@@ -19,15 +23,28 @@ class SpeechRecognitionSession:
     for input, detecting prolonged silence, and responding accordingly.
     """
 
-    def __init__(self, session, version):
+    def __init__(self, session, version, streaming=True, transcription_backend="openai", capture_service=None):
         if version not in {"experiment", "control"}:
             raise ValueError(f"Invalid version: {version}. Must be 'experiment' or 'control'.")
 
         self.session = session
         self.version = version
         self.get_feedback = (self.version == "experiment")
-        self.processor = SpeechToText()
+        # All sessions share one microphone, which stays open until the reactor shuts down
+        if capture_service is None:
+            capture_service = get_capture_service()
+        self.processor = SpeechToText(transcription_backend=transcription_backend, capture_service=capture_service)
+        self.processor.start_capture()
+        # Loading a local model takes seconds, so it is done in a thread; recordings wait for it
+        self.warmed_up = deferToThread(self.processor.transcription_backend.warm_up)
+        self.warmed_up.addErrback(lambda failure: print("Warming up the transcription backend failed:",
+                                                        failure.getErrorMessage()))
         self.praise_streak = 0
+        self.streaming = streaming  # Transcribe while the child is speaking instead of after the recording
+        self.partial_transcript = ""
+        self.pronoun_recognizer: Optional[PronounRecognizer] = None  # Created at the first spoken pronoun
+        self.pronoun_recognizer_lock = threading.Lock()
+        self.reactor_load = get_reactor_load_monitor()  # The capture chunk size follows the load of the reactor
 
     # @inlineCallbacks
     # def validate_user_input(
@@ -106,17 +123,102 @@ class SpeechRecognitionSession:
             yield say_normally(self.session, silence_message)
 
     @inlineCallbacks
-    def recognize_speech(self) -> Generator[None, None, Optional[str]]:
-        recorded_audio_path = yield self.processor.record_audio()
-        if recorded_audio_path:
-            transcription_result = yield self.processor.process_audio(recorded_audio_path, self.version)
+    def recognize_speech(self, phase: str = "conversation") -> Generator[None, None, Optional[str]]:
+        """
+        Records an utterance and transcribes it. Recording and transcription
+        run in threads, so the reactor keeps handling WAMP traffic meanwhile.
+        When streaming, the utterance is transcribed while the child is still
+        speaking and partial transcripts are passed to on_partial_transcript.
+
+        Args:
+            phase (str): The game phase, which decides how long a pause ends
+            the answer (see ENDPOINTING_PRESETS).
+
+        Returns:
+            Optional[str]: The transcription, or None if nothing was heard.
+
+        Yields:
+            Deferred: Fires when the transcription backend is ready, when the
+            end of the utterance is detected, and again when the transcription
+            is done.
+        """
+        yield self.warmed_up
+        self.processor.adapt_chunk_size(self.reactor_load.lag)
+        if self.streaming:
+            self.partial_transcript = ""
+            transcription_result = yield deferToThread(self.processor.transcribe_streaming, self.version,
+                                                       lambda text: reactor.callFromThread(self.on_partial_transcript, text),
+                                                       phase)
+            if transcription_result:
+                print("Transcription:", transcription_result)
+            return transcription_result
+
+        recorded_samples = yield deferToThread(self.processor.record_audio, phase=phase)
+        if recorded_samples is not None:
+            transcription_result = yield deferToThread(self.processor.process_audio, recorded_samples, self.version)
             if transcription_result:
                 print("Transcription:", transcription_result)
-                if os.path.exists(recorded_audio_path):
-                    os.remove(recorded_audio_path)
                 return transcription_result
-            
-            if os.path.exists(recorded_audio_path):
-                os.remove(recorded_audio_path)
 
         return None
+
+    @inlineCallbacks
+    def recognize_pronoun(self) -> Generator[None, None, Optional[str]]:
+        """
+        Records a spoken pronoun and classifies it with the pronoun
+        recognizer, which takes milliseconds. Only when the recognizer is not
+        confident (or has no templates), the recording is transcribed. A short
+        pause ends the answer, as pronoun answers are a single word.
+
+        Returns:
+            Optional[str]: The recognized pronoun, the transcription if the
+            recognizer was not confident, or None if nothing was heard.
+
+        Yields:
+            Deferred: Fires when the transcription backend is ready, when the
+            end of the utterance is detected, and again when the answer is
+            classified or transcribed.
+        """
+        yield self.warmed_up
+        self.processor.adapt_chunk_size(self.reactor_load.lag)
+        recorded_samples = yield deferToThread(self.processor.record_audio, phase="pronoun")
+        if recorded_samples is None:
+            return None
+
+        pronoun_recognizer = yield deferToThread(self.get_pronoun_recognizer)
+        if pronoun_recognizer.templates:  # Without recorded templates, every answer is transcribed
+            pronoun, confidence = yield deferToThread(pronoun_recognizer.classify, recorded_samples)
+            print(f"Pronoun recognizer: {pronoun} ({confidence:.2f})")
+            if pronoun != OTHER and confidence >= pronoun_recognizer.min_confidence:
+                return pronoun
+
+        transcription_result = yield deferToThread(self.processor.process_audio, recorded_samples, self.version)
+        if transcription_result:
+            print("Transcription:", transcription_result)
+            return transcription_result
+        return None
+
+    def get_pronoun_recognizer(self) -> PronounRecognizer:
+        """
+        Returns the pronoun recognizer, creating it the first time it is
+        needed. Creating it loads the templates from disk, so this is called
+        in a thread; the lock makes sure only one recognizer is created.
+
+        Returns:
+            PronounRecognizer: The pronoun recognizer of the session.
+        """
+        with self.pronoun_recognizer_lock:
+            if self.pronoun_recognizer is None:
+                self.pronoun_recognizer = PronounRecognizer(self.processor.sample_rate)
+            return self.pronoun_recognizer
+
+    def on_partial_transcript(self, text: str) -> None:
+        """
+        Called on the reactor thread with the transcript so far while the
+        child is still speaking.
+
+        Args:
+            text (str): The partial transcript.
+        """
+        self.partial_transcript = text
+        print("Partial transcription:", text)
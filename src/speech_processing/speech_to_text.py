@@ -1,152 +1,332 @@
+import io
+import itertools
 import os
-import wave
+import queue
+import threading
 import time
-from typing import Any, Dict, Generator, Optional, Tuple
-import pyaudio
+import wave
+from concurrent import futures
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
 import numpy as np
-from openai import OpenAI
-from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
-from src.speech_processing.mic_util import MicUtil
-
-
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set. Please set it in your environment variables.")
-
-client = OpenAI(api_key=API_KEY)
+from src.moderation.moderation_client import LatencyHistogram
+from src.speech_processing.capture_service import AudioCaptureService
+from src.speech_processing.vad import VoiceActivityDetector, find_speech_bounds
+from src.speech_processing.stt_backends import TranscriptionBackend, create_transcription_backend
+
+# The soundfile format, subtype and file extension of every upload format
+UPLOAD_FORMATS: Dict[str, Tuple[str | None, str | None, str]] = {
+    "wav": (None, None, "wav"),
+    "flac": ("FLAC", "PCM_16", "flac"),
+    "opus": ("OGG", "OPUS", "ogg")
+}
+
+# When to stop recording, per game phase: the seconds of silence after the end of speech, the seconds to wait for
+# speech at all and the maximum length of an answer
+ENDPOINTING_PRESETS: Dict[str, Dict[str, float]] = {
+    "pronoun": {"speech_end_silence": 0.8, "no_speech_timeout": 10, "max_recording_seconds": 5},
+    # Kids might speak slower, especially when trying to speak English, and pause for a word halfway through an
+    # answer. The long silence costs little: with streaming, the last segment is already being transcribed during it
+    "conversation": {"speech_end_silence": 3.0, "no_speech_timeout": 20, "max_recording_seconds": 60}
+}
+
+# Segments shorter than this are merged with the next one before they are transcribed: a single word on its own is
+# often transcribed wrongly and costs a request of its own
+MIN_SEGMENT_SECONDS = 1.0
+
+# The chunk size to capture with for the measured reactor lag: small chunks when the reactor is idle, larger ones
+# (less work per second in the capture threads) when it is busy
+CHUNK_SIZES_BY_REACTOR_LAG: Tuple[Tuple[float, int], ...] = ((0.005, 256), (0.02, 512), (0.05, 1024))
+MAX_CHUNK_SIZE = 2048
 
 
 class SpeechToText:
     def __init__(self,
-                 silence_threshold: int = 2500,
-                 sample_rate: int = 44100,
+                 vad_threshold_db: float = 12.0,
+                 sample_rate: int = 16000,
                  channels: int = 1,
                  chunk_size: int = 1024,
-                 device_index: int | None = None):
-        self.silence_threshold = silence_threshold  # Depends on how noisy the room is
-        self.sample_rate = sample_rate
-        self.channels = channels
+                 device_index: int | None = None,
+                 max_recording_seconds: int = 60,
+                 archive_audio: bool = False,
+                 preroll_seconds: float = 0.3,
+                 capture_sample_rate: int | None = None,
+                 upload_format: str = "wav",
+                 transcription_backend: str | TranscriptionBackend = "openai",
+                 capture_service: AudioCaptureService | None = None):
+        if upload_format not in UPLOAD_FORMATS:
+            raise ValueError(f"Invalid upload format: {upload_format}. Must be one of {', '.join(UPLOAD_FORMATS)}.")
+
+        self.vad_threshold_db = vad_threshold_db  # How far above the noise floor of the room speech has to be
+        self.sample_rate = sample_rate  # Speech recognition needs no more than 16 kHz
         self.chunk_size = chunk_size
         self.device_index = device_index
-        self.mic_util = MicUtil()
-        self.extra_frames = 100
-
-    def choose_mic(self) -> Dict[str, int | str]:
+        self.max_recording_seconds = max_recording_seconds
+        self.archive_audio = archive_audio  # Only write recordings to disk when they should be kept
+        self.preroll_seconds = preroll_seconds  # Audio kept from before the recording started, so the first syllable is not lost
+        self.upload_format = upload_format  # FLAC and Opus make the upload smaller, but need the soundfile package
+        # The microphone is opened once and keeps filling a ring buffer, recordings are positions in that buffer
+        if isinstance(transcription_backend, str):
+            transcription_backend = create_transcription_backend(transcription_backend, self.encode_audio)
+        self.transcription_backend = transcription_backend
+        self.endpoint_delays = LatencyHistogram()  # How long after the end of speech recordings stopped
+        self.last_endpoint_delay = None
+        self.noise_floor_db: Optional[float] = None  # The noise floor at the end of the previous recording
+        # Segments of an utterance are transcribed in parallel while the recording goes on
+        self.transcription_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="transcription")
+        if capture_service is None:  # Another capture service stands in for the microphone, e.g. in the simulation
+            capture_service = AudioCaptureService(sample_rate, channels, chunk_size, device_index,
+                                                  buffer_seconds=max_recording_seconds + 30,
+                                                  capture_sample_rate=capture_sample_rate)
+        self.capture_service = capture_service
+
+    @property
+    def channels(self) -> int:
+        return self.capture_service.channels
+
+    def start_capture(self) -> None:
+        """
+        Opens the microphone and starts filling the ring buffer. Called once
+        per session; recording without calling it first starts the capture
+        on the first recording.
         """
-        Selects the microphone device based on the provided index.
+        self.capture_service.start()
 
-        Returns:
-            Dict[str, int | str]: The microphone device info.
+    def stop_capture(self) -> None:
+        """
+        Stops the capture and releases the microphone.
         """
-        return self.mic_util.choose_mic_device(self.device_index)
+        self.capture_service.stop()
 
-    def setup_audio_stream(self, mic_info: Dict[str, int | str]) -> Tuple[pyaudio.PyAudio, pyaudio.Stream]:
+    def save_audio(self, samples: np.ndarray, output_filename: str) -> Optional[str]:
         """
-        Sets up the audio stream for recording.
+        Saves recorded samples to an audio file. This is only needed to
+        archive recordings, transcription works on the samples in memory.
 
         Args:
-            mic_info (Dict[str, int | str]): Information about the selected
-            microphone.
+            samples (np.ndarray): The int16 audio samples to be saved.
+            output_filename (str): The name of the output file to save the
+                audio.
 
         Returns:
-            Tuple[pyaudio.PyAudio, pyaudio.Stream]: A tuple containing the
-            audio interface (PyAudio) and the audio stream for recording.
+            Optional[str]: The path to the saved audio file, or None if there
+            are no samples.
         """
-        audio_interface = pyaudio.PyAudio()
+        if samples.size == 0:
+            print("No audio was recorded. Skipping saving.")
+            return None
 
-        if self.channels > mic_info['input_channels']:
-            print(
-                f"Requested {self.channels} channels, but the mic supports only {mic_info['input_channels']} channels. "
-                f"Using {mic_info['input_channels']} channels instead."
-            )
-            self.channels = mic_info['input_channels']
+        audio_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), output_filename)
+        with open(audio_path, "wb") as audio_file:
+            audio_file.write(self.to_wav(samples).getbuffer())
 
-        stream = audio_interface.open(format=pyaudio.paInt16, channels=self.channels, rate=self.sample_rate, input=True,
-                                      input_device_index=mic_info['index'], frames_per_buffer=self.chunk_size)
-        return audio_interface, stream
+        print(f"Audio recorded and saved to {audio_path}")
+        return audio_path
 
-    def save_audio(self, frames: list, output_filename: str) -> Optional[str]:
+    def to_wav(self, samples: np.ndarray) -> io.BytesIO:
         """
-        Saves the recorded frames to an audio file.
+        Encodes samples as a WAV file in memory.
 
         Args:
-            frames (list): The audio frames to be saved.
-            output_filename (str): The name of the output file to save the
-                audio.
+            samples (np.ndarray): The int16 audio samples.
 
         Returns:
-            Optional[str]: The path to the saved audio file, or None if the
-            file is empty.
+            io.BytesIO: The WAV file, positioned at the start.
         """
-        audio_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), output_filename)
-        with wave.open(audio_path, 'wb') as wf:
+        wav_file = io.BytesIO()
+        with wave.open(wav_file, 'wb') as wf:
             wf.setnchannels(self.channels)
-            wf.setsampwidth(pyaudio.PyAudio().get_sample_size(pyaudio.paInt16))
+            wf.setsampwidth(np.dtype(np.int16).itemsize)
             wf.setframerate(self.sample_rate)
-            wf.writeframes(b''.join(frames))
+            wf.writeframes(memoryview(samples))
+        wav_file.seek(0)
+        wav_file.name = "speech.wav"  # The transcription API derives the format from the file name
+        return wav_file
 
-        if os.path.getsize(audio_path) == 0:
-            print("No audio was recorded. Skipping transcription.")
-            return None
+    def encode_audio(self, samples: np.ndarray) -> io.BytesIO:
+        """
+        Encodes samples in the upload format. FLAC (lossless) and Opus
+        (lossy, but made for speech) are encoded with the soundfile package;
+        if it is not installed, the samples are sent as WAV instead.
 
-        print(f"Audio recorded and saved to {audio_path}")
-        return audio_path
+        Args:
+            samples (np.ndarray): The int16 audio samples.
 
-    def record_audio(self, output_filename: str = "recorded_speech.wav") -> Optional[str]:
+        Returns:
+            io.BytesIO: The encoded file, positioned at the start.
         """
-        Records audio from the microphone and saves it to a file.
+        if self.upload_format == "wav":
+            return self.to_wav(samples)
+
+        try:
+            import soundfile
+        except ImportError:
+            print(f"The soundfile package is not installed, uploading WAV instead of {self.upload_format}.")
+            return self.to_wav(samples)
+
+        file_format, subtype, extension = UPLOAD_FORMATS[self.upload_format]
+        encoded_file = io.BytesIO()
+        soundfile.write(encoded_file, samples.reshape(-1, self.channels), self.sample_rate,
+                        format=file_format, subtype=subtype)
+        encoded_file.seek(0)
+        encoded_file.name = f"speech.{extension}"
+        return encoded_file
+
+    def adapt_chunk_size(self, reactor_lag: float) -> None:
+        """
+        Chooses the capture chunk size for the measured reactor lag. The
+        capture is only changed at the start of the next recording: reopening
+        the stream waits for PortAudio, which must not happen on the reactor
+        thread.
 
         Args:
-            output_filename (str): The name of the output file to save the
-            audio.
+            reactor_lag (float): The smoothed reactor lag in seconds.
+        """
+        chunk_size = next((size for max_lag, size in CHUNK_SIZES_BY_REACTOR_LAG if reactor_lag <= max_lag),
+                          MAX_CHUNK_SIZE)
+        if chunk_size != self.chunk_size:
+            print(f"Reactor lag is {reactor_lag * 1000:.1f} ms, capturing in chunks of {chunk_size} frames.")
+        self.chunk_size = chunk_size
 
-        Returns:
-            Optional[str]: The path to the saved audio file, or None if no
-            audio was recorded.
+    def record_audio(self, output_filename: str = "recorded_speech.wav",
+                     on_segment: Optional[Callable[[int, int], None]] = None,
+                     phase: str = "conversation") -> Optional[np.ndarray]:
         """
-        mic_info = self.choose_mic()
-        audio_interface, stream = self.setup_audio_stream(mic_info)
+        Records an utterance from the running capture. The recording starts
+        at the current position in the ring buffer (minus the preroll) and
+        ends when the speaker has been silent for a while after the end of
+        speech, as decided by the voice activity detector. How long depends
+        on the game phase. The noise floor of the detector is learned from
+        the audio captured just before the recording, leaving out frames as
+        loud as speech (usually the robot's question). All timing is based on
+        the captured audio, not on the wall clock, except for a guard against
+        a microphone that stops delivering audio without the capture being
+        stopped. The recording is only written to a file when archive_audio
+        is set. A chunk size chosen by adapt_chunk_size is applied before the
+        recording starts.
+
+        When the recording stops because speech ended, the time from the
+        end of speech to the moment the recording stopped is added to
+        endpoint_delays.
+
+        Every stretch of speech between two pauses is a segment. As soon as
+        the voice activity detector ends a segment, on_segment is called with
+        its start and end position in the capture, so it can be processed
+        while the recording goes on.
+
+        This blocks until the end of the utterance, so it must not be called
+        on the reactor thread; use deferToThread.
+
+        Args:
+            output_filename (str): The name of the file to archive the audio
+            to.
+            on_segment (Optional[Callable[[int, int], None]]): Called (on
+            this thread) with the start and end position of every segment.
+            phase (str): The game phase, a key of ENDPOINTING_PRESETS.
 
-        frames = []
-        start_time = time.time()
-        last_sound_time = start_time
+        Returns:
+            Optional[np.ndarray]: The recorded int16 samples, or None if no
+            audio was recorded or the microphone stalled.
+        """
+        capture = self.capture_service
+        capture.set_chunk_size(self.chunk_size)  # Chosen by adapt_chunk_size, applied here between recordings
+        capture.start()
+
+        endpointing = ENDPOINTING_PRESETS[phase]
+        chunks, position = capture.subscribe()
+        vad = VoiceActivityDetector(self.sample_rate, self.channels, threshold_db=self.vad_threshold_db)
+        noise_samples = capture.read(position - capture.seconds_to_samples(vad.noise_window_seconds), position)
+        # The end of the robot's question is usually in the audio before the recording, so frames that would be speech
+        # over the noise floor of the previous recording are not learned from
+        vad.prime(noise_samples, None if self.noise_floor_db is None else self.noise_floor_db + self.vad_threshold_db)
+        # Where the detector's count of samples starts, as if it had seen the frames it learned from right before now
+        vad_start = position - vad.frame_count * vad.frame_length * self.channels
+        preroll = capture.seconds_to_samples(self.preroll_seconds)
+        start_position = max(0, position - preroll)
+        max_seconds = min(endpointing["max_recording_seconds"], self.max_recording_seconds)
+        max_position = position + capture.seconds_to_samples(max_seconds)
+        speech_end_silence = capture.seconds_to_samples(endpointing["speech_end_silence"])
+        no_speech_timeout = capture.seconds_to_samples(endpointing["no_speech_timeout"])
+        # Without audio for this long, the device has stalled and the recording would never end
+        stall_timeout = endpointing["no_speech_timeout"] + max_seconds
+        last_chunk_time = time.monotonic()
+        stalled = False
+        last_sound_position = position
         speech_detected = False
-        while True:
-            print("I am recording")
-            data = stream.read(self.chunk_size)
-            frames.append(data)
-
-            audio_data = np.frombuffer(data, dtype=np.int16)
-            amplitude = np.max(np.abs(audio_data))
-
-            if amplitude > self.silence_threshold:
-                print("Speech detected.")
-                speech_detected = True
-                last_sound_time = time.time()
-            elif time.time() - last_sound_time > 3 and speech_detected:  # Kids might speak slower, especially when trying to speak English
-                print("Speech has ended, stopping recording.")
-                break
-            elif time.time() - last_sound_time > 20:
-                print("No speech detected at all. Stopped recording")
-                break
-
-        stream.stop_stream()
-        stream.close()
-        audio_interface.terminate()
-
-        audio_path = self.save_audio(frames, output_filename)
-        return audio_path
+        segment_start = None
+        previous_segment_end = start_position
+        print("I am recording")
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=1.0)
+                except queue.Empty:
+                    if time.monotonic() - last_chunk_time > stall_timeout:
+                        print(f"No audio from the microphone for {stall_timeout:.0f} s, stopping recording.")
+                        stalled = True
+                        break
+                    continue
+                last_chunk_time = time.monotonic()
+                if chunk is None:
+                    print("The capture was stopped, stopping recording.")
+                    break
+                position, audio_data, capture_time = chunk
+
+                speech_in_chunk = vad.process(audio_data).any()
+                if speech_in_chunk and segment_start is None:
+                    segment_start = max(previous_segment_end, position - audio_data.size - preroll)
+                if segment_start is not None and not vad.is_speech:  # A pause ends the segment
+                    if on_segment is not None:
+                        on_segment(segment_start, position)
+                    segment_start, previous_segment_end = None, position
+
+                if speech_in_chunk:
+                    if not speech_detected:
+                        print("Speech detected.")
+                    speech_detected = True
+                    last_sound_position = vad_start + vad.speech_end
+                elif position - last_sound_position > speech_end_silence and speech_detected:
+                    # Silence waited for, plus the time the chunk took to get here from the microphone
+                    self.last_endpoint_delay = ((position - last_sound_position) / (self.sample_rate * self.channels)
+                                                + time.monotonic() - capture_time)
+                    self.endpoint_delays.record(self.last_endpoint_delay * 1000)
+                    print(f"Speech has ended, stopping recording {self.last_endpoint_delay * 1000:.0f} ms after it.")
+                    break
+                elif position - last_sound_position > no_speech_timeout:
+                    print("No speech detected at all. Stopped recording")
+                    break
+
+                if position >= max_position:
+                    print("Maximum recording length reached, stopping recording.")
+                    break
+        finally:
+            capture.unsubscribe(chunks)
+        if np.isfinite(vad.noise_floor_db):
+            self.noise_floor_db = vad.noise_floor_db
+
+        if stalled:
+            return None
+        if segment_start is not None and on_segment is not None:
+            on_segment(segment_start, min(position, max_position))
 
-    def trim_silence(self, audio_path: str, silence_thresh: int = -40, min_silence_len: int = 500) -> Optional[str]:
+        samples = capture.read(start_position, min(position, max_position))
+        if samples.size == 0:
+            print("No audio was recorded. Skipping transcription.")
+            return None
+
+        if self.archive_audio:
+            self.save_audio(samples, output_filename)
+        return samples
+
+    def trim_silence(self, samples: np.ndarray, silence_thresh: int = -40,
+                     min_silence_len: int = 500) -> Optional[np.ndarray]:
         """
-        Removes silent segments from the beginning and end of an audio file.
-        Without this function, the transcription transcribes random
+        Removes silent segments from the beginning and end of the recorded
+        samples. Without this function, the transcription transcribes random
         words to silence.
 
         Args:
-            audio_path (str): Path to the WAV audio file that needs silence
-                trimming.
+            samples (np.ndarray): The int16 audio samples.
             silence_thresh (int, optional): The volume threshold (in dBFS)
                 below which audio is considered silence. Defaults to -40 dBFS.
             min_silence_len (int, optional): The minimum duration
@@ -154,39 +334,34 @@ class SpeechToText:
                 Defaults to 500 ms.
 
         Returns:
-            Optional[str]: The path to the trimmed audio file if successful,
-            otherwise None if no speech is detected.
+            Optional[np.ndarray]: A slice of the samples without the leading
+            and trailing silence, or None if no speech is detected.
         """
-        audio = AudioSegment.from_wav(audio_path)
-        non_silent_chunks = detect_nonsilent(audio, min_silence_len=min_silence_len, silence_thresh=silence_thresh)
-        print(non_silent_chunks)
-        if not non_silent_chunks:
+        bounds = find_speech_bounds(samples, self.sample_rate, self.channels, silence_thresh, min_silence_len)
+        if bounds is None:
             return None
 
-        start_trim = non_silent_chunks[0][0] #- self.extra_frames
-        end_trim = non_silent_chunks[-1][1] #+ self.extra_frames
-
-        trimmed_audio = audio[start_trim:end_trim]
-        trimmed_audio.export(audio_path, format="wav")
-        return audio_path
+        start_trim, end_trim = bounds
+        return samples[start_trim:end_trim]
 
-    def process_audio(self, audio_path: str, version: str) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
-        trimmed_audio_path = self.trim_silence(audio_path)
+    def process_audio(self, samples: np.ndarray, version: str,
+                      previous_text: str = "") -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        trimmed_samples = self.trim_silence(samples)
         result = {}
 
-        if trimmed_audio_path is None:
+        if trimmed_samples is None:
             return result
 
         try:
-            with open(audio_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="gpt-4o-transcribe",
-                    file=audio_file,
-                    response_format="text",
-                    prompt = (
-                        "Het volgende gesprek is van een 7 tot 10 jaar oud Nedelands kind die een persoonlijk voornaamwoord zegt"
-                    )
+            transcript = self.transcription_backend.transcribe(
+                trimmed_samples,
+                self.sample_rate,
+                self.channels,
+                prompt = (
+                    "Het volgende gesprek is van een 7 tot 10 jaar oud Nedelands kind die een persoonlijk voornaamwoord zegt"
+                    + (f" {previous_text}" if previous_text else "")  # What the child said before this audio, for context
                 )
+            )
 
             if transcript:
                 result = transcript
@@ -197,3 +372,67 @@ class SpeechToText:
             print("Error during audio processing:", e)
 
         return result
+
+    def transcribe_streaming(self, version: str,
+                             on_partial_transcript: Optional[Callable[[str], None]] = None,
+                             phase: str = "conversation") -> Optional[str]:
+        """
+        Records an utterance and transcribes it while the child is still
+        speaking. Every segment (speech up to a pause) is sent for
+        transcription as soon as the pause is detected, so when the
+        recording ends, only the last segment can still be in flight, and its
+        upload started a few hundred milliseconds after the last word.
+        Segments shorter than MIN_SEGMENT_SECONDS are held back and sent
+        together with the next one, or when the recording ends.
+
+        This blocks until the transcription is done, so it must not be called
+        on the reactor thread; use deferToThread.
+
+        Args:
+            version (str): The version of the experiment.
+            on_partial_transcript (Optional[Callable[[str], None]]): Called
+            (on a worker thread) with the transcript so far every time a
+            segment has been transcribed.
+            phase (str): The game phase, a key of ENDPOINTING_PRESETS.
+
+        Returns:
+            Optional[str]: The transcript of the whole utterance, or None if
+            nothing was heard.
+        """
+        segments: List[Future] = []
+        lock = threading.Lock()
+
+        def transcript_so_far() -> str:
+            with lock:
+                finished = list(itertools.takewhile(Future.done, segments))
+            return " ".join(text for text in (segment.result() for segment in finished) if isinstance(text, str) and text)
+
+        def publish_partial_transcript(_: Future) -> None:
+            partial_transcript = transcript_so_far()
+            if partial_transcript and on_partial_transcript is not None:
+                on_partial_transcript(partial_transcript)
+
+        def transcribe_segment(start: int, end: int) -> None:
+            segment = self.transcription_executor.submit(self.process_audio, self.capture_service.read(start, end),
+                                                         version, transcript_so_far())
+            with lock:
+                segments.append(segment)
+            segment.add_done_callback(publish_partial_transcript)
+
+        min_segment_length = self.capture_service.seconds_to_samples(MIN_SEGMENT_SECONDS)
+        held_back: List[int] = []  # The start and end of the short segments not sent yet
+
+        def merge_segment(start: int, end: int) -> None:
+            if held_back:
+                start = held_back[0]
+            if end - start < min_segment_length:
+                held_back[:] = [start, end]
+                return
+            held_back.clear()
+            transcribe_segment(start, end)
+
+        self.record_audio(on_segment=merge_segment, phase=phase)
+        if held_back:
+            transcribe_segment(*held_back)
+        futures.wait(segments)
+        return transcript_so_far() or None
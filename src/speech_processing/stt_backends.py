@@ -0,0 +1,252 @@
+"""
+Description:
+    This module defines the speech-to-text backends SpeechToText can use. A
+    backend turns int16 samples into text. OpenAITranscriptionBackend uploads
+    the audio to the OpenAI transcription endpoint. LocalWhisperBackend runs a
+    Whisper model on the CPU with faster-whisper (an optional dependency), so
+    sessions can run without network. Its model is loaded once per process
+    and kept warm, and several utterances can be decoded in one batch.
+"""
+
+import bisect
+import io
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from src.openai_client import get_openai_client
+from src.speech_processing.resampling import Resampler
+
+WHISPER_SAMPLE_RATE = 16000  # Whisper models only take 16 kHz mono audio
+WHISPER_MAX_CLIP_SECONDS = 30  # Whisper decodes at most 30 s of audio at once
+
+_whisper_models: Dict[Tuple[str, str, str], object] = {}
+_whisper_models_lock = threading.Lock()
+
+
+class TranscriptionBackend(ABC):
+    """
+    This class is the interface of the speech-to-text backends.
+    """
+
+    name = "base"
+
+    def warm_up(self) -> None:
+        """
+        Prepares the backend, so the first transcription is not slower than
+        the others.
+        """
+
+    @abstractmethod
+    def transcribe(self, samples: np.ndarray, sample_rate: int, channels: int, prompt: str = "") -> str:
+        """
+        Transcribes an utterance.
+
+        Args:
+            samples (np.ndarray): The int16 samples, interleaved if there are
+                several channels.
+            sample_rate (int): The sample rate of the samples.
+            channels (int): The number of channels.
+            prompt (str): Text that tells the model what to expect.
+
+        Returns:
+            str: The transcript, empty if nothing was recognized.
+        """
+
+    def transcribe_batch(self, utterances: List[np.ndarray], sample_rate: int, channels: int,
+                         prompt: str = "") -> List[str]:
+        """
+        Transcribes several utterances. Backends that can decode a batch at
+        once override this; by default they are transcribed one by one.
+
+        Args:
+            utterances (List[np.ndarray]): The int16 samples of every
+                utterance.
+            sample_rate (int): The sample rate of the samples.
+            channels (int): The number of channels.
+            prompt (str): Text that tells the model what to expect.
+
+        Returns:
+            List[str]: The transcript of every utterance.
+        """
+        return [self.transcribe(samples, sample_rate, channels, prompt) for samples in utterances]
+
+
+class OpenAITranscriptionBackend(TranscriptionBackend):
+    """
+    This class transcribes audio with the OpenAI transcription endpoint.
+    """
+
+    name = "openai"
+
+    def __init__(self, encode_audio: Callable[[np.ndarray], io.BytesIO], model: str = "gpt-4o-transcribe"):
+        self.encode_audio = encode_audio  # Encodes the samples in the upload format of SpeechToText
+        self.model = model
+
+    def warm_up(self) -> None:
+        get_openai_client("audio")
+
+    def transcribe(self, samples: np.ndarray, sample_rate: int, channels: int, prompt: str = "") -> str:
+        transcript = get_openai_client("audio").audio.transcriptions.create(
+            model=self.model,
+            file=self.encode_audio(samples),
+            response_format="text",
+            prompt=prompt
+        )
+        return transcript or ""
+
+
+def get_whisper_model(model_size: str = "small", compute_type: str = "int8", cpu_threads: int = 0):
+    """
+    Returns the faster-whisper model of the given size, loading it the first
+    time it is needed. The model is shared by all local backends.
+
+    Args:
+        model_size (str): The Whisper model, e.g. "small" or "large-v3".
+        compute_type (str): The precision the model runs at on the CPU.
+        cpu_threads (int): The number of CPU threads, 0 for the default.
+
+    Raises:
+        ImportError: If faster-whisper is not installed.
+
+    Returns:
+        WhisperModel: The loaded model.
+    """
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError as e:
+        raise ImportError("The local speech-to-text backend needs faster-whisper: pip install faster-whisper") from e
+
+    key = (model_size, compute_type, str(cpu_threads))
+    with _whisper_models_lock:
+        if key not in _whisper_models:
+            print(f"Loading Whisper model {model_size} ({compute_type})...")
+            _whisper_models[key] = WhisperModel(model_size, device="cpu", compute_type=compute_type,
+                                                cpu_threads=cpu_threads)
+        return _whisper_models[key]
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    This class transcribes audio on the CPU with a Whisper model run by
+    faster-whisper.
+    """
+
+    name = "local"
+
+    def __init__(self,
+                 model_size: str = "small",
+                 compute_type: str = "int8",
+                 language: str = "nl",
+                 beam_size: int = 1,
+                 batch_size: int = 8,
+                 cpu_threads: int = 0):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.language = language
+        self.beam_size = beam_size  # Greedy decoding is much faster and barely less accurate on short answers
+        self.batch_size = batch_size
+        self.cpu_threads = cpu_threads
+        self.pipeline = None
+        self.lock = threading.Lock()  # The model decodes one batch at a time
+
+    def get_pipeline(self):
+        """
+        Returns the batched inference pipeline around the shared model.
+
+        Returns:
+            BatchedInferencePipeline: The pipeline.
+        """
+        if self.pipeline is None:
+            from faster_whisper import BatchedInferencePipeline
+            self.pipeline = BatchedInferencePipeline(get_whisper_model(self.model_size, self.compute_type,
+                                                                       self.cpu_threads))
+        return self.pipeline
+
+    def warm_up(self) -> None:
+        """
+        Loads the model and decodes a second of silence, so the first real
+        utterance does not pay for loading and initialization.
+        """
+        self.transcribe(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.int16), WHISPER_SAMPLE_RATE, 1)
+
+    @staticmethod
+    def to_whisper_audio(samples: np.ndarray, sample_rate: int, channels: int) -> np.ndarray:
+        """
+        Converts int16 samples to the float32 16 kHz mono audio Whisper
+        takes.
+
+        Args:
+            samples (np.ndarray): The int16 samples.
+            sample_rate (int): The sample rate of the samples.
+            channels (int): The number of channels.
+
+        Returns:
+            np.ndarray: The float32 audio in [-1, 1].
+        """
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        if sample_rate != WHISPER_SAMPLE_RATE:
+            samples = Resampler(sample_rate, WHISPER_SAMPLE_RATE).process(samples)
+        return samples.astype(np.float32) / 32768.0
+
+    def transcribe(self, samples: np.ndarray, sample_rate: int, channels: int, prompt: str = "") -> str:
+        return self.transcribe_batch([samples], sample_rate, channels, prompt)[0]
+
+    def transcribe_batch(self, utterances: List[np.ndarray], sample_rate: int, channels: int,
+                         prompt: str = "") -> List[str]:
+        """
+        Transcribes several utterances in batches. The utterances are put
+        one after the other and every utterance (in clips of at most 30 s) is
+        decoded as one item of a batch.
+        """
+        audios = [self.to_whisper_audio(samples, sample_rate, channels) for samples in utterances]
+        offsets = np.concatenate(([0], np.cumsum([audio.size for audio in audios])))
+        clips: List[Dict[str, float]] = []
+        clip_utterances: List[int] = []
+        max_clip = WHISPER_MAX_CLIP_SECONDS * WHISPER_SAMPLE_RATE
+        for index, audio in enumerate(audios):
+            for start in range(0, audio.size, max_clip):
+                end = min(start + max_clip, audio.size)
+                clips.append({"start": float(offsets[index] + start) / WHISPER_SAMPLE_RATE,
+                              "end": float(offsets[index] + end) / WHISPER_SAMPLE_RATE})
+                clip_utterances.append(index)
+
+        texts: List[List[str]] = [[] for _ in utterances]
+        if not clips:
+            return ["" for _ in utterances]
+
+        clip_starts = [clip["start"] for clip in clips]
+        with self.lock:
+            segments, _ = self.get_pipeline().transcribe(np.concatenate(audios), language=self.language,
+                                                         beam_size=self.beam_size, initial_prompt=prompt or None,
+                                                         clip_timestamps=clips, batch_size=self.batch_size)
+            for segment in segments:
+                clip = max(0, bisect.bisect_right(clip_starts, segment.start + 1e-3) - 1)
+                texts[clip_utterances[clip]].append(segment.text.strip())
+
+        return [" ".join(text for text in utterance_texts if text) for utterance_texts in texts]
+
+
+def create_transcription_backend(name: str, encode_audio: Optional[Callable[[np.ndarray], io.BytesIO]] = None,
+                                 **kwargs) -> TranscriptionBackend:
+    """
+    Creates a speech-to-text backend by name.
+
+    Args:
+        name (str): "openai" or "local".
+        encode_audio (Optional[Callable[[np.ndarray], io.BytesIO]]): The
+            encoder of the upload, only used by the OpenAI backend.
+        **kwargs: Passed on to the backend.
+
+    Raises:
+        ValueError: If the name is not a known backend.
+
+    Returns:
+        TranscriptionBackend: The backend.
+    """
+    if name == OpenAITranscriptionBackend.name:
+        return OpenAITranscriptionBackend(encode_audio, **kwargs)
+    if name == LocalWhisperBackend.name:
+        return LocalWhisperBackend(**kwargs)
+    raise ValueError(f"Invalid transcription backend: {name}. Must be 'openai' or 'local'.")
@@ -0,0 +1,236 @@
+"""
+Description:
+    This module defines the VoiceActivityDetector class, an energy-based voice
+    activity detector that adapts to the room. The audio is cut into short
+    frames; for every frame the RMS level and the zero-crossing rate are
+    computed in one vectorized pass. The noise floor is estimated as the
+    quietest frame level in a sliding window over a ring buffer of recent
+    frame levels, so no per-classroom threshold tuning is needed. A frame is
+    a speech candidate when it is clearly louder than the noise floor and its
+    zero-crossing rate is low enough to be voiced. Onset smoothing requires
+    several candidate frames in a row before speech starts, so a single click
+    is ignored, and a hangover keeps speech active for a while after the last
+    candidate, so short pauses between words do not end it.
+
+    The module also provides find_speech_bounds, which finds the leading and
+    trailing silence of a recording with the same windowed dBFS rule as
+    pydub's detect_nonsilent, computed on the numpy samples at once.
+"""
+
+from typing import Optional, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FULL_SCALE = 32768.0  # The amplitude of a full-scale int16 sample, 0 dBFS
+
+
+def find_speech_bounds(samples: np.ndarray, sample_rate: int, channels: int = 1, silence_thresh: float = -40,
+                       min_silence_len: int = 500) -> Optional[Tuple[int, int]]:
+    """
+    Finds where the audio without its leading and trailing silence starts
+    and ends. Like pydub's detect_nonsilent, a window of min_silence_len
+    milliseconds is slid over the audio in steps of 1 ms, and every window
+    with an RMS level below silence_thresh is silence. The levels of all
+    windows come from one cumulative sum of the squared samples.
+
+    Args:
+        samples (np.ndarray): The int16 samples, interleaved if there are
+            several channels.
+        sample_rate (int): The sample rate of the audio.
+        channels (int): The number of channels.
+        silence_thresh (float): The level (in dBFS) below which a window is
+            silence.
+        min_silence_len (int): The window length in milliseconds.
+
+    Returns:
+        Optional[Tuple[int, int]]: The start and end index into samples of
+        the non-silent audio, or None if all of it is silence.
+    """
+    duration_ms = samples.size // channels * 1000 // sample_rate
+    if duration_ms < min_silence_len:
+        return (0, samples.size) if samples.size else None  # Too short to contain a silence
+
+    # The sample index of the start of every millisecond, and the energy up to it
+    ms_starts = np.arange(duration_ms + 1) * sample_rate // 1000 * channels
+    energy = np.concatenate(([0.0], np.cumsum(samples.astype(np.float64) ** 2)))[ms_starts]
+
+    window_energy = energy[min_silence_len:] - energy[:-min_silence_len]
+    window_size = ms_starts[min_silence_len:] - ms_starts[:-min_silence_len]
+    silent_threshold = (FULL_SCALE * 10 ** (silence_thresh / 20)) ** 2  # Mean squared sample at the threshold
+    silent_windows = window_energy < silent_threshold * window_size
+
+    # A millisecond is silent when a silent window covers it
+    covering = np.convolve(silent_windows, np.ones(min_silence_len, dtype=int))
+    non_silent = np.flatnonzero(covering[:duration_ms] == 0)
+    if non_silent.size == 0:
+        return None
+    return int(ms_starts[non_silent[0]]), int(ms_starts[non_silent[-1] + 1])
+
+
+class VoiceActivityDetector:
+    """
+    This class makes a speech or non-speech decision for every frame of a
+    stream of int16 samples. Samples can be passed in chunks of any size;
+    samples that do not fill a whole frame are kept for the next chunk.
+    """
+
+    def __init__(self,
+                 sample_rate: int = 44100,
+                 channels: int = 1,
+                 frame_ms: int = 20,
+                 threshold_db: float = 12.0,
+                 min_speech_db: float = -50.0,
+                 max_zero_crossings_per_second: float = 6000.0,
+                 onset_frames: int = 3,
+                 hangover_frames: int = 15,
+                 noise_window_seconds: float = 2.0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_length = sample_rate * frame_ms // 1000  # Samples per channel in one frame
+        self.threshold_db = threshold_db  # How far above the noise floor speech has to be
+        self.min_speech_db = min_speech_db  # Frames quieter than this are never speech, even in a silent room
+        # Voiced speech crosses zero far less often than hiss and clicks; expressed per second so it does not
+        # depend on the sample rate
+        self.max_zero_crossing_rate = max_zero_crossings_per_second / sample_rate
+        self.onset_frames = onset_frames
+        self.hangover_frames = hangover_frames
+
+        # Ring buffer of the levels of the most recent frames, used to track the noise floor
+        self.noise_window_seconds = noise_window_seconds
+        self.levels = np.full(max(1, int(noise_window_seconds * 1000 / frame_ms)), np.inf)
+        self.frame_count = 0
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.candidate_run = 0  # Candidate frames in a row at the end of the previous chunk
+        self.frames_since_onset = hangover_frames + 1  # Frames since speech was last confirmed
+        self.noise_floor_db = -np.inf
+        self.is_speech = False
+
+    def reset(self) -> None:
+        """
+        Forgets the noise floor and the speech state.
+        """
+        self.levels.fill(np.inf)
+        self.frame_count = 0
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.candidate_run = 0
+        self.frames_since_onset = self.hangover_frames + 1
+        self.noise_floor_db = -np.inf
+        self.is_speech = False
+
+    @property
+    def speech_end(self) -> int:
+        """
+        The number of samples processed up to the end of the last frame that
+        was confirmed as speech, not counting the hangover. Only meaningful
+        once speech has been detected.
+        """
+        return (self.frame_count - self.frames_since_onset) * self.frame_length * self.channels
+
+    def prime(self, samples: np.ndarray, max_level_db: Optional[float] = None) -> None:
+        """
+        Learns the noise floor from audio captured before the detector is
+        needed, without taking over any speech in it.
+
+        Args:
+            samples (np.ndarray): The int16 samples to learn from.
+            max_level_db (Optional[float]): Frames louder than this are left
+                out, e.g. the robot asking the question just before the
+                recording.
+        """
+        if max_level_db is not None:
+            frame_samples = self.frame_length * self.channels
+            frames = samples[:samples.size // frame_samples * frame_samples].reshape(-1, self.frame_length,
+                                                                                     self.channels)
+            levels_db, _ = self.frame_features(frames.mean(axis=2))
+            samples = frames[levels_db <= max_level_db].reshape(-1)
+        self.process(samples)
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.candidate_run = 0
+        self.frames_since_onset = self.hangover_frames + 1
+        self.is_speech = False
+
+    def frame_features(self, frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the level and the zero-crossing rate of every frame.
+
+        Args:
+            frames (np.ndarray): The mono samples, one frame per row.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The RMS level in dBFS and the
+            fraction of samples at which the signal changes sign, per frame.
+        """
+        frames = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        levels_db = 20 * np.log10(np.maximum(rms, 1.0) / FULL_SCALE)
+        signs = np.signbit(frames)
+        zero_crossing_rates = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+        return levels_db, zero_crossing_rates
+
+    def update_noise_floor(self, levels_db: np.ndarray) -> np.ndarray:
+        """
+        Adds frame levels to the ring buffer and estimates the noise floor at
+        every frame as the quietest level in the window before it (not
+        including the frame itself).
+
+        Args:
+            levels_db (np.ndarray): The levels of the new frames in dBFS.
+
+        Returns:
+            np.ndarray: The noise floor in dBFS at every new frame.
+        """
+        window = self.levels.size
+        start = self.frame_count % window
+        history = np.concatenate((self.levels[start:], self.levels[:start], levels_db))  # Oldest level first
+        noise_floors = sliding_window_view(history, window)[:-1].min(axis=1)
+
+        if levels_db.size >= window:
+            self.levels[:] = np.roll(levels_db[-window:], self.frame_count + levels_db.size)
+        else:
+            indices = (self.frame_count + np.arange(levels_db.size)) % window
+            self.levels[indices] = levels_db
+        self.frame_count += levels_db.size
+        self.noise_floor_db = float(noise_floors[-1])
+        return noise_floors
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Decides for every complete frame in the given samples whether it is
+        speech.
+
+        Args:
+            samples (np.ndarray): The next int16 samples of the stream,
+                interleaved if there are several channels.
+
+        Returns:
+            np.ndarray: One boolean per frame, True for speech.
+        """
+        samples = np.concatenate((self.remainder, samples)) if self.remainder.size else samples
+        frame_samples = self.frame_length * self.channels
+        frame_total = samples.size // frame_samples
+        self.remainder = samples[frame_total * frame_samples:].copy()
+        if frame_total == 0:
+            return np.zeros(0, dtype=bool)
+
+        frames = samples[:frame_total * frame_samples].reshape(frame_total, self.frame_length, self.channels)
+        levels_db, zero_crossing_rates = self.frame_features(frames.mean(axis=2))
+        noise_floors = self.update_noise_floor(levels_db)
+        candidates = ((levels_db > noise_floors + self.threshold_db)
+                      & (levels_db > self.min_speech_db)
+                      & (zero_crossing_rates <= self.max_zero_crossing_rate))
+
+        # Onset smoothing: speech is confirmed once there have been onset_frames candidates in a row
+        indices = np.arange(frame_total)
+        last_break = np.maximum.accumulate(np.where(candidates, -1, indices))
+        runs = np.where(last_break < 0, indices + 1 + self.candidate_run, indices - last_break)
+        onsets = candidates & (runs >= self.onset_frames)
+
+        # Hangover: speech stays active for hangover_frames after the last confirmed frame
+        last_onset = np.maximum.accumulate(np.where(onsets, indices, -1))
+        frames_since_onset = np.where(last_onset < 0, indices + 1 + self.frames_since_onset, indices - last_onset)
+        decisions = frames_since_onset <= self.hangover_frames
+
+        self.candidate_run = int(runs[-1]) if candidates[-1] else 0
+        self.frames_since_onset = int(frames_since_onset[-1])
+        self.is_speech = bool(decisions[-1])
+        return decisions
@@ -3,52 +3,49 @@ Description:
     This module provides functionality to generate messages using OpenAI's
     GPT-3.5. It takes a prompt as input and returns a generated response in
     lowercase, ensuring that no inappropriate or offensive content is included.
-    The script checks for profanity using Sightengine and regenerates the
-    response if needed. The API key must be set in the environment variables
-    for the script to work.
+    The script checks for profanity with a local blocklist filter and
+    regenerates the response if needed. Sightengine is asked for a second
+    opinion in the background through the shared moderation client. The API
+    key must be set in the environment variables for the script to work.
+    The *_deferred variants run the blocking helpers on the reactor thread
+    pool, so the Twisted reactor keeps running during an OpenAI call.
 """
 
-import os
-import json
-import openai
-import requests
+import re
+from typing import Callable, Iterator, List, Tuple
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredSemaphore
+from twisted.python.failure import Failure
+from twisted.internet.threads import deferToThread
+from src.moderation.moderation_client import get_moderation_client
+from src.openai_client import get_openai_client
 
+SYSTEM_PROMPT = (
+    "Je bent een vriendelijke, educatieve robot die spreekt tegen kinderen van 7-10 jaar "
+    "Houd jouw taalgebruik leuk, veilig en simpel en gebruik nooit ongepaste of enge tekst "
+)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")  # Whitespace after the end of a sentence
+MAX_CONCURRENT_LLM_CALLS = 4  # Limits the OpenAI calls made through the *_deferred helpers at the same time
+MAX_REGENERATIONS = 3  # Times a response with profanity is regenerated before giving up
+FALLBACK_RESPONSE = "Daar weet ik even geen antwoord op."  # Said when every response contained profanity
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set. Please set it in your environment variables.")
+llm_semaphore = DeferredSemaphore(MAX_CONCURRENT_LLM_CALLS)
 
-client = openai.Client(api_key=API_KEY)
 
-
-def check_profanity(text: str, timeout: int = 10) -> dict:
+def check_profanity(text: str) -> dict:
     """
-    Checks the given text for profanity using the Sightengine API.
-    This approach is based on the Sightengine Profanity Detection API, which
-    can identify offensive language, including hate speech, offensive words,
-    and inappropriate content.
-
-    For more details on the API and its rules, visit:
-    https://sightengine.com/docs/profanity-detection-hate-offensive-text-moderation
+    Checks the given text for profanity with the shared moderation client:
+    the local blocklist filter, with Sightengine as a background second
+    opinion.
 
     Args:
         text (str): The text to check for profanity.
-        timeout (int): Timeout for the request in seconds. Default is 10
-            seconds.
 
     Returns:
-        dict: The API response in JSON format, containing information on
-        detected profanity.
+        dict: The result in the same shape as the Sightengine response,
+        containing information on detected profanity.
     """
-    data = {'text': text, 'mode': 'rules', 'lang': 'nl'}
-    headers = {'Authorization': API_KEY}
-
-    try:
-        r = requests.post('https://api.sightengine.com/1.0/text/check.json', data=data, headers=headers, timeout=timeout)
-        return json.loads(r.text)
-    except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
-        print(f"Request failed: {e}")
-        return {}
+    return get_moderation_client().check(text)
 
 
 def generate_message_using_llm(original_prompt: str) -> str:
@@ -62,23 +59,22 @@ def generate_message_using_llm(original_prompt: str) -> str:
 
     Returns:
         str: A generated response from the OpenAI API, in lowercase, with no
-        profanity.
+        profanity, or FALLBACK_RESPONSE if it still contained profanity after
+        MAX_REGENERATIONS regenerations.
 
     Raises:
         RuntimeError: If the LLM response is empty.
     """
     prompt = original_prompt
     avoided_words = []
-    system_prompt = (
-        "Je bent een vriendelijke, educatieve robot die spreekt tegen kinderen van 7-10 jaar "
-        "Houd jouw taalgebruik leuk, veilig en simpel en gebruik nooit ongepaste of enge tekst "
-    )
+    moderation_client = get_moderation_client()
+    client = get_openai_client("chat")
 
-    while True:
+    for _ in range(MAX_REGENERATIONS + 1):
         completion = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
         )
@@ -88,7 +84,7 @@ def generate_message_using_llm(original_prompt: str) -> str:
 
         response = completion.choices[0].message.content.strip()
 
-        profanity = check_profanity(response)
+        profanity = moderation_client.check(response)
 
         if profanity and profanity.get("profanity", {}).get("matches"):
             matches = profanity["profanity"]["matches"]
@@ -103,6 +99,9 @@ def generate_message_using_llm(original_prompt: str) -> str:
         else:
             return response.lower()
 
+    print("LLM response kept containing profanity, using the fallback response.")
+    return FALLBACK_RESPONSE.lower()
+
 def generate_conversation_using_llm(original_prompt: str, conversation) -> str:
     """
     Generates a message based on a given prompt using OpenAI's GPT-3.5 and
@@ -114,23 +113,22 @@ def generate_conversation_using_llm(original_prompt: str, conversation) -> str:
 
     Returns:
         str: A generated response from the OpenAI API, in lowercase, with no
-        profanity.
+        profanity, or FALLBACK_RESPONSE if it still contained profanity after
+        MAX_REGENERATIONS regenerations.
 
     Raises:
         RuntimeError: If the LLM response is empty.
     """
     prompt = original_prompt
     avoided_words = []
-    system_prompt = (
-        "Je bent een vriendelijke, educatieve robot die spreekt tegen kinderen van 7-10 jaar "
-        "Houd jouw taalgebruik leuk, veilig en simpel en gebruik nooit ongepaste of enge tekst "
-    )
+    moderation_client = get_moderation_client()
+    client = get_openai_client("responses")
 
-    while True:
+    for _ in range(MAX_REGENERATIONS + 1):
         completion = client.responses.create(
             model="gpt-4o-mini",
             input=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
             conversation=conversation
@@ -141,7 +139,7 @@ def generate_conversation_using_llm(original_prompt: str, conversation) -> str:
         print(completion.output_text)
         response = completion.output_text.strip()
 
-        profanity = check_profanity(response)
+        profanity = moderation_client.check(response)
 
         if profanity and profanity.get("profanity", {}).get("matches"):
             matches = profanity["profanity"]["matches"]
@@ -154,4 +152,201 @@ def generate_conversation_using_llm(original_prompt: str, conversation) -> str:
                 prompt = original_prompt + f" Do not use the word(s): '{avoided_words_str}'."
 
         else:
-            return response.lower()
\ No newline at end of file
+            return response.lower()
+
+    print("LLM response kept containing profanity, using the fallback response.")
+    return FALLBACK_RESPONSE.lower()
+
+
+def split_complete_sentences(text: str) -> Tuple[List[str], str]:
+    """
+    Splits the complete sentences off a text that is still being generated.
+
+    Args:
+        text (str): The text generated so far.
+
+    Returns:
+        Tuple[List[str], str]: The complete sentences and the unfinished
+        rest of the text.
+    """
+    parts = SENTENCE_END.split(text)
+    return [part.strip() for part in parts[:-1] if part.strip()], parts[-1]
+
+
+def stream_conversation_using_llm(original_prompt: str, conversation) -> Iterator[str]:
+    """
+    Generates a message like generate_conversation_using_llm, but streams the
+    reply and yields it sentence by sentence while the rest is still being
+    generated. Every sentence is checked for profanity before it is yielded.
+    As earlier sentences may already have been spoken, a sentence with
+    profanity is left out instead of regenerating the reply. If every
+    sentence was left out, FALLBACK_RESPONSE is yielded instead.
+
+    Args:
+        original_prompt (str): The prompt to send to the OpenAI API.
+        conversation: The id of the OpenAI conversation.
+
+    Returns:
+        Iterator[str]: The sentences of the reply, in lowercase, with no
+        profanity.
+
+    Raises:
+        RuntimeError: If the LLM response is empty.
+    """
+    moderation_client = get_moderation_client()
+    client = get_openai_client("responses")
+    stream = client.responses.create(
+        model="gpt-4o-mini",
+        input=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": original_prompt}
+        ],
+        conversation=conversation,
+        stream=True
+    )
+
+    def complete_sentences() -> Iterator[str]:
+        text = ""
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                text += event.delta
+                sentences, text = split_complete_sentences(text)
+                yield from sentences
+        if text.strip():
+            yield text.strip()
+
+    sentences_yielded = 0
+    sentences_left_out = 0
+    for sentence in complete_sentences():
+        if moderation_client.check(sentence)["profanity"]["matches"]:
+            print(f"Left out a sentence with profanity: {sentence}")
+            sentences_left_out += 1
+            continue
+        print(sentence)
+        sentences_yielded += 1
+        yield sentence.lower()
+
+    if sentences_yielded == 0 and sentences_left_out > 0:
+        yield FALLBACK_RESPONSE.lower()
+    elif sentences_yielded == 0:
+        raise RuntimeError("LLM response is empty.")
+
+
+def run_in_llm_slot(function: Callable, *args) -> Deferred:
+    """
+    Runs a blocking function on the reactor thread pool as soon as
+    llm_semaphore has a free slot. Cancelling the returned Deferred takes the
+    call out of the queue while it is still waiting for a slot. A call that
+    is already running cannot be stopped: it keeps its slot until its thread
+    is done, and only its result is dropped.
+
+    Args:
+        function (Callable): The function to run.
+        *args: The arguments of the function.
+
+    Returns:
+        Deferred: Fires with the result of the function.
+    """
+    def cancel(_) -> None:
+        if not acquired.called:
+            acquired.cancel()
+
+    result = Deferred(cancel)
+
+    def run(_) -> Deferred:
+        return deferToThread(function, *args).addBoth(finish)
+
+    def finish(outcome) -> None:
+        llm_semaphore.release()
+        forward(outcome)
+
+    def forward(outcome) -> None:
+        if not result.called:
+            if isinstance(outcome, Failure):
+                result.errback(outcome)
+            else:
+                result.callback(outcome)
+
+    acquired = llm_semaphore.acquire()
+    acquired.addCallbacks(run, forward)
+    return result
+
+
+def generate_message_using_llm_deferred(original_prompt: str) -> Deferred:
+    """
+    Runs generate_message_using_llm on the reactor thread pool, with at most
+    MAX_CONCURRENT_LLM_CALLS calls at the same time.
+
+    Args:
+        original_prompt (str): The initial prompt to send to the OpenAI API.
+
+    Returns:
+        Deferred: Fires with the generated response, in lowercase, with no
+        profanity.
+    """
+    return run_in_llm_slot(generate_message_using_llm, original_prompt)
+
+
+def generate_conversation_using_llm_deferred(original_prompt: str, conversation) -> Deferred:
+    """
+    Runs generate_conversation_using_llm on the reactor thread pool, with at
+    most MAX_CONCURRENT_LLM_CALLS calls at the same time.
+
+    Args:
+        original_prompt (str): The initial prompt to send to the OpenAI API.
+        conversation: The id of the OpenAI conversation.
+
+    Returns:
+        Deferred: Fires with the generated response, in lowercase, with no
+        profanity.
+    """
+    return run_in_llm_slot(generate_conversation_using_llm, original_prompt, conversation)
+
+
+def create_conversation_deferred() -> Deferred:
+    """
+    Creates an OpenAI conversation on the reactor thread pool.
+
+    Returns:
+        Deferred: Fires with the created conversation.
+    """
+    return run_in_llm_slot(lambda: get_openai_client("responses").conversations.create())
+
+
+def with_deadline(request: Deferred, seconds: float, clock=reactor) -> Deferred:
+    """
+    Waits for a request for at most the given number of seconds. When the
+    deadline passes, the request is cancelled: a request of the *_deferred
+    helpers that is still waiting for llm_semaphore leaves the queue, one
+    that is already running keeps its slot until its thread is done (see
+    run_in_llm_slot).
+
+    Args:
+        request (Deferred): The request to wait for.
+        seconds (float): The deadline in seconds.
+        clock: The reactor to schedule the deadline on.
+
+    Returns:
+        Deferred: Fires with the result of the request, or fails with a
+        TimeoutError if the request has not finished in time.
+    """
+    result = Deferred()
+
+    def on_deadline() -> None:
+        if not result.called:
+            result.errback(TimeoutError(f"No result within {seconds} s"))
+        request.cancel()
+
+    def forward(outcome):
+        if deadline.active():
+            deadline.cancel()
+        if not result.called:
+            if isinstance(outcome, Failure):
+                result.errback(outcome)
+            else:
+                result.callback(outcome)
+        # A request that ends after the deadline (or is cancelled by it) has nobody waiting for it any more
+
+    deadline = clock.callLater(seconds, on_deadline)
+    request.addBoth(forward)
+    return result
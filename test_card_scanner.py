@@ -0,0 +1,78 @@
+"""
+Description:
+    Checks how the CardScanner votes over the frames of the card stream, on a
+    task.Clock: a tie between two cards reports neither, and the previously
+    scanned card only counts again after SAME_CARD_DELAY seconds.
+"""
+
+from twisted.internet import task
+from src.pronoun_game.acuro_card_recognition import CARD_MIN_FRAMES, SAME_CARD_DELAY, CardScanner
+
+FRAME_SECONDS = 0.1
+
+
+def frame(*cards):
+    return {"data": {"body": [[0, 0, 0, 0, 0, card] for card in cards]}}
+
+
+def show(scanner, clock, frames):
+    for cards in frames:
+        clock.advance(FRAME_SECONDS)
+        scanner.on_card(frame(*cards))
+
+
+def scan(scanner, timeout=5.0, expected=None):
+    results = []
+    scanner.wait_for_card(timeout, expected).addCallback(results.append)
+    return results
+
+
+def test_card_seen_in_enough_frames_is_scanned():
+    clock = task.Clock()
+    scanner = CardScanner(None, clock)
+    results = scan(scanner)
+    show(scanner, clock, [(3,)] * (CARD_MIN_FRAMES - 1))
+    assert results == []
+    show(scanner, clock, [(3,)])
+    assert results == [3]
+
+
+def test_tie_is_not_scanned():
+    clock = task.Clock()
+    scanner = CardScanner(None, clock)
+    results = scan(scanner)
+    show(scanner, clock, [(1, 2)] * 3)
+    assert results == []
+    show(scanner, clock, [(2,)])
+    assert results == [2]
+
+
+def test_unexpected_cards_do_not_vote():
+    clock = task.Clock()
+    scanner = CardScanner(None, clock)
+    results = scan(scanner, expected={101})
+    show(scanner, clock, [(5,)] * 3 + [(5, 101)] * CARD_MIN_FRAMES)
+    assert results == [101]
+
+
+def test_previous_card_counts_again_after_delay():
+    clock = task.Clock()
+    scanner = CardScanner(None, clock)
+    scan(scanner)
+    show(scanner, clock, [(4,)] * CARD_MIN_FRAMES)
+
+    results = scan(scanner)
+    frames_before_delay = int(SAME_CARD_DELAY / FRAME_SECONDS) - 1
+    show(scanner, clock, [(4,)] * frames_before_delay)
+    assert results == []
+    show(scanner, clock, [(4,)] * 2)
+    assert results == [4]
+
+
+def test_scan_times_out():
+    clock = task.Clock()
+    scanner = CardScanner(None, clock)
+    results = scan(scanner, timeout=2.0)
+    clock.advance(2.0)
+    assert results == [None]
+    assert scanner.waiters == []
@@ -0,0 +1,44 @@
+"""
+Description:
+    Checks the matching rules of the profanity filter: leetspeak, accents and
+    repeated letters, blocked words that may start a longer word, and words
+    that only look blocked after collapsing their letters.
+"""
+
+import pytest
+from src.moderation.profanity_filter import ProfanityFilter
+
+
+@pytest.fixture(scope="module")
+def profanity_filter():
+    return ProfanityFilter()
+
+
+def matched(profanity_filter, text):
+    return [match["match"] for match in profanity_filter.find_matches(text)]
+
+
+@pytest.mark.parametrize("text, match", [("wat een 5h1t", "5h1t"), ("fùüück", "fùüück"), ("SHIT!", "SHIT"),
+                                         ("piss off", "piss"), ("pisss", "pisss")])
+def test_leetspeak_accents_and_repeats(profanity_filter, text, match):
+    assert matched(profanity_filter, text) == [match]
+
+
+def test_prefix_entries_match_longer_words(profanity_filter):
+    assert matched(profanity_filter, "fucking") == ["fuck"]
+    assert matched(profanity_filter, "kutzooi") == ["kut"]
+
+
+def test_other_entries_match_whole_words_only(profanity_filter):
+    assert matched(profanity_filter, "scrappy") == []
+    assert matched(profanity_filter, "crap") == ["crap"]
+
+
+def test_collapsed_letters_do_not_match_across_languages(profanity_filter):
+    assert matched(profanity_filter, "ik moet pis") == []
+
+
+def test_matches_point_into_the_original_text(profanity_filter):
+    text = "Dat is b1tch gedrag"
+    [match] = profanity_filter.find_matches(text)
+    assert text[match["start"]:match["end"]] == "b1tch"
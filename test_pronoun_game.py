@@ -0,0 +1,29 @@
+"""
+Description:
+    Plays a round of the pronoun game with a scripted child, like
+    src/simulation/check_pronoun_game.py, on a task.Clock. The clock is
+    advanced ten times faster than real time, so the card scan that the
+    spoken answer waits for times out in 1.5 s instead of 15 s. Recording
+    and transcribing still run in threads on the real reactor, which is why
+    this is a trial TestCase (pytest runs it like any other test).
+"""
+
+from twisted.internet import task
+from twisted.trial import unittest
+from src.reactor_load import get_reactor_load_monitor
+from src.simulation.check_pronoun_game import play_round
+
+GAME_SECONDS_PER_TICK = 0.1
+TICK_SECONDS = 0.01
+
+
+class PronounGameTest(unittest.TestCase):
+    timeout = 60
+
+    def test_round_with_scripted_child(self):
+        clock = task.Clock()
+        driver = task.LoopingCall(clock.advance, GAME_SECONDS_PER_TICK)
+        driver.start(TICK_SECONDS)
+        self.addCleanup(driver.stop)
+        self.addCleanup(get_reactor_load_monitor().stop)  # Started by the speech session, trial wants a clean reactor
+        return play_round(clock)
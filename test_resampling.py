@@ -0,0 +1,30 @@
+"""
+Description:
+    Checks that the Resampler produces as many samples as the sample rates
+    call for, however the stream is cut into chunks.
+"""
+
+import numpy as np
+import pytest
+from src.speech_processing.resampling import Resampler
+
+
+@pytest.mark.parametrize("input_rate, output_rate, channels, chunk_size",
+                         [(44100, 16000, 1, 1024), (48000, 16000, 1, 333), (44100, 16000, 2, 512),
+                          (8000, 16000, 1, 256)])
+def test_output_length(input_rate, output_rate, channels, chunk_size):
+    resampler = Resampler(input_rate, output_rate, channels)
+    frames = 3 * input_rate
+    samples = np.zeros(frames * channels, dtype=np.int16)
+
+    output = [resampler.process(samples[start:start + chunk_size * channels])
+              for start in range(0, samples.size, chunk_size * channels)]
+
+    output_frames = sum(chunk.size for chunk in output) // channels
+    assert abs(output_frames - frames * output_rate / input_rate) <= 1
+    assert all(chunk.size % channels == 0 for chunk in output)
+
+
+def test_same_rate_passes_through():
+    samples = np.arange(100, dtype=np.int16)
+    assert Resampler(16000, 16000).process(samples) is samples
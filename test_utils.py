@@ -0,0 +1,62 @@
+"""
+Description:
+    Checks with_deadline on a task.Clock: the result of a request that is in
+    time is passed on, the deadline fails with a TimeoutError, and a request
+    still queued for llm_semaphore leaves the queue when the deadline passes.
+"""
+
+import pytest
+from twisted.internet import task
+from twisted.internet.defer import Deferred
+from src.utils import MAX_CONCURRENT_LLM_CALLS, llm_semaphore, run_in_llm_slot, with_deadline
+
+
+def outcomes(deferred):
+    results = []
+    deferred.addBoth(results.append)
+    return results
+
+
+def test_result_in_time_is_passed_on():
+    clock = task.Clock()
+    request = Deferred()
+    results = outcomes(with_deadline(request, 2.0, clock))
+    clock.advance(1.0)
+    request.callback("antwoord")
+    assert results == ["antwoord"]
+    assert clock.getDelayedCalls() == []
+
+
+def test_deadline_fails_with_timeout():
+    clock = task.Clock()
+    request = Deferred()
+    results = outcomes(with_deadline(request, 2.0, clock))
+    clock.advance(1.9)
+    assert results == []
+    clock.advance(0.1)
+    assert len(results) == 1 and results[0].check(TimeoutError)
+
+
+@pytest.fixture
+def busy_llm_slots():
+    """
+    Takes every slot of llm_semaphore, so new requests have to wait.
+    """
+    for _ in range(MAX_CONCURRENT_LLM_CALLS):
+        llm_semaphore.acquire()
+    yield
+    for _ in range(MAX_CONCURRENT_LLM_CALLS):
+        llm_semaphore.release()
+
+
+def test_queued_request_leaves_queue_at_deadline(busy_llm_slots):
+    clock = task.Clock()
+    calls = []
+    results = outcomes(with_deadline(run_in_llm_slot(calls.append, "prompt"), 2.0, clock))
+    assert len(llm_semaphore.waiting) == 1
+
+    clock.advance(2.0)
+
+    assert results[0].check(TimeoutError)
+    assert llm_semaphore.waiting == []
+    assert calls == []
@@ -0,0 +1,42 @@
+"""
+Description:
+    Checks that find_speech_bounds trims the same silence as pydub's
+    detect_nonsilent, which trim_silence used before.
+"""
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+from src.speech_processing.vad import find_speech_bounds
+
+
+def make_recording(sample_rate: int, channels: int, seed: int = 0) -> np.ndarray:
+    """
+    Returns quiet noise with a tone in the middle, as interleaved int16
+    samples.
+    """
+    random = np.random.default_rng(seed)
+    frames = 3 * sample_rate
+    samples = random.normal(0, 30, (frames, channels))
+    t = np.arange(sample_rate) / sample_rate
+    samples[sample_rate:2 * sample_rate] += (5000 * np.sin(2 * np.pi * 220 * t))[:, None]
+    return np.clip(samples, -32768, 32767).astype(np.int16).reshape(-1)
+
+
+@pytest.mark.parametrize("sample_rate, channels", [(16000, 1), (44100, 1), (16000, 2)])
+def test_bounds_match_pydub(sample_rate, channels):
+    samples = make_recording(sample_rate, channels)
+    segment = AudioSegment(samples.tobytes(), frame_rate=sample_rate, sample_width=2, channels=channels)
+    ranges = detect_nonsilent(segment, min_silence_len=500, silence_thresh=-40)
+
+    bounds = find_speech_bounds(samples, sample_rate, channels, silence_thresh=-40, min_silence_len=500)
+
+    expected = tuple(ms * sample_rate // 1000 * channels for ms in (ranges[0][0], ranges[-1][1]))
+    assert bounds == expected
+
+
+def test_silence_has_no_bounds():
+    samples = np.zeros(16000 * 2, dtype=np.int16)
+    assert detect_nonsilent(AudioSegment(samples.tobytes(), frame_rate=16000, sample_width=2, channels=1)) == []
+    assert find_speech_bounds(samples, 16000) is None